@@ -104,12 +104,25 @@ shutil.copy("src/description.xml", "build/")
 shutil.copy("src/intrinio_impl.py", "build/")
 shutil.copy("src/intrinio_app_logger.py", "build/")
 shutil.copy("src/intrinio_lib.py", "build/")
+shutil.copy("src/intrinio_session.py", "build/")
+shutil.copy("src/intrinio_engine.py", "build/")
+shutil.copy("src/intrinio_cache_engine.py", "build/")
+shutil.copy("src/intrinio_disk_cache.py", "build/")
+shutil.copy("src/intrinio_columnar.py", "build/")
+shutil.copy("src/intrinio_series.py", "build/")
+shutil.copy("src/intrinio_statement.py", "build/")
+shutil.copy("src/intrinio_master.py", "build/")
+shutil.copy("src/intrinio_planner.py", "build/")
+shutil.copy("src/intrinio_warmup.py", "build/")
+shutil.copy("src/intrinio_volatile.py", "build/")
 shutil.copy("src/intrinio_cache.py", "build/")
 shutil.copy("src/intrinio_access.py", "build/")
 shutil.copy("src/intrinio_indices.py", "build/")
 shutil.copy("src/intrinio_companies.py", "build/")
 shutil.copy("src/intrinio_securities.py", "build/")
 shutil.copy("src/intrinio_company_sec_filings.py", "build/")
+shutil.copy("src/intrinio_client.py", "build/")
+shutil.copy("src/intrinio_login.py", "build/")
 shutil.copy("src/extn_helper.py", "build/")
 shutil.copy("certifi/cacert.pem", "build/")
 
@@ -129,6 +142,10 @@ xcu.add_function("IntrinioDataPoint", "Get Intrinio data point",
                      ('identifier', 'Identifier (e.g. ticker symbol).'),
                      ('item', 'item (e.g. tag or series id).')
                  ])
+xcu.add_function("IntrinioValidateIdentifiers", "Validate a range of identifiers (e.g. ticker symbols) at once",
+                 [
+                     ('identifiers', 'A cell range of identifiers.')
+                 ])
 xcu.add_function("IntrinioHistoricalPrices", "Get Intrinio historical price data",
                  [
                      ('ticker', 'Ticker symbol.'),
@@ -138,6 +155,15 @@ xcu.add_function("IntrinioHistoricalPrices", "Get Intrinio historical price data
                      ('enddate', 'Optional, last date of prices.'),
                      ('frequency', 'Periodicity of data points (e.g. daily, weekly, monthly, quarterly, yearly).')
                  ])
+xcu.add_function("IntrinioHistoricalPricesRange", "Get a block of Intrinio historical price data as an array",
+                 [
+                     ('ticker', 'Ticker symbol.'),
+                     ('items', 'Comma separated list or cell range of price items (e.g. date,open,close).'),
+                     ('startdate', 'Optional, first date of prices.'),
+                     ('enddate', 'Optional, last date of prices.'),
+                     ('frequency', 'Periodicity of data points (e.g. daily, weekly, monthly, quarterly, yearly).'),
+                     ('maxrows', 'Optional, maximum number of rows. Empty or 0 returns all rows.')
+                 ])
 xcu.add_function("IntrinioHistoricalData", "Get the historical data for a selected identifier",
                  [
                      ('identifier', 'Ticker symbol.'),
@@ -180,6 +206,15 @@ xcu.add_function("IntrinioFinancials", "Returns professional-grade historical fi
                      ('tag', 'The specified standardized tag'),
                      ('rounding', 'Round the returned value (e.g. A, K, M, B)')
                  ])
+xcu.add_function("IntrinioFinancialsStatement", "Returns an entire standardized financial statement as an array.",
+                 [
+                     ('ticker', 'The stock market ticker symbol.'),
+                     ('statement',
+                      'The financial statement requested (e.g.incomestatement, balancesheet, cashflowstatement, calculations)'),
+                     ('fiscalyear', 'the fiscal year associated with the fundamental OR the sequence of the requested fundamental'),
+                     ('fiscalperiod', 'the fiscal period associated with the fundamental, or the fiscal period type'),
+                     ('rounding', 'Round the returned values (e.g. A, K, M, B)')
+                 ])
 xcu.add_function("IntrinioReportedFundamentals", "Returns a list of available as reported fundamentals",
                  [
                      ('ticker', 'Ticker symbol.'),
@@ -205,6 +240,15 @@ xcu.add_function("IntrinioReportedFinancials", "Returns the As Reported Financia
                      ('xbrltag', 'The specified XBRL tag'),
                      ('domaintag', 'The specified domain XBRL tag')
                  ])
+xcu.add_function("IntrinioReportedFinancialsStatement", "Returns an entire as reported financial statement as an array.",
+                 [
+                     ('ticker', 'The stock market ticker symbol.'),
+                     ('statement',
+                      'The financial statement requested (e.g.incomestatement, balancesheet, cashflowstatement)'),
+                     ('fiscalyear', 'the fiscal year associated with the fundamental OR the sequence of the requested fundamental'),
+                     ('fiscalperiod', 'the fiscal period associated with the fundamental, or the fiscal period type'),
+                     ('rounding', 'Round the returned values (e.g. A, K, M, B)')
+                 ])
 xcu.add_function("IntrinioBankFundamentals", "Returns a list of available standardized fundamentals",
                  [
                      ('identifier', 'Ticker symbol.'),
@@ -15,21 +15,32 @@
 # along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import sys
+import math
+import threading
 from intrinio_app_logger import AppLogger
+from intrinio_columnar import date_to_ordinal, ordinal_to_date
+from intrinio_engine import IntrinioEngine
+from intrinio_master import SecuritiesMaster, CompaniesMaster
+from intrinio_statement import FinancialStatement, ReportedFinancialStatement
+from intrinio_series import TimeSeries, get_series_value, get_series_rows, get_resampled_value, \
+    get_resampled_rows, today_ordinal
 from extn_helper import normalize_date
 from intrinio_cache import IdentifierCache, DataPointCache, UsageDataCache, HistoricalPricesCache, \
-    HistoricalDataCache, IntrinioNewsCache, FundamentalsCache, IntrinioTagsCache, FinancialsDataCache, \
-    FinancialsQueryCache, ReportedFundamentalsCache, ReportedTagsCache, ReportedFinancialsCache, \
-    ReportedFinancialsQueryCache
-from intrinio_lib import IntrinioCompanies, IntrinioSecurities, IntrinioBanks, \
+    HistoricalDataCache, IntrinioNewsCache, FundamentalsCache, IntrinioTagsCache, FinancialsCache, \
+    ReportedFundamentalsCache, ReportedTagsCache, ReportedFinancialsCache
+from intrinio_lib import IntrinioIdentifiers, \
     IntrinioDataPoint, IntrinioFinancials, IntrinioFundamentals, IntrinioHistoricalData, \
     IntrinioHistoricalPrices, IntrinioNews, IntrinioReportedFinancials, IntrinioReportedFundamentals, \
-    IntrinioReportedTags, IntrinioTags, IntrinioBase
+    IntrinioReportedTags, IntrinioTags, IntrinioBase, QConfiguration, DataPointBatcher
 
 # Logger init
 the_app_logger = AppLogger("intrinio-extension")
 logger = the_app_logger.getAppLogger()
 
+# Serializes creating historical series
+series_lock = threading.Lock()
+
 
 def is_valid_identifier(identifier):
     """
@@ -42,24 +53,47 @@ def is_valid_identifier(identifier):
     if not identifier:
         return False
 
-    id = identifier.upper()
+    return validate_identifiers([identifier])[0]
+
 
-    if not IdentifierCache.is_known_identifier(id):
+def validate_identifiers(identifiers):
+    """
+    Validate a set of identifiers (e.g. a column of ticker symbols) at once.
+    Identifiers that are not already known are verified concurrently.
+    :param identifiers: List of identifiers. Empty entries are invalid.
+    :return: List of booleans in the same order
+    """
+    ids = [str(identifier).upper() if identifier else "" for identifier in identifiers]
+    verdicts = {"": False}
+    unknown = []
+    for id in ids:
+        if id in verdicts:
+            continue
         # This set of tests was adapted from the Excel addin
         if id.startswith("FRED.") or id == "DMD.ERP" or ":" in id or id.startswith("$"):
-            IdentifierCache.add_identifier(id, True)
+            verdicts[id] = True
+            continue
+        if SecuritiesMaster.is_known(id) or CompaniesMaster.is_known(id):
+            verdicts[id] = True
+            continue
+        found, valid = IdentifierCache.lookup_identifier(id)
+        if found:
+            verdicts[id] = valid
         else:
-            if IntrinioCompanies.verify_company(id):
-                IdentifierCache.add_identifier(id, True)
-            elif IntrinioSecurities.verify_security(id):
-                IdentifierCache.add_identifier(id, True)
-            elif IntrinioBanks.verify_bank(id):
-                IdentifierCache.add_identifier(id, True)
-            else:
-                # This identifier failed all of the tests
-                IdentifierCache.add_identifier(id, False)
+            verdicts[id] = False
+            unknown.append(id)
+
+    if unknown:
+        logger.debug("Verifying %d identifiers", len(unknown))
+        for id, valid in zip(unknown, IntrinioIdentifiers.verify_identifiers(unknown)):
+            if valid is None:
+                # A verify call failed, so the verdict is unknown and it is not cached
+                logger.debug("Unable to verify identifier %s", id)
+                continue
+            IdentifierCache.add_identifier(id, valid)
+            verdicts[id] = valid
 
-    return IdentifierCache.is_valid_identifier(id)
+    return [verdicts[id] for id in ids]
 
 
 def get_usage(access_code, key):
@@ -98,6 +132,36 @@ def get_data_point(identifier, item):
         logger.debug("Cache hit for data point %s %s", identifier, item)
         return DataPointCache.get_value(identifier, item)
     res = IntrinioDataPoint.get_data_point(identifier, item)
+    return _data_point_value(identifier, item, res)
+
+
+def get_data_points(data_points):
+    """
+    Return a set of data points at once. Data points that are not cached are
+    requested together, so they are sent as a few multi-identifier/multi-item calls.
+    :param data_points: List of (identifier, item) pairs
+    :return: List of data point values or messages in the same order
+    """
+    values = {}
+    futures = {}
+    for identifier, item in data_points:
+        key = (identifier, item)
+        if key in values or key in futures:
+            continue
+        if DataPointCache.is_value_cached(identifier, item):
+            values[key] = DataPointCache.get_value(identifier, item)
+        else:
+            futures[key] = DataPointBatcher.submit(identifier.upper(), item)
+    for (identifier, item), future in futures.items():
+        values[(identifier, item)] = _data_point_value(identifier, item, future.result())
+    return [values[(identifier, item)] for identifier, item in data_points]
+
+
+def _data_point_value(identifier, item, res):
+    """
+    Cache and convert the result of a data point request
+    :return: The data point value or a message
+    """
     if "value" in res:
         v = res["value"]
         DataPointCache.add_value(identifier, item, v)
@@ -124,9 +188,6 @@ def get_historical_prices(identifier, item, sequence, start_date=None, end_date=
     """
     # TODO Consider validating the item
 
-    page_number = IntrinioBase.get_page_number(sequence)
-    page_index = IntrinioBase.get_page_index(sequence)
-
     # If dates are present, convert to ISO format
     try:
         n_start_date = normalize_date(start_date)
@@ -135,40 +196,244 @@ def get_historical_prices(identifier, item, sequence, start_date=None, end_date=
         logger.warning(str(ex))
         return str(ex)
 
-    if HistoricalPricesCache.is_query_value_cached(identifier, n_start_date, n_end_date, frequency, page_number):
-        logger.debug("Cache hit for historical price %s %s", identifier, item)
-        query_value = HistoricalPricesCache.get_query_value(identifier, n_start_date, n_end_date, frequency, page_number)
-        # Verify that item exists
-        if len(query_value["data"]) > page_index:
-            if item in query_value["data"][page_index]:
-                v =  query_value["data"][page_index][item]
-                if str(v).isnumeric():
-                    return float(v)
-            else:
-                v = "Invalid item"
-        else:
-            v = ""
-        return v
+    frequency = frequency.lower() if frequency else "daily"
 
-    res = IntrinioHistoricalPrices.get_price_page(identifier, sequence, n_start_date, n_end_date, frequency)
+    if frequency != "daily":
+        v = _get_resampled_price(identifier, item, sequence, n_start_date, n_end_date, frequency)
+        if v is not None:
+            return v
 
-    if "data" in res:
-        HistoricalPricesCache.add_query_value(res, identifier, n_start_date, n_end_date, frequency, page_number)
-        # After a successful API call, the usage stats are stale
-        UsageDataCache.clear()
-        # Verify that item exists
-        if len(res["data"]) > page_index:
-            if item in res["data"][page_index]:
-                v = res["data"][page_index][item]
-                if str(v).isnumeric():
-                    v = float(v)
-            else:
-                v = "Invalid item"
-        else:
-            v = ""
+    def page_request(range_start, range_end, page_number):
+        return IntrinioHistoricalPrices.price_range_request(identifier, range_start, range_end, frequency, page_number)
+
+    return _get_series_value(HistoricalPricesCache, (identifier.upper(), frequency), n_start_date, n_end_date,
+                             sequence, item, page_request)
+
+
+def _series_tail_life():
+    """
+    The newest rows of a series are checked again after cachelife seconds
+    :return: Seconds or None for never
+    """
+    if QConfiguration.cache_life < 0:
+        return None
+    return QConfiguration.cache_life
+
+
+def _get_resampled_price(identifier, item, sequence, start_date, end_date, frequency):
+    """
+    Derive a weekly, monthly, quarterly or yearly price from cached daily prices
+    when the daily coverage allows it
+    :return: The value, or None if the request must go to Intrinio
+    """
+    start, end = _date_range(start_date, end_date)
+    daily = _get_daily_prices(identifier, start, end)
+    if daily is None:
+        return None
+
+    answered, v = _resample(identifier, daily, lambda: get_resampled_value(daily, frequency, start, end, sequence,
+                                                                         item, tail_life=_series_tail_life()))
+    if answered:
+        logger.debug("Resampled %s %s price from daily prices", identifier, frequency)
         return v
+    return None
 
-    return IntrinioBase.status_code_message(res["status_code"])
+
+def _resample(identifier, daily, get_resampled):
+    """
+    Call a resampling function on the cached daily prices. Bars it memoizes in the
+    series are added to the cache size.
+    :return: The result of get_resampled()
+    """
+    with daily.lock:
+        memo = set(daily.resampled)
+    result = get_resampled()
+    with daily.lock:
+        grown = set(daily.resampled) != memo
+    if grown:
+        HistoricalPricesCache.resize_query_value(identifier.upper(), "daily")
+    return result
+
+
+def _get_daily_prices(identifier, start, end):
+    """
+    Get the cached daily price series for an identifier with its newest rows up to date
+    :return: TimeSeries or None if there are no cached daily prices
+    """
+    key = (identifier.upper(), "daily")
+    found, daily = HistoricalPricesCache.lookup_query_value(*key)
+    if not found:
+        return None
+    if start is not None and start > end:
+        return None
+
+    if daily.tail_start is not None and end >= daily.tail_start:
+        # Bring the newest daily rows up to date with a delta request
+        def page_request(range_start, range_end, page_number):
+            return IntrinioHistoricalPrices.price_range_request(identifier, range_start, range_end, "daily",
+                                                                page_number)
+        daily, res = _fill_series(HistoricalPricesCache, key, None, end, 0, page_request)
+        if res is not None:
+            return None
+    return daily
+
+
+def get_historical_prices_range(identifier, items, start_date=None, end_date=None, frequency=None, max_rows=None):
+    """
+    Returns a block of historical prices, one row per date with the newest date first.
+    Row n holds what IntrinioHistoricalPrices returns for sequence number n.
+    :param identifier: An Intrinio acceptable identifier (e.g a ticker symbol)
+    :param items: List of price items (see get_historical_prices())
+    :param start_date: First date for historical data.
+    :param end_date: Last date for historical data.
+    :param frequency: daily | weekly | monthly | quarterly | yearly
+    :param max_rows: Maximum number of rows. None or 0 returns every row in the date range.
+    :return: List of rows (each a list with one value per item) or a message
+    """
+    try:
+        n_start_date = normalize_date(start_date)
+        n_end_date = normalize_date(end_date)
+    except Exception as ex:
+        logger.warning(str(ex))
+        return str(ex)
+
+    frequency = frequency.lower() if frequency else "daily"
+    count = max_rows if max_rows else None
+    start, end = _date_range(n_start_date, n_end_date)
+
+    if frequency != "daily":
+        daily = _get_daily_prices(identifier, start, end)
+        if daily is not None:
+            answered, rows = _resample(identifier, daily,
+                                       lambda: get_resampled_rows(daily, frequency, start, end, count, items,
+                                                                  tail_life=_series_tail_life()))
+            if answered:
+                logger.debug("Resampled %s %s prices from daily prices", identifier, frequency)
+                return rows
+
+    def page_request(range_start, range_end, page_number):
+        return IntrinioHistoricalPrices.price_range_request(identifier, range_start, range_end, frequency, page_number)
+
+    # Without a row limit, every row in the date range is needed
+    sequence = count - 1 if count is not None else sys.maxsize
+    series, res = _fill_series(HistoricalPricesCache, (identifier.upper(), frequency), start, end, sequence,
+                               page_request)
+    if res is not None:
+        return IntrinioBase.status_code_message(res["status_code"])
+
+    with series.lock:
+        return get_series_rows(series, start, end, count, items)
+
+
+def refresh_historical_prices(identifiers=None, frequency="daily"):
+    """
+    Bring cached price series up to date. Each series gets one small request for the
+    days after its newest cached row and the requests run concurrently.
+    :param identifiers: List of tickers. None refreshes every series in memory.
+    :param frequency: daily | weekly | monthly | quarterly | yearly
+    :return: The number of series that were refreshed
+    """
+    if identifiers is None:
+        keys = [key for key in HistoricalPricesCache.namespace.keys() if key[1] == frequency]
+    else:
+        keys = [(identifier.upper(), frequency) for identifier in identifiers]
+
+    gaps = []
+    for key in keys:
+        found, series = HistoricalPricesCache.lookup_query_value(*key)
+        if not found:
+            continue
+        with series.lock:
+            # Everything after the newest settled row is fetched again
+            series.expire_tail(0)
+            gap = series.delta_gap()
+        if gap is not None:
+            gaps.append((key, series, gap))
+    if not gaps:
+        return 0
+
+    requests = [IntrinioHistoricalPrices.price_range_request(key[0], ordinal_to_date(gap[0]), ordinal_to_date(gap[1]),
+                                                             frequency, 1)
+                for key, series, gap in gaps]
+    results = IntrinioEngine.run_all(requests)
+
+    refreshed = 0
+    for (key, series, gap), res in zip(gaps, results):
+        with series.lock:
+            if series.apply_gap(gap[0], gap[1], [res]) is not None:
+                logger.error("Refresh of %s failed: %s", key, IntrinioBase.status_code_message(res["status_code"]))
+                continue
+            interval = series.covered_interval(gap[1])
+            if interval is None or interval[0] > gap[0]:
+                # There was more than one page of new rows
+                def page_request(range_start, range_end, page_number, identifier=key[0]):
+                    return IntrinioHistoricalPrices.price_range_request(identifier, range_start, range_end,
+                                                                        frequency, page_number)
+                series.fill(gap[0], gap[1], 0, page_request)
+            HistoricalPricesCache.add_query_value(series, *key)
+            refreshed += 1
+    UsageDataCache.clear()
+    logger.debug("Refreshed %d price series", refreshed)
+    return refreshed
+
+
+def _get_series_value(cache, key, start_date, end_date, sequence, item, page_request):
+    """
+    Answer a historical request from the date anchored series for the key,
+    fetching only the date ranges that the series does not cover yet.
+    :param cache: HistoricalPricesCache or HistoricalDataCache
+    :param key: The series key tuple
+    :param start_date: ISO date or None
+    :param end_date: ISO date or None (today)
+    :param sequence: 0-n counting back from the newest row in the date range
+    :param item: Field name
+    :param page_request: Function (start_date, end_date, page_number) -> IntrinioRequest
+    :return: The value or a message
+    """
+    start, end = _date_range(start_date, end_date)
+    series, res = _fill_series(cache, key, start, end, sequence, page_request)
+    if res is not None:
+        return IntrinioBase.status_code_message(res["status_code"])
+
+    # Another thread may be merging rows into the series
+    with series.lock:
+        return get_series_value(series, start, end, sequence, item)
+
+
+def _date_range(start_date, end_date):
+    """
+    :param start_date: ISO date or None
+    :param end_date: ISO date or None (today)
+    :return: (start, end) day ordinals. start is None for the first available row.
+    """
+    end = today_ordinal()
+    if end_date:
+        end = min(end, date_to_ordinal(end_date))
+    start = date_to_ordinal(start_date) if start_date else None
+    return start, end
+
+
+def _fill_series(cache, key, start, end, sequence, page_request):
+    """
+    Get the series for the key and fetch whatever it needs to answer the request
+    :return: A tuple (series, failed API result dict or None)
+    """
+    with series_lock:
+        found, series = cache.lookup_query_value(*key)
+        if not found:
+            series = TimeSeries()
+            cache.add_query_value(series, *key)
+
+    with series.lock:
+        coverage = [list(interval) for interval in series.coverage]
+        res = series.fill(start, end, sequence, page_request, tail_life=_series_tail_life())
+        if series.coverage != coverage:
+            logger.debug("Series %s now covers %s", key, series.coverage)
+            # Account for the new rows and write the series behind to the disk cache
+            cache.add_query_value(series, *key)
+            # After a successful API call, the usage stats are stale
+            UsageDataCache.clear()
+    return series, res
 
 
 def get_historical_data(identifier, item, sequence, start_date=None, end_date=None, frequency=None,
@@ -186,9 +451,6 @@ def get_historical_data(identifier, item, sequence, start_date=None, end_date=No
     :param show_date:
     :return: The data point value or a message
     """
-    page_number = IntrinioBase.get_page_number(sequence)
-    page_index = IntrinioBase.get_page_index(sequence)
-
     # If dates are present, convert to ISO format
     try:
         n_start_date = normalize_date(start_date)
@@ -197,39 +459,14 @@ def get_historical_data(identifier, item, sequence, start_date=None, end_date=No
         logger.warning(str(ex))
         return str(ex)
 
-    if HistoricalDataCache.is_query_value_cached(identifier, item, n_start_date, n_end_date, frequency, period_type, page_number):
-        logger.debug("Cache hit for historical price %s %s", identifier, item)
-        query_value = HistoricalDataCache.get_query_value(identifier, item, n_start_date, n_end_date, frequency, period_type, page_number)
-        if len(query_value["data"]) > page_index:
-            if show_date:
-                v = query_value["data"][page_index]["date"]
-            else:
-                v =  query_value["data"][page_index]["value"]
-                if str(v).isnumeric():
-                    v = float(v)
-        else:
-            v = ""
-        return v
+    frequency = frequency.lower() if frequency else "daily"
 
-    res = IntrinioHistoricalData.get_historical_data_page(identifier, item, sequence, n_start_date, n_end_date,
-                                                          frequency, period_type)
+    def page_request(range_start, range_end, page_number):
+        return IntrinioHistoricalData.historical_data_range_request(identifier, item, range_start, range_end,
+                                                                     frequency, period_type, page_number)
 
-    if "data" in res:
-        HistoricalDataCache.add_query_value(res, identifier, item, n_start_date, n_end_date, frequency, period_type, page_number)
-        # After a successful API call, the usage stats are stale
-        UsageDataCache.clear()
-        if len(res["data"]) > page_index:
-            if show_date:
-                v = res["data"][page_index]["date"]
-            else:
-                v = res["data"][page_index]["value"]
-                if str(v).isnumeric():
-                    v = float(v)
-        else:
-            v = ""
-        return v
-
-    return IntrinioBase.status_code_message(res["status_code"])
+    return _get_series_value(HistoricalDataCache, (identifier.upper(), item, frequency, period_type or ""),
+                             n_start_date, n_end_date, sequence, "date" if show_date else "value", page_request)
 
 
 def get_news(identifier, item, sequence):
@@ -362,6 +599,31 @@ def get_tags(identifier, statement, sequence, item):
     return IntrinioBase.status_code_message(res["status_code"])
 
 
+def _translate_fiscal_period(cache, get_fundamentals, identifier, statement, fiscal_year, fiscal_period):
+    """
+    When fiscal_year is less than 1900, it is a sequence number and fiscal_period is a
+    period type. These are translated to the actual fiscal year and period using the
+    fiscal period index of the fundamentals cache.
+    :param cache: FundamentalsCache or ReportedFundamentalsCache
+    :param get_fundamentals: get_fundamentals_data or get_reported_fundamentals_data
+    :return: A tuple (fiscal_year, fiscal_period) or a message
+    """
+    if int(fiscal_year) >= 1900:
+        return fiscal_year, fiscal_period
+
+    period_type = fiscal_period
+    sequence = int(fiscal_year)
+    period = cache.fiscal_period(identifier, statement, period_type, sequence)
+    if period is None:
+        # Retrieving the fundamentals page indexes it
+        v = get_fundamentals(identifier, statement, period_type, sequence, "fiscal_year")
+        period = cache.fiscal_period(identifier, statement, period_type, sequence)
+        if period is None:
+            return v if isinstance(v, str) else ""
+    logger.debug("Translated fy/fp from %d/%s to %s/%s", sequence, period_type, period[0], period[1])
+    return period[0], period[1]
+
+
 def get_financials_data(identifier, statement, fiscal_year, fiscal_period, tag):
     """
     Returns professional-grade historical financial data for a specific data tag.
@@ -374,74 +636,147 @@ def get_financials_data(identifier, statement, fiscal_year, fiscal_period, tag):
     """
     logger.debug("get_financials_data: %s %s %d %s %s", identifier, statement, fiscal_year, fiscal_period, tag)
     # Translate fiscal year and period if required
-    if int(fiscal_year) < 1900:
-        # fiscal year is a sequence number and fiscal period is a type
-        lookup_fp = fiscal_period
-        lookup_fy = int(fiscal_year)
-        fiscal_year = get_fundamentals_data(identifier, statement, lookup_fp, lookup_fy, "fiscal_year")
-        fiscal_period = get_fundamentals_data(identifier, statement, lookup_fp, lookup_fy, "fiscal_period")
-        logger.debug("Translated fy/fp from %d/%s to %d/%s", lookup_fy, lookup_fp, fiscal_year, fiscal_period)
-
-    # Check cache for the specific tag
-    if FinancialsDataCache.is_query_value_cached(identifier, statement, fiscal_year, fiscal_period, tag):
-        logger.debug("Cache hit for financials data: %s %s %d %s %s",
-                     identifier, statement, fiscal_year, fiscal_period, tag)
-        v = FinancialsDataCache.get_query_value(identifier, statement, fiscal_year, fiscal_period, tag)
-        return v
+    translated = _translate_fiscal_period(FundamentalsCache, get_fundamentals_data, identifier, statement,
+                                          fiscal_year, fiscal_period)
+    if isinstance(translated, str):
+        return translated
+    fiscal_year, fiscal_period = translated
 
-    # Before calling Intrinio API, check to see if we have already fetched the data for this query
-    # If we have run the query, then the requested tag is not defined.
-    if FinancialsQueryCache.is_query_value_cached(identifier, statement, fiscal_year, fiscal_period):
-        logger.debug("Tag not defined for financials data %s %s %d %s %s",
-                     identifier, statement, fiscal_year, fiscal_period, tag)
-        v = "na"
-        return v
+    financials = _get_financials(identifier, statement, fiscal_year, fiscal_period)
+    if isinstance(financials, str):
+        return financials
+    return financials.value(tag)
 
 
+def _get_financials(identifier, statement, fiscal_year, fiscal_period):
+    """
+    Get an entire standardized statement from the financials cache, loading it as required
+    :return: FinancialStatement or an error message
+    """
+    found, financials = FinancialsCache.lookup_query_value(identifier, statement, fiscal_year, fiscal_period)
+    if found:
+        logger.debug("Cache hit for financials data: %s %s %d %s", identifier, statement, fiscal_year, fiscal_period)
+        return financials
+
     # We have to read ALL of the pages for the given parameters to get all of the tags available.
-    # Essentially, we are building a big cache of all available data.
-    total_pages = 1
-    current_page = 1
-    tag_found = False
-    while current_page <= total_pages:
-        res = IntrinioFinancials.get_financials_page(identifier, statement, fiscal_year, fiscal_period, current_page)
-        # print (res)
-        if "total_pages" in res:
-            total_pages = int(res["total_pages"])
-            logger.debug("Total financials pages: %d", total_pages)
-        else:
+    # Essentially, we are building a big cache of all available data. Page 1 tells us how
+    # many pages there are and the remaining pages are retrieved concurrently.
+    pages = IntrinioFinancials.get_all_financials_pages(identifier, statement, fiscal_year, fiscal_period)
+    for res in pages:
+        if "total_pages" not in res:
             # This is an error
             return IntrinioBase.status_code_message(res["status_code"])
-        # Cache each tag/value pair in this page
         if "data" not in res:
             logger.debug("Financials page contains no data")
-        for tv in res["data"]:
-            logger.debug("Adding to financials data cache: %s %s %s %d %s %s", tv["value"],
-                   identifier, statement, fiscal_year, fiscal_period, tv["tag"])
-            # Note that this overwrites an existing cache entry
-            FinancialsDataCache.add_query_value(tv["value"], identifier, statement, fiscal_year, fiscal_period, tv["tag"])
-            # After a successful API call, the usage stats are stale
-            UsageDataCache.clear()
-            # Note when we find the desired tag and its value
-            if tv["tag"] == tag:
-                tag_found = True
-                v = tv["value"]
-                logger.debug("Financial tag found: %s=%s", tv["tag"], tv["value"])
 
-        # Mark this query as cached
-        FinancialsQueryCache.add_query_value(True, identifier, statement, fiscal_year, fiscal_period)
-        logger.debug("Added financials query to cache: %d %s %s %d %s", True, identifier, statement, fiscal_year, fiscal_period)
+    financials = FinancialStatement.from_pages(pages)
+    FinancialsCache.add_query_value(financials, identifier, statement, fiscal_year, fiscal_period)
+    logger.debug("Added financials statement to cache: %s %s %d %s (%d tags)",
+                 identifier, statement, fiscal_year, fiscal_period, len(financials))
+    # After a successful API call, the usage stats are stale
+    UsageDataCache.clear()
+    return financials
 
-        # On to the next page
-        current_page += 1
 
-    if tag_found:
-        return v
+def get_financials_statement(identifier, statement, fiscal_year, fiscal_period):
+    """
+    Returns an entire standardized statement in the order of its standardized tag hierarchy.
+    :param identifier: Stock ticker symbol.
+    :param statement:
+    :param fiscal_year: Fiscal year or a sequence number (see get_financials_data())
+    :param fiscal_period: Fiscal period or a period type (see get_financials_data())
+    :return: List of [tag, name, value] rows or a message
+    """
+    logger.debug("get_financials_statement: %s %s %d %s", identifier, statement, fiscal_year, fiscal_period)
+    # Translate fiscal year and period if required
+    translated = _translate_fiscal_period(FundamentalsCache, get_fundamentals_data, identifier, statement,
+                                          fiscal_year, fiscal_period)
+    if isinstance(translated, str):
+        return translated
+    fiscal_year, fiscal_period = translated
+
+    tags = _get_all_tags(IntrinioTagsCache, lambda: IntrinioTags.get_all_tags_pages(identifier, statement),
+                         identifier, statement)
+    if isinstance(tags, str):
+        return tags
+
+    financials = _get_financials(identifier, statement, fiscal_year, fiscal_period)
+    if isinstance(financials, str):
+        return financials
+
+    return [[tag["tag"], tag.get("name", ""), financials.value(tag["tag"])] for tag in tags]
+
+
+def _get_all_tags(cache, get_all_tags_pages, *args):
+    """
+    Returns every tag of a statement in hierarchy order (see _hierarchy_order()). The
+    pages come from the tags cache when all of them are there.
+    :param cache: IntrinioTagsCache or ReportedTagsCache
+    :param get_all_tags_pages: Function that retrieves all of the pages
+    :param args: The tags cache key without the page number
+    :return: List of tag dicts or a message
+    """
+    pages = []
+    found, page = cache.lookup_query_value(*args, 1)
+    if found:
+        total_pages = int(page.get("total_pages", 1))
+        pages.append(page)
+        for page_number in range(2, total_pages + 1):
+            found, page = cache.lookup_query_value(*args, page_number)
+            if not found:
+                break
+            pages.append(page)
+
+    if not found:
+        pages = get_all_tags_pages()
+        for page_number, res in enumerate(pages, 1):
+            if "data" not in res:
+                return IntrinioBase.status_code_message(res["status_code"])
+            cache.add_query_value(res, *args, page_number)
+        # After a successful API call, the usage stats are stale
+        UsageDataCache.clear()
+
+    return _hierarchy_order([tag for page in pages for tag in page["data"]])
 
-    # Prevent another API call for this tag
-    FinancialsDataCache.add_query_value("na", identifier, statement, fiscal_year, fiscal_period, tag)
-    logger.debug("Adding financials data cache: %s %s %d %s %s %s", "na", identifier, statement, fiscal_year, fiscal_period, tag)
-    return "na"
+
+def _hierarchy_order(tags):
+    """
+    Order tags depth first by their parent field, each tag followed by its children.
+    Siblings are ordered by their sequence field when there is one, otherwise they
+    keep the order Intrinio lists them in. A tag whose parent is not in the
+    statement is a top level tag.
+    :param tags: List of tag dicts
+    :return: List of tag dicts
+    """
+    known = {tag.get("tag") for tag in tags}
+    children = {}
+    for tag in tags:
+        parent = tag.get("parent")
+        children.setdefault(parent if parent in known and parent != tag.get("tag") else None, []).append(tag)
+    for siblings in children.values():
+        siblings.sort(key=_tag_sequence)
+
+    ordered = []
+    visited = set()
+    stack = list(reversed(children.get(None, [])))
+    while stack:
+        tag = stack.pop()
+        if id(tag) in visited:
+            continue
+        visited.add(id(tag))
+        ordered.append(tag)
+        stack.extend(reversed(children.get(tag.get("tag"), [])))
+    # Tags in a parent cycle are never reached from the top level
+    ordered.extend(tag for tag in tags if id(tag) not in visited)
+    return ordered
+
+
+def _tag_sequence(tag):
+    try:
+        return float(tag.get("sequence"))
+    except (TypeError, ValueError):
+        # Python's sort is stable, so unsequenced tags keep their order
+        return math.inf
 
 
 def get_reported_fundamentals_data(identifier, statement, period_type, sequence, item):
@@ -506,12 +841,11 @@ def get_reported_tags(identifier, statement, fiscal_year, fiscal_period, sequenc
     page_index = IntrinioBase.get_page_index(sequence)
 
     # Translate fiscal year and period if required
-    if int(fiscal_year) < 1900:
-        # fiscal year is a sequence number and fiscal period is a type
-        lookup_fp = fiscal_period
-        lookup_fy = int(fiscal_year)
-        fiscal_year = get_reported_fundamentals_data(identifier, statement, lookup_fp, lookup_fy, "fiscal_year")
-        fiscal_period = get_reported_fundamentals_data(identifier, statement, lookup_fp, lookup_fy, "fiscal_period")
+    translated = _translate_fiscal_period(ReportedFundamentalsCache, get_reported_fundamentals_data,
+                                          identifier, statement, fiscal_year, fiscal_period)
+    if isinstance(translated, str):
+        return translated
+    fiscal_year, fiscal_period = translated
 
     if ReportedTagsCache.is_query_value_cached(identifier, statement, fiscal_year, fiscal_period, page_number):
         logger.debug("Cache hit for reported tags %s %s %d %s %s %d", identifier, statement, fiscal_year, fiscal_period, item, sequence)
@@ -559,200 +893,88 @@ def get_reported_financials_data(identifier, statement, fiscal_year, fiscal_peri
     logger.debug("get_reported_financials_data: %s %s %d %s %s %s",
                  identifier, statement, fiscal_year, fiscal_period, tag, domain_tag)
     # Translate fiscal year and period if required
-    if int(fiscal_year) < 1900:
-        # fiscal year is a sequence number and fiscal period is a type
-        lookup_fp = fiscal_period
-        lookup_fy = int(fiscal_year)
-        fiscal_year = get_reported_fundamentals_data(identifier, statement, lookup_fp, lookup_fy, "fiscal_year")
-        fiscal_period = get_reported_fundamentals_data(identifier, statement, lookup_fp, lookup_fy, "fiscal_period")
+    translated = _translate_fiscal_period(ReportedFundamentalsCache, get_reported_fundamentals_data,
+                                          identifier, statement, fiscal_year, fiscal_period)
+    if isinstance(translated, str):
+        return translated
+    fiscal_year, fiscal_period = translated
 
     # Adapted from Intrinio Excel AddIn. Apparently abstract tags have no value.
     if tag.lower().endswith("abstract") or not tag:
         return ""
 
-    # Check cache for the specific tag
-    if ReportedFinancialsCache.is_query_value_cached(identifier, statement, fiscal_year, fiscal_period, tag, domain_tag):
-        logger.debug("Cache hit for reported financials data: %s %s %d %s %s %s",
-                     identifier, statement, fiscal_year, fiscal_period, tag, domain_tag)
-        v = ReportedFinancialsCache.get_query_value(identifier, statement, fiscal_year, fiscal_period, tag, domain_tag)
-        return v
+    financials = _get_reported_financials(identifier, statement, fiscal_year, fiscal_period)
+    if isinstance(financials, str):
+        return financials
+    return financials.value(tag, domain_tag)
 
-    # Before calling Intrinio API, check to see if we have already fetched the data for this query
-    # If we have run the query, then the requested tag is not defined.
-    if ReportedFinancialsQueryCache.is_query_value_cached(identifier, statement, fiscal_year, fiscal_period):
-        logger.debug("Tag not defined for reported financials data %s %s %d %s %s",
-                     identifier, statement, fiscal_year, fiscal_period, tag)
-        v = "na"
-        return v
+
+def _get_reported_financials(identifier, statement, fiscal_year, fiscal_period):
+    """
+    Get an entire as reported statement from the reported financials cache, loading it as required
+    :return: ReportedFinancialStatement or an error message
+    """
+    found, financials = ReportedFinancialsCache.lookup_query_value(identifier, statement, fiscal_year,
+                                                                   fiscal_period)
+    if found:
+        logger.debug("Cache hit for reported financials data: %s %s %d %s",
+                     identifier, statement, fiscal_year, fiscal_period)
+        return financials
 
     # We have to read ALL of the pages for the given parameters to get all of the tags available.
-    # Essentially, we are building a big cache of all available data.
-    total_pages = 1
-    current_page = 1
-    tag_found = False
-    v = "na"
-    while current_page <= total_pages:
-        res = IntrinioReportedFinancials.get_financials_page(identifier, statement, fiscal_year, fiscal_period, current_page)
-        # print (res)
-        if "total_pages" in res:
-            total_pages = int(res["total_pages"])
-            logger.debug("Total pages: %d", total_pages)
-        else:
+    # Essentially, we are building a big cache of all available data. Page 1 tells us how
+    # many pages there are and the remaining pages are retrieved concurrently.
+    pages = IntrinioReportedFinancials.get_all_financials_pages(identifier, statement, fiscal_year, fiscal_period)
+    for res in pages:
+        if "total_pages" not in res:
             # This is an error
             return IntrinioBase.status_code_message(res["status_code"])
-        # Cache each tag/value pair in this page
-        for tv in res["data"]:
-            # Note that this overwrites an existing cache entry
-            # If domain_tag key exists, make it part of the cache key
-            ReportedFinancialsCache.add_query_value(tv["value"], identifier, statement, fiscal_year, fiscal_period,
-                                                    tv["xbrl_tag"], tv["domain_tag"])
-            logger.debug("Adding reported financials cache: %s %s %s %d %s %s %s", tv["value"],
-                   identifier, statement, fiscal_year, fiscal_period, tv["xbrl_tag"], tv["domain_tag"])
-            # After a successful API call, the usage stats are stale
-            UsageDataCache.clear()
-            # Note when we find the desired tag and its value
-            if tv["xbrl_tag"] == tag:
-                tag_found = True
-                v = tv["value"]
-
-        # Mark this query as cached
-        ReportedFinancialsQueryCache.add_query_value(True, identifier, statement, fiscal_year, fiscal_period)
-
-        # On to the next page
-        current_page += 1
-
-    # Prevent another API call for this tag
-    if not tag_found:
-        ReportedFinancialsCache.add_query_value("na", identifier, statement, fiscal_year, fiscal_period, tag)
-
-    return v
-
 
-#
-# Intrinio login dialog
-# Adapted from https://forum.openoffice.org/en/forum/viewtopic.php?f=45&t=56397#p248794
-#
+    financials = ReportedFinancialStatement.from_pages(pages)
+    ReportedFinancialsCache.add_query_value(financials, identifier, statement, fiscal_year, fiscal_period)
+    logger.debug("Added reported financials statement to cache: %s %s %d %s (%d tags)",
+                 identifier, statement, fiscal_year, fiscal_period, len(financials))
+    # After a successful API call, the usage stats are stale
+    UsageDataCache.clear()
+    return financials
 
 
-try:
-    import uno
-    logger.debug("Attempt to import uno succeeded")
-    # logger.debug("sys.path = %s", sys.path)
-except Exception as ex:
-    logger.error("Attempt to import uno failed %s", str(ex))
-try:
-    # https://www.openoffice.org/api/docs/common/ref/com/sun/star/awt/PosSize.html
-    from com.sun.star.awt.PosSize import POSSIZE # flags the x- and y-coordinate, width and height
-    logger.debug("Attempt to import com.sun.star.awt.PosSize succeeded")
-except Exception as ex:
-    logger.error("Attempt to import com.sun.star.awt.PosSize failed %s", str(ex))
-
-
-def _add_awt_model(dlg_model, srv, ctl_name, prop_list):
-    """
-    Helper function for building dialog
-    Insert UnoControl<srv>Model into given DialogControlModel
-    :param dlg_model: dialog model where control is to be added
-    :param srv: control model type to be added
-    :param ctl_name: name to be assigned to the control model
-    :param prop_list: properties to be assigned to new control model
-    :return: None
-    """
-    ctl_model = dlg_model.createInstance("com.sun.star.awt.UnoControl" + srv + "Model")
-    while prop_list:
-        prp = prop_list.popitem()
-        uno.invoke(ctl_model,"setPropertyValue",(prp[0],prp[1]))
-        #works with awt.UnoControlDialogElement only:
-        ctl_model.Name = ctl_name
-    dlg_model.insertByName(ctl_name, ctl_model)
-
-
-def intrinio_login():
-    """
-    Ask user for Intrinio login credentials
-    :return: If successful, returns username and password as a tuple (something truthy)
-    If canceled, returns False.
-    """
-    # Reference: https://www.openoffice.org/api/docs/common/ref/com/sun/star/awt/module-ix.html
-    global logger
-
-    ctx = uno.getComponentContext()
-    smgr = ctx.ServiceManager
-    dlg_model = smgr.createInstance("com.sun.star.awt.UnoControlDialogModel")
-    dlg_model.Title = 'Enter Intrinio Access Keys'
-
-    _add_awt_model(dlg_model, 'FixedText', 'lblName', {
-        'Label': 'User Name',
-    }
-                   )
-    _add_awt_model(dlg_model, 'Edit', 'txtName', {})
-
-    _add_awt_model(dlg_model, 'FixedText', 'lblPWD', {
-        'Label': 'Password',
-    }
-                   )
-    _add_awt_model(dlg_model, 'Edit', 'txtPWD', {
-        'EchoChar': 42,
-    }
-                   )
-
-    _add_awt_model(dlg_model, 'CheckBox', 'cbDoNotAsk', {
-        'Label': 'Do not ask again',
-    }
-                   )
-
-    _add_awt_model(dlg_model, 'Button', 'btnOK', {
-        'Label': 'Save',
-        'DefaultButton': True,
-        'PushButtonType': 1,
-    }
-                   )
-    _add_awt_model(dlg_model, 'Button', 'btnCancel', {
-        'Label': 'Cancel',
-        'PushButtonType': 2,
-    }
-                   )
-
-    lmargin = 10  # left margin
-    rmargin = 10  # right margin
-    tmargin = 10  # top margin
-    bmargin = 10  # bottom margin
-    cheight = 25  # control height
-    pad = 5  # top/bottom padding where needed
-    theight = cheight + pad  # total height of a control
-
-    # Poor man's grid
-    # layout "control-name", [x, y, w, h]
-    layout = {
-        "lblName": [lmargin, tmargin, 100, cheight],
-        "txtName": [lmargin + 100, tmargin, 250, cheight],
-        "lblPWD": [lmargin, tmargin + (theight * 1), 100, cheight],
-        "txtPWD": [lmargin + 100, tmargin + (theight * 1), 250, cheight],
-        "cbDoNotAsk": [lmargin + 100, tmargin + (theight * 2), 200, cheight],
-        "btnOK": [lmargin + 100, tmargin + (theight * 3), 100, cheight],
-        "btnCancel": [lmargin + 200, tmargin + (theight * 3), 100, cheight]
-    }
-
-    dialog = smgr.createInstance("com.sun.star.awt.UnoControlDialog")
-    dialog.setModel(dlg_model)
-    name_ctl = dialog.getControl('txtName')
-    pass_ctl = dialog.getControl('txtPWD')
-    do_not_ask_ctl = dialog.getControl("cbDoNotAsk")
-
-    # Apply layout to controls. Must be done within the dialog.
-    for name, d in layout.items():
-        ctl = dialog.getControl(name)
-        ctl.setPosSize(d[0], d[1], d[2], d[3], POSSIZE)
-
-    dialog.setPosSize(300, 300, lmargin + rmargin + 100 + 250, tmargin + bmargin + (theight * 4), POSSIZE)
-    dialog.setVisible(True)
-
-    # Run the dialog. Returns the value of the PushButtonType.
-    # 1 = save
-    # 2 = cancel
-    button_id = dialog.execute()
-    logger.debug("intrinio login dialog returned: %s", button_id)
-    if button_id == 1:
-        return (True, name_ctl.getText(), pass_ctl.getText())
-    else:
-        return (False, do_not_ask_ctl.getState())
+def get_reported_financials_statement(identifier, statement, fiscal_year, fiscal_period):
+    """
+    Returns an entire as reported statement in the order of its as reported tag hierarchy.
+    :param identifier: Stock ticker symbol.
+    :param statement:
+    :param fiscal_year: Fiscal year or a sequence number (see get_reported_financials_data())
+    :param fiscal_period: Fiscal period or a period type (see get_reported_financials_data())
+    :return: List of [xbrl_tag, domain_tag, name, value] rows or a message
+    """
+    logger.debug("get_reported_financials_statement: %s %s %d %s", identifier, statement, fiscal_year, fiscal_period)
+    # Translate fiscal year and period if required
+    translated = _translate_fiscal_period(ReportedFundamentalsCache, get_reported_fundamentals_data,
+                                          identifier, statement, fiscal_year, fiscal_period)
+    if isinstance(translated, str):
+        return translated
+    fiscal_year, fiscal_period = translated
+
+    tags = _get_all_tags(ReportedTagsCache,
+                         lambda: IntrinioReportedTags.get_all_tags_pages(identifier, statement, fiscal_year,
+                                                                         fiscal_period),
+                         identifier, statement, fiscal_year, fiscal_period)
+    if isinstance(tags, str):
+        return tags
+
+    financials = _get_reported_financials(identifier, statement, fiscal_year, fiscal_period)
+    if isinstance(financials, str):
+        return financials
+
+    rows = []
+    for tag in tags:
+        xbrl_tag = tag["xbrl_tag"]
+        domain_tag = tag.get("domain_tag") or ""
+        if xbrl_tag.lower().endswith("abstract"):
+            # Abstract tags have no value
+            v = ""
+        else:
+            v = financials.value(xbrl_tag, domain_tag)
+        rows.append([xbrl_tag, domain_tag, tag.get("name", ""), v])
+    return rows
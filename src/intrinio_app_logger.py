@@ -17,6 +17,10 @@ import os
 class AppLogger:
     # All of the created loggers
     logger_list = []
+    # The folder of the log files. Empty until log_to_file() is called.
+    file_path = ""
+    logformat = '%(asctime)s, %(module)s, %(levelname)s, %(message)s'
+    logdateformat = '%Y-%m-%d %H:%M:%S'
 
     def __init__(self, logname):
         self.logger = None
@@ -26,46 +30,48 @@ class AppLogger:
     # Enable logging for the extension
     def EnableLogging(self, logname):
         if not logname in AppLogger.logger_list:
-            # Default overrides
-            logformat = '%(asctime)s, %(module)s, %(levelname)s, %(message)s'
-            logdateformat = '%Y-%m-%d %H:%M:%S'
-
             self.logger = logging.getLogger(logname)
 
             # Default logging to DEBUG until the level is set from the configuration
             self.logger.setLevel(logging.DEBUG)
-
-            formatter = logging.Formatter(logformat, datefmt=logdateformat)
-
-            # Log to a file
-            # Make logfile location OS specific
-            if os.name == "posix":
-                # Linux or OS X
-                file_path = "{0}/libreoffice/intrinio/".format(os.environ["HOME"])
-            elif os.name == "nt":
-                # Windows
-                file_path = "{0}\\libreoffice\\intrinio\\".format(os.environ["LOCALAPPDATA"])
-            else:
-                file_path = ""
-
-            # Create directory if it doesn't exist
-            if not os.path.exists(file_path):
-                os.makedirs(file_path, exist_ok=True)
-            # Manufacture full path to log file
-            logfile = file_path + logname + ".log"
-
-            fh = logging.handlers.TimedRotatingFileHandler(logfile, when='midnight', backupCount=3)
-            fh.setFormatter(formatter)
-            self.logger.addHandler(fh)
-            self.logger.debug("New logger %s created: %s", logname, str(self.logger))
-            self.logger.debug("%s logging to file: %s", logname, logfile)
+            # Nothing is written anywhere until log_to_file() is called (or the
+            # application adds its own handlers)
+            self.logger.addHandler(logging.NullHandler())
 
             # Note that this logname has been defined
             AppLogger.logger_list.append(logname)
+            if AppLogger.file_path:
+                AppLogger._add_file_handler(self.logger, logname)
         else:
             # Use the logger that has been previously defined
             self.logger = logging.getLogger(logname)
 
+    @classmethod
+    def log_to_file(cls, file_path):
+        """
+        Log every app logger to <file_path><logname>.log. The log files are
+        rotated at midnight.
+        :param file_path: Folder of the log files, ending with a separator
+        :return: None
+        """
+        if cls.file_path:
+            return
+        # Create directory if it doesn't exist
+        if file_path and not os.path.exists(file_path):
+            os.makedirs(file_path, exist_ok=True)
+        cls.file_path = file_path
+        for logname in cls.logger_list:
+            cls._add_file_handler(logging.getLogger(logname), logname)
+
+    @classmethod
+    def _add_file_handler(cls, logger, logname):
+        # Manufacture full path to log file
+        logfile = cls.file_path + logname + ".log"
+        fh = logging.handlers.TimedRotatingFileHandler(logfile, when='midnight', backupCount=3)
+        fh.setFormatter(logging.Formatter(cls.logformat, datefmt=cls.logdateformat))
+        logger.addHandler(fh)
+        logger.debug("%s logging to file: %s", logname, logfile)
+
     def getAppLogger(self):
         """
         Return an instance of the default logger for this app.
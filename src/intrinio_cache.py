@@ -17,7 +17,12 @@
 #
 
 from intrinio_app_logger import AppLogger
-from intrinio_lib import QConfiguration
+from intrinio_lib import QConfiguration, IntrinioBase
+from intrinio_cache_engine import CacheEngine
+from intrinio_disk_cache import DiskCache
+from intrinio_engine import IntrinioEngine
+from intrinio_series import TimeSeries
+from intrinio_statement import FinancialStatement, ReportedFinancialStatement
 import datetime
 
 # Logger init
@@ -25,447 +30,371 @@ the_app_logger = AppLogger("intrinio-extension")
 logger = the_app_logger.getAppLogger()
 
 
-class UsageDataCache:
-    """
-    Used to track the Intrinio API usage data
-    """
-    usage_data = None
-
-    def __init__(self):
-        pass
-
-    @classmethod
-    def is_usage_data(cls):
-        return cls.usage_data is not None
-
-    @classmethod
-    def get_usage_data(cls):
-        return cls.usage_data
-
-    @classmethod
-    def clear(cls):
-        cls.usage_data = None
-
-    @classmethod
-    def add_usage_data(cls, data):
-        cls.usage_data = data
+# Disk cache life times in seconds
+HOUR = 60 * 60
+DAY = 24 * HOUR
 
 
-class IdentifierCache:
+def fiscal_period_ttl(key):
     """
-    Used to track identifiers (ticker symbols, etc.)
-    The dict consists of identifier/boolean pairs where
-    the boolean indicates if the identifier is valid or invalid.
+    Disk life time for data keyed by (identifier, statement, fiscal_year, ...).
+    Statements for fiscal years that closed before last year do not change.
+    :param key: tuple
+    :return: Life time in seconds or None for no expiry
     """
-    known_identifiers = {}
-
-    def __init__(self):
+    try:
+        if int(key[2]) < datetime.date.today().year - 1:
+            return None
+    except (ValueError, TypeError):
         pass
+    return DAY
 
-    @classmethod
-    def is_valid_identifier(cls, identifier):
-        if identifier in cls.known_identifiers:
-            return cls.known_identifiers[identifier]
-        raise ValueError()
-
-    @classmethod
-    def is_known_identifier(cls, identifier):
-        return identifier in cls.known_identifiers
-
-    @classmethod
-    def add_identifier(cls, identifier, valid):
-        cls.known_identifiers[identifier] = valid
-
-    @classmethod
-    def remove_identifier(cls, identifier):
-        del cls.known_identifiers[identifier]
 
-
-class DataPointCache:
+class QueryCache:
     """
-    Used to track data point values with a finite life time
+    Base class for caches of API query results. Each subclass is backed by its own
+    cache engine namespace. The positional key arguments of each method form a tuple key.
     """
-    # The key is the identifier_item (e.g. GOOG_52_week_high
-    id_values = {}
+    namespace = None
 
     def __init__(self):
         pass
 
     @classmethod
-    def is_value_cached(cls, identifier, item):
-        key = identifier + "_" + item
-        if key in cls.id_values:
-            # If the key is cached it must meet the cache life test
-            elapsed = datetime.datetime.now() - cls.id_values[key]["time"]
-            if (QConfiguration.cache_life < 0) or (int(elapsed.total_seconds()) <= QConfiguration.cache_life):
-                return True
-            else:
-                del cls.id_values[key]
-        return False
+    def _query_key(cls, *args):
+        return args
 
     @classmethod
-    def get_value(cls, identifier, item):
-        key = identifier + "_" + item
-        return cls.id_values[key]["value"]
+    def is_query_value_cached(cls, *args):
+        return cls.namespace.contains(cls._query_key(*args))
 
     @classmethod
-    def add_value(cls, identifier, item, value):
-        key = identifier + "_" + item
-        kv = {}
-        kv["time"] = datetime.datetime.now()
-        kv["value"] = value
-        cls.id_values[key] = kv
-
-
-class HistoricalPricesCache:
-    """
-    Used to track historical price queries
-    """
-    # The key is a compound value consisting of all of the parameters
-    # that are used in the API call.
-    query_values = {}
-
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def _query_key(identifier, start_date, end_date, frequency, page_number):
-        return identifier + "_" + str(start_date) + "_" + str(end_date) + "_" + str(frequency) + "_" + str(page_number)
+    def get_query_value(cls, *args):
+        # This returns the entire API call result (which can be a large dict)
+        return cls.namespace.get(cls._query_key(*args))
 
     @classmethod
-    def is_query_value_cached(cls, identifier, start_date, end_date, frequency, page_number):
-        key = HistoricalPricesCache._query_key(identifier, start_date, end_date, frequency, page_number)
-        return key in cls.query_values
+    def lookup_query_value(cls, *args):
+        """
+        :return: A tuple (found, value)
+        """
+        return cls.namespace.lookup(cls._query_key(*args))
 
     @classmethod
-    def get_query_value(cls, identifier, start_date, end_date, frequency, page_number):
-        key = HistoricalPricesCache._query_key(identifier, start_date, end_date, frequency, page_number)
-        # This returns the entire API call result (which is a large dict)
-        return cls.query_values[key]
+    def resize_query_value(cls, *args):
+        """
+        Account for a cached value that has grown in place
+        """
+        cls.namespace.resize(cls._query_key(*args))
 
     @classmethod
-    def add_query_value(cls, query_value, identifier, start_date, end_date, frequency, page_number):
-        key = HistoricalPricesCache._query_key(identifier, start_date, end_date, frequency, page_number)
-        cls.query_values[key] = query_value
+    def add_query_value(cls, query_value, *args):
+        cls.namespace.put(cls._query_key(*args), query_value)
 
 
-class HistoricalDataCache:
+class UsageDataCache:
     """
-    Used to track historical data queries
+    Used to track the Intrinio API usage data
     """
-    # The key is a compound value consisting of all of the parameters
-    # that are used in the API call.
-    query_values = {}
+    namespace = CacheEngine.namespace("usage")
+    key = ("current",)
 
     def __init__(self):
         pass
 
-    @staticmethod
-    def _query_key(identifier, item, start_date, end_date, frequency, period_type, page_number):
-        return identifier + "_" + item + "_" + str(start_date) + "_" + str(end_date) + "_" + str(frequency) + "_" + \
-               str(period_type) + "_" + str(page_number)
+    @classmethod
+    def is_usage_data(cls):
+        return cls.namespace.contains(cls.key)
 
     @classmethod
-    def is_query_value_cached(cls, identifier, item, start_date, end_date, frequency, period_type, page_number):
-        key = cls._query_key(identifier, item, start_date, end_date, frequency, period_type, page_number)
-        return key in cls.query_values
+    def get_usage_data(cls):
+        return cls.namespace.get(cls.key)
 
     @classmethod
-    def get_query_value(cls, identifier, item, start_date, end_date, frequency, period_type, page_number):
-        key = cls._query_key(identifier, item, start_date, end_date, frequency, period_type, page_number)
-        # This returns the entire API call result (which is a large dict)
-        return cls.query_values[key]
+    def clear(cls):
+        cls.namespace.clear()
 
     @classmethod
-    def add_query_value(cls, query_value, identifier, item, start_date, end_date, frequency, period_type, page_number):
-        key = cls._query_key(identifier, item, start_date, end_date, frequency, period_type, page_number)
-        cls.query_values[key] = query_value
+    def add_usage_data(cls, data):
+        cls.namespace.put(cls.key, data)
 
 
-class IntrinioNewsCache:
+class NegativeResultCache:
     """
-    Used to track news queries
+    Remembers failed API results so that every cell that references a failing
+    query does not re-issue it on every recalculation. Results are kept by request
+    in a namespace per status class, each with its own (short) TTL. An auth failure
+    (401) answers every request until the credentials change.
     """
-    # The key is a compound value consisting of the ticker and page number.
-    query_values = {}
+    # 404, e.g. a mistyped ticker symbol
+    not_found = CacheEngine.namespace("negative_not_found", ttl=10 * 60, cost=0.1)
+    # Any other 4xx, e.g. 400 or 403 (no subscription)
+    client_errors = CacheEngine.namespace("negative_client_errors", ttl=5 * 60, cost=0.1)
+    # 5xx, throttling that outlasted the retries, connection failures and bad payloads
+    server_errors = CacheEngine.namespace("negative_server_errors", ttl=30, cost=0.1)
+    # (auth_header, result) of the last 401
+    auth_failure = None
 
     def __init__(self):
         pass
 
-    @staticmethod
-    def _query_key(identifier, page_number):
-        return identifier + str(page_number)
-
     @classmethod
-    def is_query_value_cached(cls, identifier, page_number):
-        key = cls._query_key(identifier, page_number)
-        return key in cls.query_values
+    def lookup(cls, request):
+        """
+        :param request: IntrinioRequest
+        :return: The remembered failed result or None
+        """
+        auth_failure = cls.auth_failure
+        if auth_failure is not None:
+            if auth_failure[0] == QConfiguration.auth_header:
+                return dict(auth_failure[1])
+            # The credentials have changed
+            cls.auth_failure = None
+        key = request.key
+        for namespace in (cls.not_found, cls.client_errors, cls.server_errors):
+            found, res = namespace.lookup(key)
+            if found:
+                return dict(res)
+        return None
+
+    @classmethod
+    def add(cls, request, res):
+        """
+        Remember a result if it is a failure
+        :param request: IntrinioRequest
+        :param res: Result dict
+        :return: None
+        """
+        status_code = res.get("status_code", 666)
+        if 200 <= status_code < 300:
+            return
+        if status_code == 401:
+            logger.error("Authorization failed. Requests are suspended until the configuration changes.")
+            cls.auth_failure = (QConfiguration.auth_header, res)
+        elif status_code == 404:
+            cls.not_found.put(request.key, res)
+        elif 400 <= status_code < 500 and status_code != 429:
+            cls.client_errors.put(request.key, res)
+        else:
+            cls.server_errors.put(request.key, res)
 
     @classmethod
-    def get_query_value(cls, identifier, page_number):
-        key = cls._query_key(identifier, page_number)
-        # This returns the entire API call result (which can be a large dict)
-        return cls.query_values[key]
-
-    @classmethod
-    def add_query_value(cls, query_value, identifier, page_number):
-        key = cls._query_key(identifier, page_number)
-        cls.query_values[key] = query_value
+    def clear(cls):
+        cls.auth_failure = None
+        for namespace in (cls.not_found, cls.client_errors, cls.server_errors):
+            namespace.clear()
 
 
-class FundamentalsCache:
+class IdentifierCache:
     """
-    Used to track fundamental data queries
+    Used to track identifiers (ticker symbols, etc.)
+    The cache consists of identifier/boolean pairs where
+    the boolean indicates if the identifier is valid or invalid.
+    Verdicts are kept on disk. Valid identifiers are trusted for a month,
+    invalid ones for a day (e.g. in case of a new listing).
     """
-    # The key is a compound value consisting of all of the parameters
-    # that are used in the API call.
-    query_values = {}
+    # Verifying an identifier can take up to three API calls
+    namespace = CacheEngine.namespace("identifiers", cost=3.0, persist=True, disk_ttl=30 * DAY)
+    invalid = CacheEngine.namespace("invalid_identifiers", ttl=DAY, cost=3.0, persist=True, disk_ttl=DAY)
 
     def __init__(self):
         pass
 
-    @staticmethod
-    def _query_key(identifier, statement, period_type, page_number):
-        return identifier + "_" + statement + "_" + str(period_type) + "_" + str(page_number)
-
     @classmethod
-    def is_query_value_cached(cls, identifier, statement, period_type, page_number):
-        key = cls._query_key(identifier, statement, period_type, page_number)
-        return key in cls.query_values
+    def lookup_identifier(cls, identifier):
+        """
+        :param identifier: Upper case identifier
+        :return: A tuple (found, valid)
+        """
+        if cls.namespace.contains((identifier,)):
+            return True, True
+        if cls.invalid.contains((identifier,)):
+            return True, False
+        return False, None
 
     @classmethod
-    def get_query_value(cls, identifier, statement, period_type, page_number):
-        key = cls._query_key(identifier, statement, period_type, page_number)
-        # This returns the entire API call result (which is a large dict)
-        return cls.query_values[key]
-
-    @classmethod
-    def add_query_value(cls, query_value, identifier, statement, period_type, page_number):
-        key = cls._query_key(identifier, statement, period_type, page_number)
-        cls.query_values[key] = query_value
-
-
-class IntrinioTagsCache:
-    """
-    Used to track news queries
-    """
-    # The key is a compound value consisting of the ticker, statement and page number.
-    query_values = {}
-
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def _query_key(identifier, statement, page_number):
-        return identifier + "_" + statement + "_" + str(page_number)
+    def is_valid_identifier(cls, identifier):
+        found, valid = cls.lookup_identifier(identifier)
+        if found:
+            return valid
+        raise ValueError()
 
     @classmethod
-    def is_query_value_cached(cls, identifier, statement, page_number):
-        key = cls._query_key(identifier, statement, page_number)
-        return key in cls.query_values
+    def is_known_identifier(cls, identifier):
+        return cls.lookup_identifier(identifier)[0]
 
     @classmethod
-    def get_query_value(cls, identifier, statement, page_number):
-        key = cls._query_key(identifier, statement, page_number)
-        # This returns the entire API call result (which can be a large dict)
-        return cls.query_values[key]
+    def add_identifier(cls, identifier, valid):
+        if valid:
+            cls.namespace.put((identifier,), True)
+        else:
+            cls.invalid.put((identifier,), False)
 
     @classmethod
-    def add_query_value(cls, query_value, identifier, statement, page_number):
-        key = cls._query_key(identifier, statement, page_number)
-        cls.query_values[key] = query_value
+    def remove_identifier(cls, identifier):
+        cls.namespace.remove((identifier,))
+        cls.invalid.remove((identifier,))
 
 
-class FinancialsDataCache:
+class DataPointCache:
     """
-    Used to track financials data queries
+    Used to track data point values with a finite life time (cachelife)
     """
-    # The key is a compound value consisting of all of the parameters
-    # that are used in the API call.
-    query_values = {}
+    # The key is (identifier, item) (e.g. (GOOG, 52_week_high))
+    namespace = CacheEngine.namespace("data_points", ttl=QConfiguration.cache_life if QConfiguration.cache_life >= 0 else None)
 
     def __init__(self):
         pass
 
-    @staticmethod
-    def _query_key(identifier, statement, fiscal_year, fiscal_period, tag):
-        return identifier + "_" + statement + "_" + str(fiscal_year) + "_" + str(fiscal_period) + "_" + tag
-
     @classmethod
-    def is_query_value_cached(cls, identifier, statement, fiscal_year, fiscal_period, tag):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period, tag)
-        return key in cls.query_values
+    def is_value_cached(cls, identifier, item):
+        return cls.namespace.contains((identifier, item))
 
     @classmethod
-    def get_query_value(cls, identifier, statement, fiscal_year, fiscal_period, tag):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period, tag)
-        # This returns the entire API call result (which is a large dict)
-        return cls.query_values[key]
+    def get_value(cls, identifier, item):
+        return cls.namespace.get((identifier, item))
 
     @classmethod
-    def add_query_value(cls, query_value, identifier, statement, fiscal_year, fiscal_period, tag):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period, tag)
-        cls.query_values[key] = query_value
+    def add_value(cls, identifier, item, value):
+        cls.namespace.put((identifier, item), value)
 
 
-class FinancialsQueryCache:
+class HistoricalPricesCache(QueryCache):
     """
-    Used to track financials queries. This is so we can know that specific query has
-    already been run and avoid running it more than once.
+    Used to track historical prices. Every page fetched for a ticker is merged
+    into one date anchored series. Series are kept on disk for a month because
+    they are brought up to date with small delta requests.
     """
-    # The key is a compound value consisting of all of the parameters
-    # that are used in the API call.
-    query_values = {}
+    # The key is (identifier, frequency). The value is a TimeSeries.
+    namespace = CacheEngine.namespace("price_series", persist=True, disk_ttl=30 * DAY,
+                                      encode=TimeSeries.to_dict, decode=TimeSeries.from_dict)
 
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def _query_key(identifier, statement, fiscal_year, fiscal_period):
-        return identifier + "_" + statement + "_" + str(fiscal_year) + "_" + str(fiscal_period)
-
-    @classmethod
-    def is_query_value_cached(cls, identifier, statement, fiscal_year, fiscal_period):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period)
-        return key in cls.query_values
-
-    @classmethod
-    def get_query_value(cls, identifier, statement, fiscal_year, fiscal_period):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period)
-        # This returns the entire API call result (which is a large dict)
-        return cls.query_values[key]
-
-    @classmethod
-    def add_query_value(cls, query_value, identifier, statement, fiscal_year, fiscal_period):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period)
-        cls.query_values[key] = query_value
 
-
-class ReportedFundamentalsCache:
+class HistoricalDataCache(QueryCache):
     """
-    Used to track reported fundamental data queries
+    Used to track historical data. Every page fetched for an identifier and item
+    is merged into one date anchored series.
     """
-    # The key is a compound value consisting of all of the parameters
-    # that are used in the API call.
-    query_values = {}
-
-    def __init__(self):
-        pass
+    # The key is (identifier, item, frequency, period_type). The value is a TimeSeries.
+    namespace = CacheEngine.namespace("historical_data_series", persist=True, disk_ttl=30 * DAY,
+                                      encode=TimeSeries.to_dict, decode=TimeSeries.from_dict)
 
-    @staticmethod
-    def _query_key(identifier, statement, period_type, page_number):
-        return identifier + "_" + statement + "_" + str(period_type) + "_" + str(page_number)
-
-    @classmethod
-    def is_query_value_cached(cls, identifier, statement, period_type, page_number):
-        key = cls._query_key(identifier, statement, period_type, page_number)
-        return key in cls.query_values
-
-    @classmethod
-    def get_query_value(cls, identifier, statement, period_type, page_number):
-        key = cls._query_key(identifier, statement, period_type, page_number)
-        # This returns the entire API call result (which is a large dict)
-        return cls.query_values[key]
 
-    @classmethod
-    def add_query_value(cls, query_value, identifier, statement, period_type, page_number):
-        key = cls._query_key(identifier, statement, period_type, page_number)
-        cls.query_values[key] = query_value
-
-
-class ReportedTagsCache:
+class IntrinioNewsCache(QueryCache):
     """
     Used to track news queries
     """
-    # The key is a compound value consisting of the ticker, statement and page number.
-    query_values = {}
-
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def _query_key(identifier, statement, fiscal_year, fiscal_period, page_number):
-        return identifier + "_" + statement + "_" + str(fiscal_year) + "_" + fiscal_period + "_" + str(page_number)
-
-    @classmethod
-    def is_query_value_cached(cls, identifier, statement, fiscal_year, fiscal_period, page_number):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period, page_number)
-        return key in cls.query_values
+    # The key is (identifier, page_number)
+    namespace = CacheEngine.namespace("news", persist=True, disk_ttl=HOUR)
 
-    @classmethod
-    def get_query_value(cls, identifier, statement, fiscal_year, fiscal_period, page_number):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period, page_number)
-        # This returns the entire API call result (which can be a large dict)
-        return cls.query_values[key]
 
-    @classmethod
-    def add_query_value(cls, query_value, identifier, statement, fiscal_year, fiscal_period, page_number):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period, page_number)
-        cls.query_values[key] = query_value
+class FundamentalsCache(QueryCache):
+    """
+    Used to track fundamental data queries. Each page that is added is also
+    indexed by sequence number (see fiscal_period()).
+    """
+    # The key is (identifier, statement, period_type, page_number)
+    namespace = CacheEngine.namespace("fundamentals", persist=True, disk_ttl=DAY)
+    # The key is (identifier, statement, period_type). The value is a dict of
+    # sequence -> (fiscal_year, fiscal_period, start_date, end_date).
+    periods = CacheEngine.namespace("fiscal_periods")
+
+    @classmethod
+    def add_query_value(cls, query_value, *args):
+        super().add_query_value(query_value, *args)
+        cls._index_page(query_value, *args)
+
+    @classmethod
+    def fiscal_period(cls, identifier, statement, period_type, sequence):
+        """
+        Translate a fundamentals sequence number to its fiscal period
+        :param identifier:
+        :param statement:
+        :param period_type:
+        :param sequence: 0-n
+        :return: A tuple (fiscal_year, fiscal_period, start_date, end_date) or None
+        if the page containing the sequence number is not cached
+        """
+        found, index = cls.periods.lookup((identifier, statement, period_type))
+        if found and sequence in index:
+            return index[sequence]
+        # The page may be cached (e.g. on disk) without having been indexed
+        page_number = IntrinioBase.get_page_number(sequence)
+        found, page = cls.lookup_query_value(identifier, statement, period_type, page_number)
+        if not found:
+            return None
+        index = cls._index_page(page, identifier, statement, period_type, page_number)
+        return index.get(sequence)
+
+    @classmethod
+    def _index_page(cls, page, identifier, statement, period_type, page_number):
+        key = (identifier, statement, period_type)
+        found, index = cls.periods.lookup(key)
+        index = dict(index) if found else {}
+        first = (page_number - 1) * IntrinioBase.page_size
+        for i, row in enumerate(page.get("data", [])):
+            index[first + i] = (row.get("fiscal_year"), row.get("fiscal_period"),
+                                row.get("start_date"), row.get("end_date"))
+        cls.periods.put(key, index)
+        return index
+
+
+class IntrinioTagsCache(QueryCache):
+    """
+    Used to track standardized tags queries
+    """
+    # The key is (identifier, statement, page_number)
+    namespace = CacheEngine.namespace("tags", persist=True, disk_ttl=DAY)
 
 
-class ReportedFinancialsCache:
+class FinancialsCache(QueryCache):
     """
-    Used to track reported financials data queries
+    Used to track financials data. Each entry is an entire statement.
     """
-    # The key is a compound value consisting of all of the parameters
-    # that are used in the API call.
-    query_values = {}
+    # The key is (identifier, statement, fiscal_year, fiscal_period). The value is a FinancialStatement.
+    namespace = CacheEngine.namespace("financial_statements", cost=3.0, persist=True, disk_ttl=fiscal_period_ttl,
+                                      encode=FinancialStatement.to_dict, decode=FinancialStatement.from_dict)
 
-    def __init__(self):
-        pass
 
-    @staticmethod
-    def _query_key(identifier, statement, fiscal_year, fiscal_period, tag, domain_tag=None):
-        if domain_tag:
-            return identifier + "_" + statement + "_" + str(fiscal_year) + "_" + str(fiscal_period) + "_" + tag + "_" + domain_tag
-        return identifier + "_" + statement + "_" + str(fiscal_year) + "_" + str(fiscal_period) + "_" + tag
+class ReportedFundamentalsCache(FundamentalsCache):
+    """
+    Used to track reported fundamental data queries
+    """
+    # The key is (identifier, statement, period_type, page_number)
+    namespace = CacheEngine.namespace("reported_fundamentals", persist=True, disk_ttl=DAY)
+    periods = CacheEngine.namespace("reported_fiscal_periods")
 
-    @classmethod
-    def is_query_value_cached(cls, identifier, statement, fiscal_year, fiscal_period, tag, domain_tag=None):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period, tag, domain_tag)
-        return key in cls.query_values
 
-    @classmethod
-    def get_query_value(cls, identifier, statement, fiscal_year, fiscal_period, tag, domain_tag=None):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period, tag, domain_tag)
-        # This returns the entire API call result (which is a large dict)
-        return cls.query_values[key]
-
-    @classmethod
-    def add_query_value(cls, query_value, identifier, statement, fiscal_year, fiscal_period, tag, domain_tag=None):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period, tag, domain_tag)
-        cls.query_values[key] = query_value
+class ReportedTagsCache(QueryCache):
+    """
+    Used to track reported tags queries
+    """
+    # The key is (identifier, statement, fiscal_year, fiscal_period, page_number)
+    namespace = CacheEngine.namespace("reported_tags", persist=True, disk_ttl=fiscal_period_ttl)
 
 
-class ReportedFinancialsQueryCache:
+class ReportedFinancialsCache(QueryCache):
     """
-    Used to track financials queries. This is so we can know that specific query has
-    already been run and avoid running it more than once.
+    Used to track reported financials data. Each entry is an entire statement.
     """
-    # The key is a compound value consisting of all of the parameters
-    # that are used in the API call.
-    query_values = {}
+    # The key is (identifier, statement, fiscal_year, fiscal_period). The value is a ReportedFinancialStatement.
+    namespace = CacheEngine.namespace("reported_financial_statements", cost=3.0, persist=True,
+                                      disk_ttl=fiscal_period_ttl, encode=ReportedFinancialStatement.to_dict,
+                                      decode=ReportedFinancialStatement.from_dict)
 
-    def __init__(self):
-        pass
 
-    @staticmethod
-    def _query_key(identifier, statement, fiscal_year, fiscal_period):
-        return identifier + "_" + statement + "_" + str(fiscal_year) + "_" + str(fiscal_period)
-
-    @classmethod
-    def is_query_value_cached(cls, identifier, statement, fiscal_year, fiscal_period):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period)
-        return key in cls.query_values
+IntrinioEngine.negative_cache = NegativeResultCache
 
-    @classmethod
-    def get_query_value(cls, identifier, statement, fiscal_year, fiscal_period):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period)
-        # This returns the entire API call result (which is a large dict)
-        return cls.query_values[key]
 
-    @classmethod
-    def add_query_value(cls, query_value, identifier, statement, fiscal_year, fiscal_period):
-        key = cls._query_key(identifier, statement, fiscal_year, fiscal_period)
-        cls.query_values[key] = query_value
+def configure_caches():
+    """
+    Apply the cache settings of the current configuration: the data point cache life,
+    any namespace overrides, the memory budget and the disk cache. The disk cache
+    (intrinio_cache.db) is kept in the configuration folder, so there is no disk
+    cache without one.
+    :return: None
+    """
+    DataPointCache.namespace.configure(ttl=QConfiguration.cache_life)
+    CacheEngine.configure(QConfiguration.cache_settings, max_bytes=QConfiguration.cache_budget * 1024 * 1024)
+    if QConfiguration.disk_cache and QConfiguration.file_path:
+        DiskCache.open(QConfiguration.file_path + "intrinio_cache.db")
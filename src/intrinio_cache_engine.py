@@ -0,0 +1,442 @@
+#
+# intrinio_cache_engine - Generic in-memory cache engine with named namespaces
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+import time
+import threading
+from collections import OrderedDict
+from intrinio_app_logger import AppLogger
+from intrinio_disk_cache import DiskCache
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+
+def estimate_size(value):
+    """
+    Estimate the memory footprint of a cached value. This is an approximation
+    that walks dicts, lists and tuples. Shared objects are counted once.
+    :param value: Any JSON like value
+    :return: Size in bytes
+    """
+    size = 0
+    seen = set()
+    stack = [value]
+    while stack:
+        v = stack.pop()
+        if id(v) in seen:
+            continue
+        seen.add(id(v))
+        size += sys.getsizeof(v)
+        if isinstance(v, dict):
+            stack.extend(v.keys())
+            stack.extend(v.values())
+        elif isinstance(v, (list, tuple)):
+            stack.extend(v)
+    return size
+
+
+class CacheEntry:
+    """
+    A cached value and its bookkeeping
+    """
+    __slots__ = ("value", "size", "created", "used")
+
+    def __init__(self, value, size, created):
+        self.value = value
+        self.size = size
+        self.created = created
+        self.used = created
+
+
+class CacheNamespace:
+    """
+    A named, thread safe cache. Keys are tuples. Each namespace has its own
+    time to live, entry limit, byte limit and eviction policy. Entries also count
+    against the CacheEngine global byte budget unless the namespace is not evictable.
+    A persistent namespace is backed by the DiskCache: a memory miss reads through
+    to disk and every put is written behind to disk.
+    """
+    # The number of least recently used entries considered when choosing a global eviction victim
+    eviction_sample = 4
+    # Eviction policies
+    LRU = "lru"
+    FIFO = "fifo"
+
+    def __init__(self, name, ttl=None, max_entries=None, max_bytes=None, eviction=LRU, cost=1.0, evictable=True,
+                 persist=False, disk_ttl=None, version=1, encode=None, decode=None):
+        """
+        :param name: Namespace name (e.g. historical_prices)
+        :param ttl: Entry life time in seconds. None means entries never expire.
+        :param max_entries: Maximum number of entries. None means unlimited.
+        :param max_bytes: Maximum estimated size of all entries. None means unlimited.
+        :param eviction: LRU or FIFO
+        :param cost: The relative cost (roughly API calls) of rebuilding one entry
+        :param evictable: False if the global byte budget must not evict entries
+        :param persist: True if entries are also kept in the disk cache
+        :param disk_ttl: Disk entry life time in seconds, None for no expiry, or a
+        function that takes a key and returns a life time
+        :param version: Disk entry version. Change it when the cached data format changes.
+        :param encode: Function that converts a value to its JSON serializable disk form
+        :param decode: Function that converts a disk form back to a value
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.cost = cost
+        self.evictable = evictable
+        self.persist = persist
+        self.disk_ttl = disk_ttl
+        self.version = version
+        self.encode = encode
+        self.decode = decode
+        # Ordered from least to most recently used (LRU) or oldest to newest (FIFO)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+    def configure(self, ttl=None, max_entries=None, max_bytes=None, eviction=None, cost=None, disk_ttl=None):
+        """
+        Change the namespace settings. Only the given settings are changed.
+        :return: None
+        """
+        with self._lock:
+            if ttl is not None:
+                self.ttl = None if ttl < 0 else ttl
+            if max_entries is not None:
+                self.max_entries = max_entries if max_entries > 0 else None
+            if max_bytes is not None:
+                self.max_bytes = max_bytes if max_bytes > 0 else None
+            if eviction is not None:
+                if eviction not in (CacheNamespace.LRU, CacheNamespace.FIFO):
+                    raise ValueError("Unknown eviction policy " + str(eviction))
+                self.eviction = eviction
+            if cost is not None:
+                self.cost = float(cost)
+            if disk_ttl is not None:
+                self.disk_ttl = None if disk_ttl < 0 else disk_ttl
+            self._enforce_limits()
+
+    def lookup(self, key):
+        """
+        Look up a key, honoring the namespace TTL. A persistent namespace reads
+        through to the disk cache on a memory miss.
+        :param key: tuple
+        :return: A tuple (found, value)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                if self.eviction == CacheNamespace.LRU:
+                    self._entries.move_to_end(key)
+                entry.used = time.monotonic()
+                self.hits += 1
+                return True, entry.value
+            self.misses += 1
+
+        if not self.persist:
+            return False, None
+        # The disk is read without holding the namespace lock
+        found, value = DiskCache.get(self.name, self.version, key)
+        if found:
+            if self.decode is not None:
+                value = self.decode(value)
+            self.disk_hits += 1
+            self._put_memory(key, value)
+        return found, value
+
+    def contains(self, key):
+        """
+        Answer whether a key is cached. An expired entry is removed.
+        :param key: tuple
+        :return: True if cached
+        """
+        return self.lookup(key)[0]
+
+    def get(self, key):
+        """
+        Return a cached value. Unlike lookup(), this does not check the TTL so a value
+        found by contains() can always be retrieved.
+        :param key: tuple
+        :return: The cached value. Raises KeyError if the key is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry.value
+        # The entry was evicted after it was found
+        found, value = self.lookup(key)
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def put(self, key, value):
+        """
+        Add or replace a cached value
+        :param key: tuple
+        :param value: The value to be cached
+        :return: None
+        """
+        if self.persist:
+            ttl = self.disk_ttl(key) if callable(self.disk_ttl) else self.disk_ttl
+            # Encoded on the writer thread. Only the last of several puts of a key is encoded.
+            DiskCache.put(self.name, self.version, key, value, ttl, encode=self.encode)
+        self._put_memory(key, value)
+
+    def _put_memory(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(value, size, time.monotonic())
+            self._bytes += size
+            self._enforce_limits()
+        # Called without holding the namespace lock. The engine locks one namespace at a time.
+        CacheEngine.enforce_budget()
+
+    def resize(self, key):
+        """
+        Estimate the size of a cached value again after it has grown in place
+        (e.g. a series that memoized resampled bars)
+        :param key: tuple
+        :return: None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            size = estimate_size(entry.value)
+            self._bytes += size - entry.size
+            entry.size = size
+            self._enforce_limits()
+        CacheEngine.enforce_budget()
+
+    def remove(self, key):
+        """
+        Remove a key if it is cached
+        :param key: tuple
+        :return: None
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def keys(self):
+        """
+        :return: A list of the keys of all in-memory entries
+        """
+        with self._lock:
+            return list(self._entries.keys())
+
+    def clear(self):
+        """
+        Remove all in-memory entries. Disk entries are not affected.
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def total_bytes(self):
+        """
+        :return: The estimated size of all entries
+        """
+        return self._bytes
+
+    def eviction_candidate(self, now):
+        """
+        Choose the least valuable of the least recently used entries. An entry's value
+        is its rebuild cost per byte, discounted by the time since it was last used.
+        :param now: time.monotonic() value
+        :return: A tuple (value, key, size) or None if the namespace is empty
+        """
+        with self._lock:
+            best = None
+            for i, (key, entry) in enumerate(self._entries.items()):
+                if i >= CacheNamespace.eviction_sample:
+                    break
+                value = self.cost / (max(1, entry.size) * (1.0 + now - entry.used))
+                if best is None or value < best[0]:
+                    best = (value, key, entry.size)
+            return best
+
+    def evict(self, key):
+        """
+        Evict an entry on behalf of the global byte budget
+        :param key: tuple
+        :return: The size of the evicted entry, or 0 if it is no longer cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return 0
+            self._remove(key)
+            self.evictions += 1
+            return entry.size
+
+    def stats(self):
+        """
+        :return: A dict of namespace statistics
+        """
+        with self._lock:
+            return {"name": self.name, "entries": len(self._entries), "bytes": self._bytes,
+                    "hits": self.hits, "misses": self.misses, "disk_hits": self.disk_hits,
+                    "evictions": self.evictions}
+
+    def _is_expired(self, entry):
+        return self.ttl is not None and (time.monotonic() - entry.created) > self.ttl
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _enforce_limits(self):
+        while self._entries and ((self.max_entries is not None and len(self._entries) > self.max_entries) or
+                                 (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+
+class CacheEngine:
+    """
+    The registry of all cache namespaces. Namespace settings can be overridden
+    through the caches section of intrinio.conf (see configure()).
+    The total size of all namespaces is held under max_bytes. When the budget is
+    exceeded, the least valuable entries across all evictable namespaces are evicted
+    first (see CacheNamespace.eviction_candidate()).
+    """
+    namespaces = OrderedDict()
+    # name -> dict of overrides (ttl, maxentries, maxbytes, eviction, cost)
+    settings = {}
+    # The global byte budget. None means unlimited.
+    max_bytes = None
+    lock = threading.Lock()
+    budget_lock = threading.Lock()
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def namespace(cls, name, ttl=None, max_entries=None, max_bytes=None, eviction=CacheNamespace.LRU,
+                  cost=1.0, evictable=True, persist=False, disk_ttl=None, version=1, encode=None, decode=None):
+        """
+        Create a namespace or return the existing namespace of the same name.
+        The given settings are defaults that configured overrides take precedence over.
+        :return: CacheNamespace
+        """
+        with cls.lock:
+            ns = cls.namespaces.get(name)
+            if ns is None:
+                ns = CacheNamespace(name, ttl=ttl, max_entries=max_entries, max_bytes=max_bytes, eviction=eviction,
+                                    cost=cost, evictable=evictable, persist=persist, disk_ttl=disk_ttl,
+                                    version=version, encode=encode, decode=decode)
+                cls.namespaces[name] = ns
+                cls._apply_settings(ns)
+            return ns
+
+    @classmethod
+    def configure(cls, settings, max_bytes=None):
+        """
+        Apply per-namespace overrides and the global byte budget
+        :param settings: Dict of namespace name -> dict with any of the keys
+        ttl (seconds, -1 for no expiry), maxentries, maxbytes, eviction (lru or fifo), cost,
+        diskttl (seconds, -1 for no expiry)
+        :param max_bytes: The global byte budget. None or 0 means unlimited.
+        :return: None
+        """
+        with cls.lock:
+            cls.settings = settings or {}
+            cls.max_bytes = max_bytes if max_bytes else None
+            for ns in cls.namespaces.values():
+                cls._apply_settings(ns)
+        cls.enforce_budget()
+
+    @classmethod
+    def total_bytes(cls):
+        """
+        :return: The estimated size of all namespaces
+        """
+        return sum(ns.total_bytes() for ns in list(cls.namespaces.values()))
+
+    @classmethod
+    def enforce_budget(cls):
+        """
+        Evict entries until the total size is within the global byte budget
+        :return: None
+        """
+        if cls.max_bytes is None:
+            return
+        with cls.budget_lock:
+            total = cls.total_bytes()
+            if total <= cls.max_bytes:
+                return
+            evicted = 0
+            while total > cls.max_bytes:
+                now = time.monotonic()
+                victim = None
+                for ns in list(cls.namespaces.values()):
+                    if not ns.evictable:
+                        continue
+                    candidate = ns.eviction_candidate(now)
+                    if candidate is not None and (victim is None or candidate[0] < victim[1][0]):
+                        victim = (ns, candidate)
+                if victim is None:
+                    # Everything left is pinned
+                    break
+                ns, (value, key, size) = victim
+                total -= ns.evict(key)
+                evicted += 1
+            logger.debug("Cache budget evicted %d entries, %d bytes in use", evicted, total)
+
+    @classmethod
+    def clear_all(cls):
+        """
+        Empty every namespace
+        :return: None
+        """
+        for ns in list(cls.namespaces.values()):
+            ns.clear()
+
+    @classmethod
+    def stats(cls):
+        """
+        :return: A list of namespace statistics dicts
+        """
+        return [ns.stats() for ns in list(cls.namespaces.values())]
+
+    @classmethod
+    def _apply_settings(cls, ns):
+        s = cls.settings.get(ns.name)
+        if not s:
+            return
+        try:
+            ns.configure(ttl=s.get("ttl"), max_entries=s.get("maxentries"), max_bytes=s.get("maxbytes"),
+                         eviction=s.get("eviction"), cost=s.get("cost"), disk_ttl=s.get("diskttl"))
+            logger.debug("Cache namespace %s configured: %s", ns.name, s)
+        except Exception as ex:
+            logger.error("Invalid cache settings for %s: %s", ns.name, str(ex))
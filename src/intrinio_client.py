@@ -0,0 +1,143 @@
+#
+# intrinio_client - Headless Intrinio client
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+# Usage outside of LibreOffice (e.g. a batch job or a notebook)
+#   from intrinio_client import IntrinioClient
+#   IntrinioClient.start({"user": "...", "password": "...", "diskcache": False})
+#   IntrinioClient.get_data_points([("AAPL", "close_price"), ("MSFT", "close_price")])
+#
+
+from intrinio_app_logger import AppLogger
+from intrinio_lib import QConfiguration, IntrinioBase
+from intrinio_engine import IntrinioEngine, IntrinioRequest
+from intrinio_cache import configure_caches
+from intrinio_cache_engine import CacheEngine
+from intrinio_disk_cache import DiskCache
+from intrinio_access import is_valid_identifier, validate_identifiers, get_data_point, get_data_points, \
+    get_historical_prices, get_historical_prices_range, refresh_historical_prices, get_historical_data, \
+    get_news, get_fundamentals_data, get_tags, get_financials_data, get_financials_statement, \
+    get_reported_fundamentals_data, get_reported_tags, get_reported_financials_data, \
+    get_reported_financials_statement, get_usage
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+
+class IntrinioClient:
+    """
+    The Intrinio data, cache and request APIs without LibreOffice. Importing the
+    modules does no I/O. Nothing is configured, read or written until start()
+    is called. The LOCalc extension (intrinio_impl) is an adapter over the same
+    functions.
+    """
+    started = False
+
+    # Data functions (see intrinio_access)
+    is_valid_identifier = staticmethod(is_valid_identifier)
+    validate_identifiers = staticmethod(validate_identifiers)
+    get_data_point = staticmethod(get_data_point)
+    get_data_points = staticmethod(get_data_points)
+    get_historical_prices = staticmethod(get_historical_prices)
+    get_historical_prices_range = staticmethod(get_historical_prices_range)
+    refresh_historical_prices = staticmethod(refresh_historical_prices)
+    get_historical_data = staticmethod(get_historical_data)
+    get_news = staticmethod(get_news)
+    get_fundamentals_data = staticmethod(get_fundamentals_data)
+    get_tags = staticmethod(get_tags)
+    get_financials_data = staticmethod(get_financials_data)
+    get_financials_statement = staticmethod(get_financials_statement)
+    get_reported_fundamentals_data = staticmethod(get_reported_fundamentals_data)
+    get_reported_tags = staticmethod(get_reported_tags)
+    get_reported_financials_data = staticmethod(get_reported_financials_data)
+    get_reported_financials_statement = staticmethod(get_reported_financials_statement)
+    get_usage = staticmethod(get_usage)
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def start(cls, settings=None, file_path=None, log_to_file=False):
+        """
+        Configure the client and start the request engine and caches
+        :param settings: Dict with the same keys as intrinio.conf. None loads intrinio.conf.
+        :param file_path: Folder of intrinio.conf, the log file and the disk cache
+        (intrinio_cache.db). None is the OS dependent folder used by the extension
+        when settings is None, and no folder (no disk cache) otherwise.
+        :param log_to_file: True to write intrinio-extension.log in the folder
+        :return: None
+        """
+        if settings is None:
+            folder = file_path if file_path is not None else QConfiguration.default_file_path()
+            if log_to_file:
+                AppLogger.log_to_file(folder)
+            QConfiguration.load(folder)
+        else:
+            folder = file_path or ""
+            if log_to_file and folder:
+                AppLogger.log_to_file(folder)
+            QConfiguration.configure(settings, folder)
+
+        # All requests run through the request engine
+        IntrinioEngine.configure(IntrinioBase.exec_api_request, QConfiguration.max_concurrency,
+                                 requests_per_second=QConfiguration.requests_per_second,
+                                 max_retries=QConfiguration.max_retries)
+        configure_caches()
+        cls.started = True
+
+    @classmethod
+    def stop(cls):
+        """
+        Write any queued disk cache entries and stop the request engine
+        :return: None
+        """
+        DiskCache.close()
+        IntrinioEngine.stop()
+        cls.started = False
+
+    @staticmethod
+    def fetch(endpoint, params=None):
+        """
+        Make one Intrinio API request through the request engine
+        :param endpoint: API endpoint path (e.g. /prices)
+        :param params: List of (name, value) pairs
+        :return: JSON decoded result dict with a status_code
+        """
+        return IntrinioEngine.run(IntrinioRequest(endpoint, params))
+
+    @staticmethod
+    def fetch_all(requests):
+        """
+        Make a set of Intrinio API requests concurrently
+        :param requests: List of (endpoint, params) pairs
+        :return: List of result dicts in the same order
+        """
+        return IntrinioEngine.run_all([IntrinioRequest(endpoint, params) for endpoint, params in requests])
+
+    @staticmethod
+    def cache_stats():
+        """
+        :return: A list of statistics dicts, one per cache
+        """
+        return CacheEngine.stats()
+
+    @staticmethod
+    def clear_caches():
+        """
+        Empty every in-memory cache. The disk cache is not changed.
+        :return: None
+        """
+        CacheEngine.clear_all()
@@ -0,0 +1,97 @@
+#
+# intrinio_columnar - Compact columnar storage for pages of dated rows
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import math
+import datetime
+from array import array
+
+
+def date_to_ordinal(iso_date):
+    """
+    Convert an ISO date string (YYYY-MM-DD) to a day ordinal
+    :param iso_date:
+    :return: int
+    """
+    return datetime.date(int(iso_date[0:4]), int(iso_date[5:7]), int(iso_date[8:10])).toordinal()
+
+
+def ordinal_to_date(ordinal):
+    """
+    Convert a day ordinal to an ISO date string
+    :param ordinal:
+    :return: YYYY-MM-DD
+    """
+    return datetime.date.fromordinal(ordinal).isoformat()
+
+
+def is_number(v):
+    return v is None or (isinstance(v, (int, float)) and not isinstance(v, bool))
+
+
+class ColumnarPage:
+    """
+    A page of API result rows (e.g. /prices or /historical_data) stored by column.
+    Dates are kept as an int32 array of day ordinals and numeric fields as arrays
+    of doubles (missing values are NaN). Any other field is kept as a list.
+    The non-data keys of the API result (result_count, total_pages, etc.) are kept in info.
+    Pages are merged into a TimeSeries (see intrinio_series), which answers the queries.
+    """
+    def __init__(self, info, dates, columns):
+        """
+        :param info: Dict of the API result keys other than data
+        :param dates: array('i') of day ordinals or None
+        :param columns: Dict of field name -> array('d') or list
+        """
+        self.info = info
+        self.dates = dates
+        self.columns = columns
+        self.row_count = len(dates) if dates is not None else \
+            (len(next(iter(columns.values()))) if columns else 0)
+
+    @classmethod
+    def from_result(cls, res):
+        """
+        Convert an API result with a list of row dicts in data
+        :param res: API result dict
+        :return: ColumnarPage
+        """
+        rows = res["data"]
+        info = {k: v for k, v in res.items() if k != "data"}
+        names = []
+        for row in rows:
+            for name in row:
+                if name not in names:
+                    names.append(name)
+
+        dates = None
+        columns = {}
+        for name in names:
+            values = [row.get(name) for row in rows]
+            if name == "date":
+                try:
+                    dates = array("i", [date_to_ordinal(v) for v in values])
+                    continue
+                except (TypeError, ValueError):
+                    pass
+            if all(is_number(v) for v in values):
+                columns[name] = array("d", [math.nan if v is None else v for v in values])
+            else:
+                columns[name] = values
+        return cls(info, dates, columns)
+
+    def __len__(self):
+        return self.row_count
@@ -16,7 +16,11 @@
 #
 
 from intrinio_app_logger import AppLogger
-from intrinio_lib import QConfiguration, IntrinioBase
+from intrinio_lib import IntrinioBase
+from intrinio_engine import IntrinioRequest
+from intrinio_cache import QueryCache, DAY
+from intrinio_cache_engine import CacheEngine
+from intrinio_master import CompaniesMaster
 from extn_helper import normalize_date
 
 # Logger init
@@ -32,85 +36,38 @@ class IntrinioCompanies(IntrinioBase):
     def get_companies_page(query, latest_filing_date, sequence):
         page_number = IntrinioCompanies.get_page_number(sequence)
 
-        template_url = "{0}/companies?page_size={1}&page_number={2}"
-        url_string = template_url.format(QConfiguration.base_url, IntrinioCompanies.page_size, page_number)
-        if query:
-            url_string += "&query=" + query
-        if latest_filing_date:
-            url_string += "&latest_filing_date=" + latest_filing_date
+        request = IntrinioRequest("/companies", [("page_size", IntrinioCompanies.page_size),
+                                                 ("page_number", page_number),
+                                                 ("query", query),
+                                                 ("latest_filing_date", latest_filing_date)])
 
-        # print (url_string)
-        res = IntrinioCompanies.exec_request(url_string)
+        res = IntrinioCompanies.submit(request)
         # print (res)
         return res
 
     @staticmethod
     def get_company_by_identifier(identifier):
-        template_url = "{0}/companies?identifier={1}"
-        url_string = template_url.format(QConfiguration.base_url, identifier)
+        request = IntrinioRequest("/companies", [("identifier", identifier)])
 
-        # print (url_string)
-        res = IntrinioCompanies.exec_request(url_string)
+        res = IntrinioCompanies.submit(request)
         # print (res)
         return res
 
 
-class CompaniesQueryCache:
-    query_values = {}
-
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def _query_key(query, latest_filing_date, page_number):
-        if not query:
-            query = "n1"
-        if not latest_filing_date:
-            latest_filing_date = "n3"
-        return query + "_" + latest_filing_date + "_" + str(page_number)
-
-    @classmethod
-    def is_query_value_cached(cls, query, latest_filing_date, page_number):
-        key = cls._query_key(query, latest_filing_date, page_number)
-        return key in cls.query_values
-
-    @classmethod
-    def get_query_value(cls, query, latest_filing_date, page_number):
-        key = cls._query_key(query, latest_filing_date, page_number)
-        # This returns the entire API call result (which can be a large dict)
-        return cls.query_values[key]
-
-    @classmethod
-    def add_query_value(cls, query_value, query, latest_filing_date, page_number):
-        key = cls._query_key(query, latest_filing_date, page_number)
-        cls.query_values[key] = query_value
-
-
-class CompaniesCache:
-    query_values = {}
-
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def _query_key(identifier):
-        return identifier
-
-    @classmethod
-    def is_query_value_cached(cls, identifier):
-        key = cls._query_key(identifier)
-        return key in cls.query_values
+class CompaniesQueryCache(QueryCache):
+    """
+    Used to track company list queries
+    """
+    # The key is (query, latest_filing_date, page_number)
+    namespace = CacheEngine.namespace("companies_queries", persist=True, disk_ttl=DAY)
 
-    @classmethod
-    def get_query_value(cls, identifier):
-        key = cls._query_key(identifier)
-        # This returns the entire API call result (which can be a large dict)
-        return cls.query_values[key]
 
-    @classmethod
-    def add_query_value(cls, query_value, identifier):
-        key = cls._query_key(identifier)
-        cls.query_values[key] = query_value
+class CompaniesCache(QueryCache):
+    """
+    Used to track company details
+    """
+    # The key is (identifier,)
+    namespace = CacheEngine.namespace("companies", persist=True, disk_ttl=DAY)
 
 
 def get_companies_by_query(query, latest_filing_date, sequence, item):
@@ -149,7 +106,7 @@ def get_companies_by_query(query, latest_filing_date, sequence, item):
     res = __get_companies(query, latest_filing_date, sequence)
 
     if "data" in res:
-        if len(res["data"]) > sequence:
+        if len(res["data"]) > page_index:
             if item in res["data"][page_index]:
                 v = res["data"][page_index][item]
             else:
@@ -171,6 +128,10 @@ def __get_companies(query, latest_filing_date, sequence):
         logger.warning(str(ex))
         return str(ex)
 
+    local_page = CompaniesMaster.get_query_page(query, None, latest_filing_date, page_number)
+    if local_page is not None:
+        return local_page
+
     if CompaniesQueryCache.is_query_value_cached(query, latest_filing_date, page_number):
         logger.debug("Cache hit for __get companies %s %s %d", query, latest_filing_date, sequence)
         query_value = CompaniesQueryCache.get_query_value(query, latest_filing_date, page_number)
@@ -16,7 +16,10 @@
 #
 
 from intrinio_app_logger import AppLogger
-from intrinio_lib import QConfiguration, IntrinioBase
+from intrinio_lib import IntrinioBase
+from intrinio_engine import IntrinioRequest
+from intrinio_cache import QueryCache, DAY
+from intrinio_cache_engine import CacheEngine
 from extn_helper import normalize_date
 
 # Logger init
@@ -32,51 +35,24 @@ class IntrinioCompanyFilings(IntrinioBase):
     def get_filings_page(identifier, report_type, start_date, end_date, sequence):
         page_number = IntrinioCompanyFilings.get_page_number(sequence)
 
-        template_url = "{0}/companies/filings?page_size={1}&page_number={2}&identifier={3}"
-        url_string = template_url.format(QConfiguration.base_url, IntrinioCompanyFilings.page_size, page_number,
-                                         identifier)
-        if report_type:
-            url_string += "&report_type=" + report_type
-        if start_date:
-            url_string += "&start_date=" + start_date
-        if end_date:
-            url_string += "&end_date=" + end_date
-
-        # print (url_string)
-        res = IntrinioCompanyFilings.exec_request(url_string)
+        request = IntrinioRequest("/companies/filings", [("page_size", IntrinioCompanyFilings.page_size),
+                                                         ("page_number", page_number),
+                                                         ("identifier", identifier),
+                                                         ("report_type", report_type),
+                                                         ("start_date", start_date),
+                                                         ("end_date", end_date)])
+
+        res = IntrinioCompanyFilings.submit(request)
         # print (res)
         return res
 
 
-class CompanyFilingsCache:
-    query_values = {}
-
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def _query_key(identifier, report_type, start_date, end_date, page_number):
-        if not start_date:
-            start_date = "n1"
-        if not end_date:
-            end_date = "n2"
-        return identifier + "_" + report_type + "_" + start_date + "_" + end_date + "_" + str(page_number)
-
-    @classmethod
-    def is_query_value_cached(cls, identifier, report_type, start_date, end_date, page_number):
-        key = cls._query_key(identifier, report_type, start_date, end_date, page_number)
-        return key in cls.query_values
-
-    @classmethod
-    def get_query_value(cls, identifier, report_type, start_date, end_date, page_number):
-        key = cls._query_key(identifier, report_type, start_date, end_date, page_number)
-        # This returns the entire API call result (which can be a large dict)
-        return cls.query_values[key]
-
-    @classmethod
-    def add_query_value(cls, query_value, identifier, report_type, start_date, end_date, page_number):
-        key = cls._query_key(identifier, report_type, start_date, end_date, page_number)
-        cls.query_values[key] = query_value
+class CompanyFilingsCache(QueryCache):
+    """
+    Used to track company SEC filings queries
+    """
+    # The key is (identifier, report_type, start_date, end_date, page_number)
+    namespace = CacheEngine.namespace("company_filings", persist=True, disk_ttl=DAY)
 
 
 def get_company_sec_filings(identifier, report_type, start_date, end_date, sequence, item):
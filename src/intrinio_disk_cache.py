@@ -0,0 +1,247 @@
+#
+# intrinio_disk_cache - Persistent SQLite tier for the in-memory caches
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import time
+import queue
+import atexit
+import threading
+from intrinio_app_logger import AppLogger
+# Not every embedded Python found in LO Calc includes sqlite3.
+# Without it, the disk cache is simply disabled.
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+
+class DiskCache:
+    """
+    A SQLite database of cache entries that survives LibreOffice restarts.
+    Entries are keyed by (namespace, key) and carry the namespace version that
+    wrote them, so bumping a namespace's version invalidates its old entries.
+    Reads are done on the calling thread. Writes are queued and committed in
+    batches by a background writer thread (write-behind). Writes of the same
+    entry are coalesced: only the last value queued before the writer reaches
+    it is encoded and written.
+    """
+    file_path = None
+    enabled = False
+    # Queue of (namespace, key) of the entries in pending
+    write_queue = None
+    # (namespace, key) -> (version, created, expires, value, encode)
+    pending = {}
+    pending_lock = threading.Lock()
+    writer = None
+    local = threading.local()
+    # Writes committed per transaction
+    batch_size = 200
+    _stop = object()
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def open(cls, file_path):
+        """
+        Open (and create as required) the cache database
+        :param file_path: Full path of the SQLite file
+        :return: True if the disk cache is available
+        """
+        cls.close()
+        if sqlite3 is None:
+            logger.warning("sqlite3 is not available, the disk cache is disabled")
+            return False
+        try:
+            cls.file_path = file_path
+            conn = cls._connection()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "namespace TEXT NOT NULL, "
+                         "key TEXT NOT NULL, "
+                         "version INTEGER NOT NULL, "
+                         "created REAL NOT NULL, "
+                         "expires REAL, "
+                         "value TEXT NOT NULL, "
+                         "PRIMARY KEY (namespace, key))")
+            conn.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires < ?", (time.time(),))
+            conn.commit()
+        except Exception as ex:
+            logger.error("Unable to open disk cache %s", file_path)
+            logger.error(str(ex))
+            return False
+
+        cls.pending = {}
+        cls.write_queue = queue.Queue()
+        cls.writer = threading.Thread(target=cls._write_behind, name="intrinio-disk-cache", daemon=True)
+        cls.writer.start()
+        cls.enabled = True
+        logger.debug("Disk cache opened: %s", file_path)
+        return True
+
+    @classmethod
+    def close(cls):
+        """
+        Write any queued entries and stop the writer thread
+        :return: None
+        """
+        if not cls.enabled:
+            return
+        cls.enabled = False
+        cls.write_queue.put(cls._stop)
+        cls.writer.join(timeout=10.0)
+        cls.writer = None
+        cls.write_queue = None
+
+    @classmethod
+    def get(cls, namespace, version, key):
+        """
+        Look up an entry
+        :param namespace: Namespace name
+        :param version: Namespace version. Entries written by another version are ignored.
+        :param key: tuple
+        :return: A tuple (found, value)
+        """
+        if not cls.enabled:
+            return False, None
+        try:
+            row = cls._connection().execute(
+                "SELECT version, expires, value FROM entries WHERE namespace=? AND key=?",
+                (namespace, cls._key(key))).fetchone()
+        except Exception as ex:
+            logger.error("Disk cache read failed: %s", str(ex))
+            return False, None
+        if row is None:
+            return False, None
+        entry_version, expires, value = row
+        if entry_version != version or (expires is not None and expires < time.time()):
+            return False, None
+        return True, json.loads(value)
+
+    @classmethod
+    def put(cls, namespace, version, key, value, ttl, encode=None):
+        """
+        Queue an entry to be written. An entry that is still queued is replaced.
+        :param namespace: Namespace name
+        :param version: Namespace version
+        :param key: tuple
+        :param value: JSON serializable value, or the argument of encode
+        :param ttl: Life time in seconds. None means the entry never expires.
+        :param encode: Function that converts value to its JSON serializable form.
+        It is called on the writer thread.
+        :return: None
+        """
+        if not cls.enabled:
+            return
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        entry_key = (namespace, cls._key(key))
+        with cls.pending_lock:
+            queued = entry_key in cls.pending
+            cls.pending[entry_key] = (version, now, expires, value, encode)
+        if not queued:
+            cls.write_queue.put(entry_key)
+
+    @classmethod
+    def flush(cls):
+        """
+        Wait until all queued entries have been written
+        :return: None
+        """
+        if cls.enabled:
+            cls.write_queue.join()
+
+    @classmethod
+    def clear(cls, namespace=None):
+        """
+        Delete all entries, or all entries of one namespace
+        :param namespace: Namespace name or None for everything
+        :return: None
+        """
+        if not cls.enabled:
+            return
+        cls.flush()
+        conn = cls._connection()
+        if namespace is None:
+            conn.execute("DELETE FROM entries")
+        else:
+            conn.execute("DELETE FROM entries WHERE namespace=?", (namespace,))
+        conn.commit()
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(list(key))
+
+    @classmethod
+    def _connection(cls):
+        # sqlite3 connections cannot be shared across threads, so each thread gets its own
+        conn = getattr(cls.local, "conn", None)
+        if conn is None or cls.local.file_path != cls.file_path:
+            conn = sqlite3.connect(cls.file_path, timeout=30.0)
+            cls.local.conn = conn
+            cls.local.file_path = cls.file_path
+        return conn
+
+    @classmethod
+    def _write_behind(cls):
+        """
+        The writer thread. Queued entries are committed in batches.
+        :return: None
+        """
+        write_queue = cls.write_queue
+        conn = cls._connection()
+        running = True
+        while running:
+            batch = [write_queue.get()]
+            while len(batch) < cls.batch_size:
+                try:
+                    batch.append(write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = []
+            for item in batch:
+                if item is cls._stop:
+                    running = False
+                    continue
+                with cls.pending_lock:
+                    entry = cls.pending.pop(item, None)
+                if entry is None:
+                    continue
+                namespace, key = item
+                version, created, expires, value, encode = entry
+                try:
+                    if encode is not None:
+                        value = encode(value)
+                    rows.append((namespace, key, version, created, expires, json.dumps(value)))
+                except (TypeError, ValueError) as ex:
+                    logger.error("Disk cache cannot store %s %s: %s", namespace, key, str(ex))
+            try:
+                if rows:
+                    conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", rows)
+                    conn.commit()
+            except Exception as ex:
+                logger.error("Disk cache write failed: %s", str(ex))
+            for item in batch:
+                write_queue.task_done()
+
+
+# Write any queued entries when the process exits
+atexit.register(DiskCache.close)
@@ -0,0 +1,421 @@
+#
+# intrinio_engine - Concurrent request engine for Intrinio API calls
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import asyncio
+import threading
+import time
+import random
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from intrinio_app_logger import AppLogger
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+
+class IntrinioRequest:
+    """
+    Describes a single Intrinio API request: an endpoint and its query parameters.
+    """
+    def __init__(self, endpoint, params=None):
+        """
+        :param endpoint: The API endpoint path (e.g. /prices)
+        :param params: A list of (name, value) pairs. Pairs with an empty value are omitted.
+        """
+        self.endpoint = endpoint
+        self.params = tuple((name, str(value)) for name, value in (params or []) if value is not None and value != "")
+
+    @property
+    def key(self):
+        """
+        The canonical form of the request, suitable for use as a dict key
+        :return: A tuple (endpoint, params)
+        """
+        return self.endpoint, self.params
+
+    def url(self, base_url):
+        """
+        Build the full URL for this request
+        :param base_url: e.g. https://api.intrinio.com
+        :return: URL string
+        """
+        if self.params:
+            return base_url + self.endpoint + "?" + urllib.parse.urlencode(self.params, safe=",")
+        return base_url + self.endpoint
+
+    def __repr__(self):
+        return "IntrinioRequest({0}, {1})".format(self.endpoint, self.params)
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket used to pace outgoing requests. Tokens accrue at
+    rate per second up to capacity. A caller reserves a token and is told how long
+    to wait before using it, so callers are served in the order they reserve.
+    """
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: Tokens per second. 0 means unlimited.
+        :param capacity: Maximum burst size. Defaults to one second's worth of tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity else max(1.0, rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token
+        :return: The number of seconds the caller must wait before using the token
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1.0
+            if self.tokens >= 0.0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self):
+        """
+        Return a reserved token that was not used
+        :return: None
+        """
+        if self.rate <= 0:
+            return
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1.0)
+
+
+class CacheMiss(Exception):
+    """
+    Raised by a blocking engine call made by a thread in cache only mode.
+    It describes what the call would have waited for, when that is known.
+    """
+    def __init__(self, requests=(), data_points=(), identifiers=()):
+        """
+        :param requests: IntrinioRequests
+        :param data_points: (identifier, item) pairs
+        :param identifiers: Identifiers to be verified
+        """
+        super().__init__("Not cached")
+        self.requests = list(requests)
+        self.data_points = list(data_points)
+        self.identifiers = list(identifiers)
+
+    def is_described(self):
+        """
+        :return: True if the miss says what it needs
+        """
+        return bool(self.requests or self.data_points or self.identifiers)
+
+
+class IntrinioEngine:
+    """
+    Runs Intrinio requests on a dedicated asyncio event loop thread. The number of
+    requests in flight at any one time is bounded by max_concurrency.
+    Coroutine callers can await fetch()/fetch_all(). Everyone else uses the blocking
+    facade run()/run_all().
+    Identical requests that are in flight at the same time are coalesced (single-flight):
+    the first caller performs the request and every other caller waits on its result.
+    Requests are paced by a token bucket. A request that is throttled by the server
+    (a result with a retry_status_codes status code) is retried with jittered
+    exponential backoff. If a negative_cache is set, failed results are remembered
+    by it and answered from it without calling the transport.
+    A thread can enter cache only mode (see cache_only()). Any engine call it makes
+    is answered from prefetched or raises CacheMiss instead of waiting for Intrinio.
+    A thread doing low priority work can enter background mode (see background())
+    and wait_for_foreground() before each call, so it only uses idle time.
+    """
+    # The function that actually executes a request: transport(IntrinioRequest) -> dict
+    transport = None
+    max_concurrency = 4
+    # Throttled requests are retried this many times
+    max_retries = 4
+    # The first backoff delay in seconds. The delay doubles on each retry.
+    backoff_base = 0.5
+    backoff_max = 30.0
+    retry_status_codes = (429, 503)
+    bucket = TokenBucket(0)
+    loop = None
+    thread = None
+    executor = None
+    semaphore = None
+    # Failed results: an object with lookup(request) -> result dict or None
+    # and add(request, result). None disables negative caching.
+    negative_cache = None
+    # In flight requests: IntrinioRequest.key -> asyncio.Task. Only touched on the loop thread.
+    inflight = {}
+    # The number of callers awaiting each in flight task
+    waiters = {}
+    # In flight tasks whose request has been handed to the transport
+    started = set()
+    start_lock = threading.Lock()
+    # Per thread state (cache_only, background)
+    local = threading.local()
+    # Blocking calls made by foreground threads that have not completed
+    foreground_calls = 0
+    foreground_idle = threading.Condition()
+    # Results fetched ahead of time (see intrinio_planner): IntrinioRequest.key -> result dict.
+    # Only threads in cache only mode are answered from it. It only holds the current planner round.
+    prefetched = {}
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def cache_only(cls, enabled):
+        """
+        Enter or leave cache only mode on the calling thread
+        :param enabled: True to make engine calls raise CacheMiss
+        :return: None
+        """
+        cls.local.cache_only = enabled
+
+    @classmethod
+    def is_cache_only(cls):
+        """
+        :return: True if the calling thread is in cache only mode
+        """
+        return getattr(cls.local, "cache_only", False)
+
+    @classmethod
+    def background(cls, enabled):
+        """
+        Enter or leave background mode on the calling thread. Calls made in
+        background mode are not counted as foreground calls.
+        :param enabled: True for background mode
+        :return: None
+        """
+        cls.local.background = enabled
+
+    @classmethod
+    def wait_for_foreground(cls, quiet=0.5):
+        """
+        Wait until no foreground call has been in progress for a while
+        :param quiet: Seconds without foreground calls
+        :return: None
+        """
+        with cls.foreground_idle:
+            while True:
+                while cls.foreground_calls > 0:
+                    cls.foreground_idle.wait()
+                if not cls.foreground_idle.wait(quiet) and cls.foreground_calls == 0:
+                    return
+
+    @classmethod
+    def _foreground_done(cls, future):
+        with cls.foreground_idle:
+            cls.foreground_calls -= 1
+            if cls.foreground_calls == 0:
+                cls.foreground_idle.notify_all()
+
+    @classmethod
+    def configure(cls, transport, max_concurrency, requests_per_second=0, max_retries=4):
+        """
+        Set the request transport and concurrency limit. A running engine is stopped
+        so that the new settings take effect on the next request.
+        :param transport: Callable that takes an IntrinioRequest and returns a result dict
+        :param max_concurrency: Maximum number of requests in flight
+        :param requests_per_second: Request rate limit. 0 means unlimited.
+        :param max_retries: Number of times a throttled request is retried
+        :return: None
+        """
+        cls.stop()
+        cls.transport = transport
+        cls.max_concurrency = max(1, max_concurrency)
+        cls.bucket = TokenBucket(requests_per_second)
+        cls.max_retries = max(0, max_retries)
+
+    @classmethod
+    def get_loop(cls):
+        """
+        Return the engine's event loop, starting the loop thread as required.
+        :return: asyncio event loop
+        """
+        with cls.start_lock:
+            if cls.loop is None:
+                loop = asyncio.new_event_loop()
+                cls.executor = ThreadPoolExecutor(max_workers=cls.max_concurrency, thread_name_prefix="intrinio")
+                cls.thread = threading.Thread(target=loop.run_forever, name="intrinio-engine", daemon=True)
+                cls.thread.start()
+                cls.loop = loop
+                logger.debug("Request engine started with max concurrency %d", cls.max_concurrency)
+            return cls.loop
+
+    @classmethod
+    def stop(cls):
+        """
+        Stop the event loop thread and release its workers
+        :return: None
+        """
+        with cls.start_lock:
+            if cls.loop is None:
+                return
+            cls.loop.call_soon_threadsafe(cls.loop.stop)
+            cls.thread.join()
+            cls.loop.close()
+            cls.executor.shutdown(wait=True)
+            cls.loop = None
+            cls.thread = None
+            cls.executor = None
+            cls.semaphore = None
+            cls.inflight = {}
+            cls.waiters = {}
+            cls.started = set()
+            logger.debug("Request engine stopped")
+
+    @classmethod
+    async def fetch(cls, request):
+        """
+        Execute a request. Must be awaited on the engine's event loop.
+        If an identical request is already in flight its result is shared.
+        :param request: IntrinioRequest
+        :return: Result dict
+        """
+        if cls.negative_cache is not None:
+            res = cls.negative_cache.lookup(request)
+            if res is not None:
+                logger.debug("Negative cache hit (%s) for %s", res.get("status_code"), request)
+                return res
+        key = request.key
+        task = cls.inflight.get(key)
+        if task is None:
+            task = cls.loop.create_task(cls._fetch(request))
+            cls.inflight[key] = task
+            task.add_done_callback(lambda t: cls._request_done(key, t))
+        else:
+            logger.debug("Joining in flight request %s", request)
+        cls.waiters[task] = cls.waiters.get(task, 0) + 1
+        try:
+            # Shield the shared task so that one cancelled waiter does not cancel the others
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # A request that no one is waiting for any more is dropped if it has not been sent
+            if cls.waiters.get(task) == 1 and task not in cls.started:
+                logger.debug("Dropping abandoned request %s", request)
+                task.cancel()
+            raise
+        finally:
+            count = cls.waiters.get(task, 0) - 1
+            if count > 0:
+                cls.waiters[task] = count
+            else:
+                cls.waiters.pop(task, None)
+
+    @classmethod
+    def _request_done(cls, key, task):
+        if cls.inflight.get(key) is task:
+            del cls.inflight[key]
+        cls.started.discard(task)
+
+    @classmethod
+    async def _fetch(cls, request):
+        # The semaphore is created on the loop thread so that it binds to the engine's loop
+        if cls.semaphore is None:
+            cls.semaphore = asyncio.Semaphore(cls.max_concurrency)
+        attempt = 0
+        while True:
+            async with cls.semaphore:
+                # Tokens are reserved by requests that are about to run, not by the
+                # whole queue, so a request dropped while queued costs nothing
+                delay = cls.bucket.reserve()
+                if delay > 0.0:
+                    try:
+                        await asyncio.sleep(delay)
+                    except asyncio.CancelledError:
+                        cls.bucket.refund()
+                        raise
+                cls.started.add(asyncio.current_task())
+                res = await cls.loop.run_in_executor(cls.executor, cls.transport, request)
+            if res.get("status_code") not in cls.retry_status_codes or attempt >= cls.max_retries:
+                if cls.negative_cache is not None:
+                    cls.negative_cache.add(request, res)
+                return res
+            # Full jitter keeps throttled callers from retrying in lock step
+            delay = random.uniform(0.0, min(cls.backoff_max, cls.backoff_base * (2 ** attempt)))
+            attempt += 1
+            logger.warning("Request throttled (%d), retry %d in %.2f sec: %s",
+                           res["status_code"], attempt, delay, request)
+            await asyncio.sleep(delay)
+
+    @classmethod
+    async def fetch_all(cls, requests):
+        """
+        Execute a set of requests concurrently. Must be awaited on the engine's event loop.
+        :param requests: Iterable of IntrinioRequest
+        :return: List of result dicts in the same order as requests
+        """
+        return await asyncio.gather(*[cls.fetch(request) for request in requests])
+
+    @classmethod
+    def submit(cls, coro):
+        """
+        Schedule a coroutine on the engine's event loop from any other thread
+        :param coro: The coroutine to be run
+        :return: A concurrent.futures.Future for the result
+        """
+        if cls.is_cache_only():
+            coro.close()
+            raise CacheMiss()
+        loop = cls.get_loop()
+        if threading.current_thread() is cls.thread:
+            raise RuntimeError("Blocking engine call made from the engine thread")
+        if getattr(cls.local, "background", False):
+            return asyncio.run_coroutine_threadsafe(coro, loop)
+        with cls.foreground_idle:
+            cls.foreground_calls += 1
+            cls.foreground_idle.notify_all()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        future.add_done_callback(cls._foreground_done)
+        return future
+
+    @classmethod
+    def run(cls, request):
+        """
+        Blocking facade for fetch()
+        :param request: IntrinioRequest
+        :return: Result dict
+        """
+        if cls.is_cache_only():
+            # The planner replaces prefetched after each round
+            prefetched = cls.prefetched
+            if request.key in prefetched:
+                return prefetched[request.key]
+            raise CacheMiss(requests=[request])
+        return cls.submit(cls.fetch(request)).result()
+
+    @classmethod
+    def run_all(cls, requests):
+        """
+        Blocking facade for fetch_all()
+        :param requests: Iterable of IntrinioRequest
+        :return: List of result dicts in the same order as requests
+        """
+        if cls.is_cache_only():
+            requests = list(requests)
+            prefetched = cls.prefetched
+            missing = [request for request in requests if request.key not in prefetched]
+            if missing:
+                raise CacheMiss(requests=missing)
+            return [prefetched[request.key] for request in requests]
+        return cls.submit(cls.fetch_all(requests)).result()
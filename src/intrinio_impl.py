@@ -37,11 +37,15 @@ if cmd_folder not in sys.path:
 # Local imports go here
 from intrinio_app_logger import AppLogger
 from intrinio_lib import IntrinioBase, QConfiguration
-from intrinio_access import intrinio_login, is_valid_identifier, get_data_point, \
-    get_historical_prices, get_historical_data, get_news, get_fundamentals_data, get_tags, \
+from intrinio_client import IntrinioClient
+from intrinio_login import intrinio_login
+from intrinio_access import is_valid_identifier, validate_identifiers, get_data_point, \
+    get_historical_prices, get_historical_prices_range, get_historical_data, get_news, get_fundamentals_data, get_tags, \
     get_financials_data, get_reported_fundamentals_data, get_reported_tags, get_reported_financials_data, \
-    get_usage
+    get_financials_statement, get_reported_financials_statement, get_usage
 from intrinio_cache import UsageDataCache
+from intrinio_volatile import async_result
+from intrinio_warmup import WarmUpManifest, recorded
 from intrinio_indices import get_indices_by_query_count, get_indices_by_query, get_indices_by_query_tag_count, \
     get_indices_by_query_tag, get_index_by_identifier_tag_count, get_index_by_identifier_tag, \
     get_index_by_identifier
@@ -59,21 +63,27 @@ import xml.etree.ElementTree as etree
 # Logger init
 the_app_logger = AppLogger("intrinio-extension")
 logger = the_app_logger.getAppLogger()
-# Extract version from description.xml
-tree = etree.parse(cmd_folder + "/description.xml")
-root = tree.getroot()
-nodes = root.findall('{http://openoffice.org/extensions/description/2006}version')
-logger.info("Intrinio-LOCalc Version: %s", nodes[0].attrib["value"])
 
 
 class IntrinioImpl(unohelper.Base, XIntrinio ):
-    """Define the main class for the Intrinio LO Calc extension """
+    """
+    Define the main class for the Intrinio LO Calc extension.
+    Methods that return a single value are decorated with async_result so that
+    they can return volatile results (see the asyncresults setting). Array
+    functions always return their value directly and are decorated with recorded.
+    Both decorators record calls for the warm up manifest.
+    """
     def __init__( self, ctx ):
         self.ctx = ctx
+        _start_client()
         logger.debug("IntrinioImpl initialized")
         logger.debug("self: %s", str(self))
         logger.debug("ctx: %s", str(ctx))
+        # Replaying calls needs Intrinio credentials, so it never triggers the login dialog
+        if QConfiguration.warm_up and QConfiguration.is_configured():
+            WarmUpManifest.start(self, lambda: _workbook_url(ctx))
 
+    @async_result
     def IntrinioUsage(self, accesscode, key):
         """
         Return usage data for Intrinio API
@@ -87,6 +97,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
             return "No configuration"
         return get_usage(accesscode, key)
 
+    @async_result
     def IntrinioDataPoint(self, identifier, item):
         """
         Retrieve a single data point for an identifier/item combination.
@@ -106,6 +117,25 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return get_data_point(identifier, item)
 
+    @recorded
+    def IntrinioValidateIdentifiers(self, identifiers):
+        """
+        Validate a whole range of identifiers at once. Identifiers that are not
+        already known are verified concurrently.
+        :param identifiers: An identifier or a cell range of identifiers
+        :return: A tuple of row tuples of booleans, the same shape as identifiers
+        """
+        logger.debug("IntrinioValidateIdentifiers called: %s", identifiers)
+        if not _check_configuration():
+            return (("No configuration",),)
+        rows = identifiers if isinstance(identifiers, tuple) else ((identifiers,),)
+        rows = [row if isinstance(row, tuple) else (row,) for row in rows]
+        # Calc delivers numbers (e.g. an empty cell) as floats
+        cells = [v if isinstance(v, str) else "" for row in rows for v in row]
+        verdicts = iter(validate_identifiers(cells))
+        return tuple(tuple(next(verdicts) for v in row) for row in rows)
+
+    @async_result
     def IntrinioHistoricalPrices(self, ticker, item, sequencenumber, startdate, enddate, frequency):
         """
         Return a single price of type 'item' for ticker symbol 'ticker'.
@@ -129,6 +159,42 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return get_historical_prices(ticker, item, sequencenumber, startdate, enddate, frequency)
 
+    @recorded
+    def IntrinioHistoricalPricesRange(self, ticker, items, startdate, enddate, frequency, maxrows):
+        """
+        Return a block of prices for ticker symbol 'ticker' as an array result.
+        Row n holds what IntrinioHistoricalPrices returns for sequence number n.
+        :param ticker:
+        :param items: Comma separated list of items or a cell range of items
+        :param startdate:
+        :param enddate:
+        :param frequency:
+        :param maxrows: Maximum number of rows. Empty or 0 for all rows.
+        :return: A tuple of row tuples
+        """
+        logger.debug("IntrinioHistoricalPricesRange called: %s %s %s %s %s %s", ticker, items, startdate, enddate,
+                     frequency, maxrows)
+        if not _check_configuration():
+            return (("No configuration",),)
+        if not is_valid_identifier(ticker):
+            logger.debug("Invalid ticker symbol %s", ticker)
+            return (("Invalid ticker symbol",),)
+        item_list = _item_list(items)
+        if not item_list:
+            return (("Invalid item",),)
+        try:
+            max_rows = int(maxrows) if maxrows else 0
+        except (TypeError, ValueError):
+            return (("Invalid maxrows",),)
+
+        rows = get_historical_prices_range(ticker, item_list, startdate, enddate, frequency, max_rows)
+        if isinstance(rows, str):
+            return ((rows,),)
+        if not rows:
+            return (tuple("" for item in item_list),)
+        return tuple(tuple(row) for row in rows)
+
+    @async_result
     def IntrinioHistoricalData(self, identifier, item, sequence_number, startdate, enddate, frequency, periodtype, showdate):
         """
         Returns the historical data for for a selected identifier (ticker symbol or index symbol) for a selected tag.
@@ -155,6 +221,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
         return get_historical_data(identifier, item, sequence_number, startdate, enddate, frequency, periodtype,
                                    showdate)
 
+    @async_result
     def IntrinioNews(self, identifier, item, sequence_number):
         """
         Returns the historical data for for a selected identifier (ticker symbol or index symbol) for a selected tag.
@@ -178,6 +245,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
             v = date_str_to_float(v)
         return v
 
+    @async_result
     def IntrinioFundamentals(self, ticker, statement, period_type, sequence_number, item):
         """
         Returns a list of available standardized fundamentals.
@@ -205,6 +273,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
         #     v = date_str_to_float(v)
         return v
 
+    @async_result
     def IntrinioTags(self, identifier, statement, sequence_number, item):
         """
         Returns the standardized tags and labels for a given ticker, statement, and date or fiscal year/fiscal quarter.
@@ -228,6 +297,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
         v = get_tags(identifier, statement, sequence_number, item)
         return v
 
+    @async_result
     def IntrinioFinancials(self, ticker, statement, fiscalyear, fiscalperiod, tag, rounding):
         """
         Returns professional-grade historical financial data.
@@ -253,23 +323,38 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
         v = get_financials_data(ticker, statement, fiscalyear, fiscalperiod, tag)
 
         # Apply rounding factor to numeric values
-        try:
-            v = float(v)
-            if rounding:
-                rounding = str(rounding).upper()
-                logger.debug("Applying rounding %s", rounding)
-                rf = 1.0
-                if rounding == "K":
-                    rf = 1000.0
-                elif rounding == "M":
-                    rf = 1000000.0
-                elif rounding == "B":
-                    rf = 1000000000.0
-            v = v / rf
-        except:
-            pass
-        return v
+        return _apply_rounding(v, rounding)
+
+    @recorded
+    def IntrinioFinancialsStatement(self, ticker, statement, fiscalyear, fiscalperiod, rounding):
+        """
+        Returns an entire standardized statement as an array of tag, name and value rows.
+        The rows are in the order of the statement's standardized tags.
+        :param ticker:
+        :param statement:
+        :param fiscalyear:
+        :param fiscalperiod:
+        :param rounding:
+        :return: A tuple of row tuples
+        """
+        logger.debug("IntrinioFinancialsStatement called: %s %s %d %s %s", ticker, statement, fiscalyear,
+                     fiscalperiod, rounding)
+        if not _check_configuration():
+            return (("No configuration",),)
+        if not is_valid_identifier(ticker):
+            logger.debug("Invalid ticker %s", ticker)
+            return (("Invalid ticker",),)
+        if not statement:
+            return (("Invalid statement",),)
 
+        rows = get_financials_statement(ticker, statement, fiscalyear, fiscalperiod)
+        if isinstance(rows, str):
+            return ((rows,),)
+        if not rows:
+            return (("", "", ""),)
+        return tuple((tag, name, _apply_rounding(v, rounding)) for tag, name, v in rows)
+
+    @async_result
     def IntrinioReportedFundamentals(self, ticker, statement, period_type, sequence_number, item):
         """
         Returns a list of available as reported fundamentals.
@@ -294,6 +379,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
         v = get_reported_fundamentals_data(ticker, statement, period_type, sequence_number, item)
         return v
 
+    @async_result
     def IntrinioReportedTags(self, identifier, statement, fiscal_year, fiscal_period, sequence_number, item):
         """
         Returns the as reported XBRL tags and labels for a given ticker, statement, and date or fiscal year/fiscal quarter.
@@ -317,6 +403,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
         v = get_reported_tags(identifier, statement, fiscal_year, fiscal_period, sequence_number, item)
         return v
 
+    @async_result
     def IntrinioReportedFinancials(self, ticker, statement, fiscalyear, fiscalperiod, xbrltag, xbrldomain):
         """
         Returns the As Reported Financials directly from the financial statements of the XBRL filings from the company.
@@ -344,6 +431,37 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
         v = get_reported_financials_data(ticker, statement, fiscalyear, fiscalperiod, xbrltag, xbrldomain)
         return v
 
+    @recorded
+    def IntrinioReportedFinancialsStatement(self, ticker, statement, fiscalyear, fiscalperiod, rounding):
+        """
+        Returns an entire as reported statement as an array of xbrl tag, domain tag, name and value rows.
+        The rows are in the order of the statement's as reported tags.
+        :param ticker:
+        :param statement:
+        :param fiscalyear:
+        :param fiscalperiod:
+        :param rounding:
+        :return: A tuple of row tuples
+        """
+        logger.debug("IntrinioReportedFinancialsStatement called: %s %s %d %s %s", ticker, statement, fiscalyear,
+                     fiscalperiod, rounding)
+        if not _check_configuration():
+            return (("No configuration",),)
+        if not is_valid_identifier(ticker):
+            logger.debug("Invalid ticker %s", ticker)
+            return (("Invalid ticker",),)
+        if not statement:
+            return (("Invalid statement",),)
+
+        rows = get_reported_financials_statement(ticker, statement, fiscalyear, fiscalperiod)
+        if isinstance(rows, str):
+            return ((rows,),)
+        if not rows:
+            return (("", "", "", ""),)
+        return tuple((xbrl_tag, domain_tag, name, _apply_rounding(v, rounding))
+                     for xbrl_tag, domain_tag, name, v in rows)
+
+    @async_result
     def IntrinioBankFundamentals(self, ticker, statement, period_type, sequence_number, item):
         """
         Returns a list of available bank fundamentals.
@@ -369,6 +487,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
         #     return "No configuration"
         return "Not implemented"
 
+    @async_result
     def IntrinioBankTags(self, identifier, statement, sequence_number, item):
         """
         Returns the as reported XBRL tags and labels for a given ticker, statement, and date or fiscal year/fiscal quarter.
@@ -390,6 +509,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
         #     return "No configuration"
         return "Not implemented"
 
+    @async_result
     def IntrinioBankFinancials(self, ticker, statement, fiscalyear, fiscalperiod, xbrltag, xbrldomain):
         """
         Returns the As Reported Financials directly from the financial statements of the XBRL filings from the company.
@@ -414,6 +534,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
         # return v
         return "Not implemented"
 
+    @async_result
     def IntrinioIndicesQuery(self, query, indextype, sequence, item):
         """
         Returns a single data item for a selected index.
@@ -430,6 +551,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioIndicesQueryCount(self, query, indextype):
         """
         Returns the count of indices in the resultant list.
@@ -444,6 +566,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioIndicesQueryTagCount(self, query, indextype):
         """
         Returns the number of tags/items that are available for an index.
@@ -458,6 +581,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioIndicesQueryTag(self, query, indextype, sequence):
         """
         Returns a tag/item name for a selected index.
@@ -474,6 +598,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioIndex(self, identifier, item):
         """
         Returns a single data item for the given index.
@@ -488,6 +613,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioIndexTagCount(self, identifier):
         """
         Returns the number of tags/items that are available for an index.
@@ -501,6 +627,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioIndexTag(self, identifier, sequencenumber):
         """
         Returns a tag/item name for an index.
@@ -515,6 +642,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioCompaniesQuery(self, query, latestfilingdate, sequence, item):
         """
         Returns a single data item for a selected company.
@@ -532,6 +660,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioCompaniesQueryCount(self, query, latestfilingdate):
         """
         Returns the count of companies in the resultant list.
@@ -547,6 +676,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioCompaniesQueryTagCount(self, query, latestfilingdate):
         """
         Returns the number of tags/items that are available for a company.
@@ -562,6 +692,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioCompaniesQueryTag(self, query, latestfilingdate, sequence):
         """
         Returns a tag/item name for a selected company.
@@ -578,6 +709,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioCompany(self, identifier, item):
         """
         No cost lookup of security by identifier. See http://docs.intrinio.com/?javascript--api#securities.
@@ -601,6 +733,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioCompanyTagCount(self, identifier):
         """
         Returns the number of tags/items available for a company.
@@ -615,6 +748,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioCompanyTag(self, identifier, sequence):
         """
         Returns a tag/item value.
@@ -630,6 +764,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioSecuritiesQuery(self, query, exchangesymbol, lastcrspadjdate, sequence, item):
         """
         No cost query for securities info. See http://docs.intrinio.com/?javascript--api#securities.
@@ -649,6 +784,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioSecuritiesQueryCount(self, query, exchangesymbol, lastcrspadjdate):
         """
         Returns the results count for a query of securities.
@@ -666,6 +802,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioSecuritiesQueryTagCount(self, query, exchangesymbol, lastcrspadjdate):
         """
         Returns the number of tags/items available for a queried security.
@@ -683,6 +820,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioSecuritiesQueryTag(self, query, exchangesymbol, lastcrspadjdate, sequence):
         """
         Returns the name of an available tag/item for a queried security.
@@ -701,6 +839,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioSecurity(self, identifier, item):
         """
         Returns a data item for a security.
@@ -724,6 +863,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioSecurityTagCount(self, identifier):
         """
         Returns the count of available tags/items for a security.
@@ -738,6 +878,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioSecurityTag(self, identifier, sequence):
         """
 
@@ -753,6 +894,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioCompanySECFilings(self, identifier, report_type, start_date, end_date, sequence, item):
         """
         Returns a data item from the list of SEC filings for a company
@@ -771,6 +913,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioCompanySECFilingsCount(self, identifier, report_type, start_date, end_date):
         """
         Returns the number of filings for the report type and date range.
@@ -787,6 +930,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioCompanySECFilingsTagCount(self):
         """
         Returns the number of tags/items available for a filing.
@@ -799,6 +943,7 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
 
         return v
 
+    @async_result
     def IntrinioCompanySECFilingsTag(self, sequence):
         """
         Returns a tag/item name.
@@ -813,6 +958,82 @@ class IntrinioImpl(unohelper.Base, XIntrinio ):
         return v
 
 
+def _apply_rounding(v, rounding):
+    """
+    Scale a numeric financials value by a rounding factor
+    :param v: The value
+    :param rounding: K | M | B or empty for none
+    :return: The scaled value as a float, or v unchanged if it is not numeric
+    """
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        return v
+    if rounding:
+        rounding = str(rounding).upper()
+        if rounding == "K":
+            v = v / 1000.0
+        elif rounding == "M":
+            v = v / 1000000.0
+        elif rounding == "B":
+            v = v / 1000000000.0
+    return v
+
+
+def _item_list(items):
+    """
+    Normalize an items argument to a list of item names
+    :param items: A comma separated string or a cell range (tuple of row tuples)
+    :return: List of item names
+    """
+    if isinstance(items, str):
+        names = items.split(",")
+    elif isinstance(items, tuple):
+        names = [str(v) for row in items for v in (row if isinstance(row, tuple) else (row,))]
+    else:
+        return []
+    return [name.strip() for name in names if name.strip()]
+
+
+# Serializes starting the client
+start_lock = threading.Lock()
+
+def _start_client():
+    """
+    Start the client from intrinio.conf with logging to the extension's log file.
+    Only the first call does anything.
+    :return: None
+    """
+    with start_lock:
+        if IntrinioClient.started:
+            return
+        IntrinioClient.start(log_to_file=True)
+    # Extract version from description.xml
+    tree = etree.parse(cmd_folder + "/description.xml")
+    root = tree.getroot()
+    nodes = root.findall('{http://openoffice.org/extensions/description/2006}version')
+    logger.info("Intrinio-LOCalc Version: %s", nodes[0].attrib["value"])
+
+
+def _workbook_url(ctx):
+    """
+    Add-in calls do not identify their document, so a call's workbook is the
+    document that is current when the call is made
+    :param ctx: The component context
+    :return: The URL of the current document or "" if there is none
+    """
+    if ctx is None:
+        return ""
+    try:
+        desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+        document = desktop.getCurrentComponent()
+        if document is not None:
+            return document.getURL()
+    except Exception as ex:
+        logger.error("Unable to determine the current document: %s", str(ex))
+    return ""
+
+
 # Configuration lock. Used to deal with the fact that sometimes
 # LO Calc makes concurrent calls into the extension.
 dialog_lock = threading.Lock()
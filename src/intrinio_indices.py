@@ -16,7 +16,10 @@
 #
 
 from intrinio_app_logger import AppLogger
-from intrinio_lib import QConfiguration, IntrinioBase
+from intrinio_lib import IntrinioBase
+from intrinio_engine import IntrinioRequest
+from intrinio_cache import QueryCache, DAY
+from intrinio_cache_engine import CacheEngine
 
 # Logger init
 app_logger = AppLogger("intrinio-extension")
@@ -31,85 +34,38 @@ class IntrinioIndices(IntrinioBase):
     def get_indices_page(query, index_type, sequence):
         page_number = IntrinioIndices.get_page_number(sequence)
 
-        template_url = "{0}/indices?page_size={1}&page_number={2}"
-        url_string = template_url.format(QConfiguration.base_url, IntrinioIndices.page_size, page_number)
-        if query:
-            url_string += "&query=" + query
-        if index_type:
-            url_string += "&type=" + index_type
+        request = IntrinioRequest("/indices", [("page_size", IntrinioIndices.page_size),
+                                               ("page_number", page_number),
+                                               ("query", query),
+                                               ("type", index_type)])
 
-        # print (url_string)
-        res = IntrinioIndices.exec_request(url_string)
+        res = IntrinioIndices.submit(request)
         # print (res)
         return res
 
     @staticmethod
     def get_index_by_identifier(identifier):
-        template_url = "{0}/indices?identifier={1}"
-        url_string = template_url.format(QConfiguration.base_url, identifier)
+        request = IntrinioRequest("/indices", [("identifier", identifier)])
 
-        # print (url_string)
-        res = IntrinioIndices.exec_request(url_string)
+        res = IntrinioIndices.submit(request)
         # print (res)
         return res
 
 
-class IndicesQueryCache:
+class IndicesQueryCache(QueryCache):
     """
-    Used to track news queries
+    Used to track index list queries
     """
-    # The key is a compound value consisting of the ticker, statement and page number.
-    query_values = {}
-
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def _query_key(query, index_type, page_number):
-        return query + "_" + index_type + "_" + str(page_number)
-
-    @classmethod
-    def is_query_value_cached(cls, query, index_type, page_number):
-        key = cls._query_key(query, index_type, page_number)
-        return key in cls.query_values
-
-    @classmethod
-    def get_query_value(cls, query, index_type, page_number):
-        key = cls._query_key(query, index_type, page_number)
-        # This returns the entire API call result (which can be a large dict)
-        return cls.query_values[key]
-
-    @classmethod
-    def add_query_value(cls, query_value, query, index_type, page_number):
-        key = cls._query_key(query, index_type, page_number)
-        cls.query_values[key] = query_value
+    # The key is (query, index_type, page_number)
+    namespace = CacheEngine.namespace("indices_queries", persist=True, disk_ttl=DAY)
 
 
-class IndexCache:
-    query_values = {}
-
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def _query_key(identifier):
-        return identifier
-
-    @classmethod
-    def is_query_value_cached(cls, identifier):
-        key = cls._query_key(identifier)
-        return key in cls.query_values
-
-    @classmethod
-    def get_query_value(cls, identifier):
-        key = cls._query_key(identifier)
-        # This returns the entire API call result (which can be a large dict)
-        return cls.query_values[key]
-
-    @classmethod
-    def add_query_value(cls, query_value, identifier):
-        key = cls._query_key(identifier)
-        cls.query_values[key] = query_value
+class IndexCache(QueryCache):
+    """
+    Used to track index details
+    """
+    # The key is (identifier,)
+    namespace = CacheEngine.namespace("indices", persist=True, disk_ttl=DAY)
 
 
 def get_indices_by_query(query, index_type, sequence, item):
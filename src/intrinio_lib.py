@@ -15,16 +15,20 @@
 # along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import urllib.request
-import urllib.parse
-import urllib.error
+import http.client
 import json
 import os
 import os.path
 import ssl
 import math
 import inspect
+import base64
+import threading
+import asyncio
+import concurrent.futures
 from intrinio_app_logger import AppLogger
+from intrinio_session import IntrinioSession
+from intrinio_engine import IntrinioEngine, IntrinioRequest, CacheMiss
 
 
 # Logger init
@@ -49,23 +53,60 @@ class QConfiguration:
     do_not_ask_again = False
     # Default cache life to 3 minutes
     cache_life = 60 * 3
+    # Maximum number of pooled HTTPS connections
+    max_connections = 4
+    # Maximum number of concurrent requests run by the request engine
+    max_concurrency = 4
+    # Data point requests arriving within this many milliseconds are sent together. 0 disables batching.
+    batch_window = 20
+    # Pace requests to stay under the plan's requests/second throttle. 0 disables pacing.
+    requests_per_second = 10.0
+    # Number of times a request throttled by Intrinio (429/503) is retried
+    max_retries = 4
+    # Per cache namespace overrides: name -> {"ttl", "maxentries", "maxbytes", "eviction"}
+    cache_settings = {}
+    # Total memory budget in MB for all in-memory caches. 0 means unlimited.
+    cache_budget = 256
+    # Keep cached query results in a SQLite database so they survive restarts
+    disk_cache = True
+    # Answer identifier validation and securities/companies listings from a local master list
+    master_index = False
+    # Return volatile results from Calc functions and fetch uncached data in the background
+    async_results = False
+    # Replay the calls a workbook made last time to warm the caches when the extension loads
+    warm_up = False
+    # Built once by load() and shared by all HTTPS connections
+    ssl_context = None
+    # Preemptive basic authorization header value
+    auth_header = ""
 
     @classmethod
-    def load(cls):
+    def default_file_path(cls):
+        """
+        The OS dependent folder of intrinio.conf, the log file and the disk cache
+        :return: Folder path ending with a separator
+        """
+        if os.name == "posix":
+            # Linux or OS X
+            return "{0}/libreoffice/intrinio/".format(os.environ["HOME"])
+        elif os.name == "nt":
+            # Windows
+            return "{0}\\libreoffice\\intrinio\\".format(os.environ["LOCALAPPDATA"])
+        return ""
+
+    @classmethod
+    def load(cls, file_path=None):
         """
         Load credentials from configuration file. The location of the intrinio.conf
         file is OS dependent. The permissions of the intrinio.conf file should allow
         access ONLY by the user.
+        :param file_path: Folder of intrinio.conf. None for the OS dependent default.
         :return: None
         """
         file_name = "intrinio.conf"
+        cls.file_path = file_path if file_path is not None else cls.default_file_path()
         if os.name == "posix":
-            # Linux or OS X
-            cls.file_path = "{0}/libreoffice/intrinio/".format(os.environ["HOME"])
             cls.macOS = (os.uname()[0] == "Darwin")
-        elif os.name == "nt":
-            # Windows
-            cls.file_path = "{0}\\libreoffice\\intrinio\\".format(os.environ["LOCALAPPDATA"])
 
         # Create directory if it doesn't exist
         # In reality, the directory should exist because the logger also checks
@@ -80,10 +121,7 @@ class QConfiguration:
             cfj = json.loads(cf.read())
             cls.auth_user = cfj["user"]
             cls.auth_passwd = cfj["password"]
-            if "loglevel" in cfj:
-                cls.loglevel = cfj["loglevel"]
-            if "cachelife" in cfj:
-                cls.cache_life = int(cfj["cachelife"])
+            cls.apply_settings(cfj)
             cf.close()
         except FileNotFoundError as ex:
             logger.error("%s was not found", cls.full_file_path)
@@ -91,21 +129,83 @@ class QConfiguration:
             logger.error("An exception occurred while attempting to load intrinio.conf")
             logger.error(str(ex))
 
-        # Either the default or the config override
-        the_app_logger.set_log_level(cls.loglevel)
+        cls.cacerts = cls.default_cacerts()
+        cls._initialize()
 
-        # Set up path to certs
+    @classmethod
+    def configure(cls, settings, file_path=""):
+        """
+        Configure from a dict instead of intrinio.conf. Nothing is read or written.
+        :param settings: Dict with the same keys as intrinio.conf. The certifi key,
+        if present, is the path of the certificate file.
+        :param file_path: Folder used by save() and for the disk cache, or "" for none
+        :return: None
+        """
+        cls.file_path = file_path
+        cls.full_file_path = file_path + "intrinio.conf" if file_path else ""
+        cls.auth_user = settings.get("user", "")
+        cls.auth_passwd = settings.get("password", "")
+        cls.apply_settings(settings)
+        cls.cacerts = settings.get("certifi") or cls.default_cacerts()
+        cls._initialize()
+
+    @classmethod
+    def apply_settings(cls, cfj):
+        """
+        Apply the optional settings of an intrinio.conf dict
+        :param cfj: Dict of settings
+        :return: None
+        """
+        if "loglevel" in cfj:
+            cls.loglevel = cfj["loglevel"]
+        if "cachelife" in cfj:
+            cls.cache_life = int(cfj["cachelife"])
+        if "maxconnections" in cfj:
+            cls.max_connections = int(cfj["maxconnections"])
+        if "maxconcurrency" in cfj:
+            cls.max_concurrency = int(cfj["maxconcurrency"])
+        if "batchwindow" in cfj:
+            cls.batch_window = int(cfj["batchwindow"])
+        if "requestspersecond" in cfj:
+            cls.requests_per_second = float(cfj["requestspersecond"])
+        if "maxretries" in cfj:
+            cls.max_retries = int(cfj["maxretries"])
+        if "caches" in cfj:
+            cls.cache_settings = cfj["caches"]
+        if "cachebudget" in cfj:
+            cls.cache_budget = int(cfj["cachebudget"])
+        if "diskcache" in cfj:
+            cls.disk_cache = bool(cfj["diskcache"])
+        if "masterindex" in cfj:
+            cls.master_index = bool(cfj["masterindex"])
+        if "asyncresults" in cfj:
+            cls.async_results = bool(cfj["asyncresults"])
+        if "warmup" in cfj:
+            cls.warm_up = bool(cfj["warmup"])
+
+    @classmethod
+    def default_cacerts(cls):
+        """
+        The embedded versio of Python found in some versions of LO Calc
+        does not handle certificates. Here we compensate by using the certificate
+        package from the certifi project: https://github.com/certifi/python-certifi
+        :return: The path of the cacert.pem file next to this module
+        """
         cls.cwd = os.path.realpath(os.path.abspath
                                           (os.path.split(inspect.getfile
                                                          (inspect.currentframe()))[0]))
-        # The embedded versio of Python found in some versions of LO Calc
-        # does not handle certificates. Here we compensate by using the certificate
-        # package from the certifi project: https://github.com/certifi/python-certifi
-        if os.name == "posix":
-            cls.cacerts = "{0}/cacert.pem".format(cls.cwd)
-        elif os.name == "nt":
+        if os.name == "nt":
             # This may not be necessary in Windows
-            cls.cacerts = "{0}\\cacert.pem".format(cls.cwd)
+            return "{0}\\cacert.pem".format(cls.cwd)
+        return "{0}/cacert.pem".format(cls.cwd)
+
+    @classmethod
+    def _initialize(cls):
+        # Either the default or the config override
+        the_app_logger.set_log_level(cls.loglevel)
+
+        cls.ssl_context = cls.create_ssl_context()
+        cls.auth_header = cls.create_auth_header()
 
         cls.log_configuration()
 
@@ -117,6 +217,7 @@ class QConfiguration:
         """
         cls.auth_user = username
         cls.auth_passwd = password
+        cls.auth_header = cls.create_auth_header()
 
         # Make sure folders exist
         if not os.path.exists(cls.file_path):
@@ -128,6 +229,18 @@ class QConfiguration:
         conf["certifi"] = cls.cacerts
         conf["loglevel"] = cls.loglevel
         conf["cachelife"] = cls.cache_life
+        conf["maxconnections"] = cls.max_connections
+        conf["maxconcurrency"] = cls.max_concurrency
+        conf["batchwindow"] = cls.batch_window
+        conf["requestspersecond"] = cls.requests_per_second
+        conf["maxretries"] = cls.max_retries
+        conf["cachebudget"] = cls.cache_budget
+        conf["diskcache"] = cls.disk_cache
+        conf["masterindex"] = cls.master_index
+        conf["asyncresults"] = cls.async_results
+        conf["warmup"] = cls.warm_up
+        if cls.cache_settings:
+            conf["caches"] = cls.cache_settings
 
         logger.debug("Saving configuration to %s", cls.full_file_path)
         cf = open(cls.full_file_path, "w")
@@ -149,6 +262,38 @@ class QConfiguration:
         logger.info("certifi: %s", cls.cacerts)
         logger.info("loglevel: %s", cls.loglevel)
         logger.info("cachelife: %d", cls.cache_life)
+        logger.info("maxconnections: %d", cls.max_connections)
+        logger.info("maxconcurrency: %d", cls.max_concurrency)
+        logger.info("batchwindow: %d", cls.batch_window)
+        logger.info("requestspersecond: %s", cls.requests_per_second)
+        logger.info("maxretries: %d", cls.max_retries)
+        logger.info("cachebudget: %d", cls.cache_budget)
+        logger.info("diskcache: %s", cls.disk_cache)
+        logger.info("masterindex: %s", cls.master_index)
+        logger.info("asyncresults: %s", cls.async_results)
+        logger.info("warmup: %s", cls.warm_up)
+        logger.info("caches: %s", cls.cache_settings)
+
+    @classmethod
+    def create_ssl_context(cls):
+        """
+        Create the SSL context used for all HTTPS connections. Loading the
+        certificate file is expensive, so this is done once per configuration.
+        :return: An ssl.SSLContext
+        """
+        if cls.cacerts and os.path.exists(cls.cacerts):
+            return ssl.create_default_context(cafile=cls.cacerts)
+        logger.warning("%s was not found, using default certificates", cls.cacerts)
+        return ssl.create_default_context()
+
+    @classmethod
+    def create_auth_header(cls):
+        """
+        Create the basic authorization header value for the current credentials
+        :return:
+        """
+        credentials = "{0}:{1}".format(cls.auth_user, cls.auth_passwd)
+        return "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
 
     @classmethod
     def get_masked_user(cls):
@@ -171,27 +316,28 @@ class QConfiguration:
             return QConfiguration.auth_user and QConfiguration.auth_passwd and QConfiguration.cacerts
         return QConfiguration.auth_user and QConfiguration.auth_passwd
 
-# Set up configuration with user credentials
-QConfiguration.load()
-
 
 class IntrinioBase:
     page_size = 100
+    # The shared keep-alive HTTPS session. See get_session().
+    session = None
+    session_lock = threading.Lock()
 
     @staticmethod
-    def setup_authorization(url_string):
+    def get_session():
         """
-        Set up basic authorization for the given URL.
-        :param url_string:
-        :return: None
+        Return the shared HTTPS session, creating it as required. The session
+        is recreated if the SSL context has been replaced.
+        :return: IntrinioSession instance
         """
-        passman = urllib.request.HTTPPasswordMgrWithDefaultRealm()
-        passman.add_password(None, url_string, QConfiguration.auth_user, QConfiguration.auth_passwd)
-        authhandler = urllib.request.HTTPBasicAuthHandler(passman)
-        ssl_ctx = ssl.create_default_context(cafile=QConfiguration.cacerts)
-        httpshandler = urllib.request.HTTPSHandler(context=ssl_ctx)
-        opener = urllib.request.build_opener(httpshandler, authhandler)
-        urllib.request.install_opener(opener)
+        with IntrinioBase.session_lock:
+            session = IntrinioBase.session
+            if session is None or session.ssl_context is not QConfiguration.ssl_context:
+                if session is not None:
+                    session.close()
+                IntrinioBase.session = IntrinioSession(QConfiguration.base_url, QConfiguration.ssl_context,
+                                                       pool_size=QConfiguration.max_connections)
+            return IntrinioBase.session
 
     @staticmethod
     def get_usage(access_code):
@@ -200,9 +346,8 @@ class IntrinioBase:
         :param access_code:
         :return: Usage stats in a dict
         """
-        template_url = "{0}/usage/current?access_code={1}"
-        url_string = template_url.format(QConfiguration.base_url, access_code)
-        res = IntrinioBase.exec_request(url_string)
+        request = IntrinioRequest("/usage/current", [("access_code", access_code)])
+        res = IntrinioBase.submit(request)
         return res
 
     @staticmethod
@@ -211,11 +356,47 @@ class IntrinioBase:
         Get Excel version info. Really not useful for LOCalc, but included as an exercise.
         :return: Version info in a dict
         """
-        template_url = "{0}/excel"
-        url_string = template_url.format(QConfiguration.base_url)
-        res = IntrinioBase.exec_request(url_string)
+        request = IntrinioRequest("/excel")
+        res = IntrinioBase.submit(request)
         return res
 
+    @staticmethod
+    def submit(request):
+        """
+        Submit a request through the request engine and wait for the result
+        :param request: IntrinioRequest
+        :return: JSON decoded dict containing results of https GET.
+        """
+        return IntrinioEngine.run(request)
+
+    @staticmethod
+    def submit_all_pages(page_request):
+        """
+        Retrieve every page of a multi-page query. Page 1 is retrieved first to learn
+        total_pages, then the remaining pages are retrieved concurrently.
+        :param page_request: A function that takes a page number and returns an IntrinioRequest
+        :return: The list of page results in page order. If page 1 fails, the list
+        contains only the page 1 result.
+        """
+        first_page = IntrinioBase.submit(page_request(1))
+        if "total_pages" not in first_page:
+            return [first_page]
+        total_pages = int(first_page["total_pages"])
+        logger.debug("Total pages: %d", total_pages)
+        if total_pages <= 1:
+            return [first_page]
+        requests = [page_request(page_number) for page_number in range(2, total_pages + 1)]
+        return [first_page] + IntrinioEngine.run_all(requests)
+
+    @staticmethod
+    def exec_api_request(request):
+        """
+        Execute a request descriptor. This is the request engine's transport.
+        :param request: IntrinioRequest
+        :return: JSON decoded dict containing results of https GET.
+        """
+        return IntrinioBase.exec_request(request.url(QConfiguration.base_url))
+
     @staticmethod
     def exec_request(url_string):
         """
@@ -224,34 +405,35 @@ class IntrinioBase:
         :return: JSON decoded dict containing results of https GET.
         The status_code key is added to return the HTTPS status code.
         """
-        # print(url_string)
-        IntrinioBase.setup_authorization(url_string)
-        status_code = 666
+        session = IntrinioBase.get_session()
+        headers = {"Authorization": QConfiguration.auth_header, "Accept": "application/json"}
         try:
             logger.debug("HTTPS GET: %s", url_string)
-            response = urllib.request.urlopen(url_string)
-            status_code = response.getcode()
+            status_code, reason, res = session.get(url_string, headers)
             logger.debug("Status code: %d", status_code)
-            res = response.read()
-            res = str(res, "utf-8")
-        except urllib.error.HTTPError as ex:
-            logger.error(ex.msg)
+        except (OSError, http.client.HTTPException) as ex:
+            logger.error("HTTPS GET failed: %s", url_string)
             logger.error(str(ex))
-            return {"status_code":ex.code, "error_message":ex.msg}
+            return {"status_code": 666, "error_message": str(ex)}
+
+        if status_code < 200 or status_code >= 300:
+            logger.error("HTTP Error %d: %s", status_code, reason)
+            return {"status_code": status_code, "error_message": reason}
 
         # Not every URL returns something
-        if res:
-            # Guard against invalid result returned by URL
-            try:
-                j = json.loads(res)
-            except:
-                logger.error("HTTPS GET: %s", url_string)
-                logger.error("Status code: %d", status_code)
-                logger.error("Returned invalid/unexpected JSON response: %s", res)
-                j = {"bad_payload": res}
-            j["status_code"] = status_code
-        else:
-            j = {"status_code" : status_code}
+        if not res:
+            return {"status_code": status_code}
+        # Guard against invalid result returned by URL (e.g. a proxy's HTML error page)
+        try:
+            j = json.loads(str(res, "utf-8"))
+            if not isinstance(j, dict):
+                raise ValueError("Response is not a JSON object")
+        except ValueError as ex:
+            logger.error("HTTPS GET: %s", url_string)
+            logger.error("Status code: %d", status_code)
+            logger.error("Returned invalid/unexpected JSON response: %s", res[:200])
+            return {"status_code": 666, "error_message": str(ex)}
+        j["status_code"] = status_code
         return j
 
     @staticmethod
@@ -305,13 +487,15 @@ class IntrinioCompanies(IntrinioBase):
         :return:
         """
 
-        template_url = "{0}/companies/verify?ticker={1}"
-        url_string = template_url.format(QConfiguration.base_url, ticker.upper())
-        res = IntrinioCompanies.exec_request(url_string)
+        res = IntrinioCompanies.submit(IntrinioCompanies.verify_request(ticker))
         if "ticker" in res:
             return res["ticker"] == ticker
         return False
 
+    @staticmethod
+    def verify_request(ticker):
+        return IntrinioRequest("/companies/verify", [("ticker", ticker.upper())])
+
 
 class IntrinioSecurities(IntrinioBase):
     def __init__(self):
@@ -325,13 +509,15 @@ class IntrinioSecurities(IntrinioBase):
         :return:
         """
 
-        template_url = "{0}/securities/verify?ticker={1}"
-        url_string = template_url.format(QConfiguration.base_url, ticker.upper())
-        res = IntrinioSecurities.exec_request(url_string)
+        res = IntrinioSecurities.submit(IntrinioSecurities.verify_request(ticker))
         if "ticker" in res:
             return res["ticker"] == ticker
         return False
 
+    @staticmethod
+    def verify_request(ticker):
+        return IntrinioRequest("/securities/verify", [("ticker", ticker.upper())])
+
 
 class IntrinioBanks(IntrinioBase):
     def __init__(self):
@@ -345,13 +531,236 @@ class IntrinioBanks(IntrinioBase):
         :return:
         """
 
-        template_url = "{0}/banks/verify?identifier={1}"
-        url_string = template_url.format(QConfiguration.base_url, identifier.upper())
-        res = IntrinioBanks.exec_request(url_string)
+        res = IntrinioBanks.submit(IntrinioBanks.verify_request(identifier))
         if "identifier" in res:
             return res["identifier"] == identifier
         return False
 
+    @staticmethod
+    def verify_request(identifier):
+        return IntrinioRequest("/banks/verify", [("identifier", identifier.upper())])
+
+
+class IntrinioIdentifiers(IntrinioBase):
+    """
+    Verifies identifiers against the companies, securities and banks verify
+    endpoints. The three checks for an identifier race concurrently and the
+    first positive answer wins.
+    """
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def verify_identifiers(identifiers):
+        """
+        Verify a set of identifiers concurrently
+        :param identifiers: List of upper case identifiers
+        :return: List of verdicts in the same order: True (valid), False (invalid)
+        or None (unknown because a verify call failed)
+        """
+        if IntrinioEngine.is_cache_only():
+            raise CacheMiss(identifiers=identifiers)
+        return IntrinioEngine.submit(IntrinioIdentifiers.verify_all(identifiers)).result()
+
+    @staticmethod
+    async def verify_all(identifiers):
+        """
+        Coroutine form of verify_identifiers(). Must be awaited on the engine's event loop.
+        All of the company checks are queued ahead of the security checks, which are queued
+        ahead of the bank checks. A losing check that has not been sent by the time its
+        identifier is verified is dropped, so most identifiers cost one request.
+        """
+        checks = [[asyncio.ensure_future(IntrinioIdentifiers._check(request(identifier), field, identifier))
+                   for identifier in identifiers]
+                  for request, field in IntrinioIdentifiers._verifiers()]
+        return await asyncio.gather(*[IntrinioIdentifiers._race(list(race)) for race in zip(*checks)])
+
+    @staticmethod
+    async def verify(identifier):
+        """
+        Race the verify checks for an identifier. Must be awaited on the engine's event loop.
+        :param identifier: Upper case identifier
+        :return: True, False or None (unknown)
+        """
+        return await IntrinioIdentifiers._race(
+            [asyncio.ensure_future(IntrinioIdentifiers._check(request(identifier), field, identifier))
+             for request, field in IntrinioIdentifiers._verifiers()])
+
+    @staticmethod
+    def _verifiers():
+        # (request builder, result field holding the verified identifier)
+        return [(IntrinioCompanies.verify_request, "ticker"),
+                (IntrinioSecurities.verify_request, "ticker"),
+                (IntrinioBanks.verify_request, "identifier")]
+
+    @staticmethod
+    async def _race(checks):
+        """
+        :param checks: List of futures for the checks of one identifier
+        :return: True on the first positive check, otherwise False or None (unknown)
+        """
+        verdict = False
+        try:
+            for check in asyncio.as_completed(checks):
+                valid = await check
+                if valid:
+                    return True
+                if valid is None:
+                    verdict = None
+        finally:
+            # Stop waiting on the losing checks. A request that has not been sent is dropped.
+            for check in checks:
+                check.cancel()
+        return verdict
+
+    @staticmethod
+    async def _check(request, field, identifier):
+        res = await IntrinioEngine.fetch(request)
+        if field in res:
+            return res[field] == identifier
+        status_code = res.get("status_code", 666)
+        if status_code == 404 or 200 <= status_code < 300:
+            return False
+        # Auth failures, throttling, server errors, etc. say nothing about the identifier
+        return None
+
+
+class DataPointBatcher:
+    """
+    Collects data point requests that arrive within a short window (QConfiguration.batch_window)
+    and sends them as a few multi-identifier/multi-item /data_point calls. Each waiting caller
+    receives a result shaped like a single data point response. All state is only touched
+    on the request engine's event loop thread.
+    """
+    # The maximum number of identifier x item combinations in one /data_point call
+    max_combinations = 150
+    # (identifier, item) -> asyncio.Future
+    pending = {}
+    flush_handle = None
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def submit(cls, identifier, item):
+        """
+        Queue a data point request without waiting for it
+        :param identifier: Upper case identifier
+        :param item: tag or series ID
+        :return: A concurrent.futures.Future for the result dict
+        """
+        if IntrinioEngine.is_cache_only():
+            key = cls.prefetch_key(identifier, item)
+            prefetched = IntrinioEngine.prefetched
+            if key not in prefetched:
+                raise CacheMiss(data_points=[(identifier, item)])
+            future = concurrent.futures.Future()
+            future.set_result(prefetched[key])
+            return future
+        return IntrinioEngine.submit(cls._enqueue(identifier, item))
+
+    @staticmethod
+    def prefetch_key(identifier, item):
+        """
+        :return: The IntrinioEngine.prefetched key of a data point
+        """
+        return "/data_point", identifier, item
+
+    @classmethod
+    async def _enqueue(cls, identifier, item):
+        key = (identifier, item)
+        future = cls.pending.get(key)
+        if future is None:
+            future = IntrinioEngine.loop.create_future()
+            cls.pending[key] = future
+            if len(cls.pending) >= cls.max_combinations:
+                cls._flush()
+            elif cls.flush_handle is None:
+                cls.flush_handle = IntrinioEngine.loop.call_later(QConfiguration.batch_window / 1000.0, cls._flush)
+        return await asyncio.shield(future)
+
+    @classmethod
+    def _flush(cls):
+        if cls.flush_handle is not None:
+            cls.flush_handle.cancel()
+            cls.flush_handle = None
+        batch = cls.pending
+        cls.pending = {}
+        IntrinioEngine.loop.create_task(cls._send(batch))
+
+    @classmethod
+    async def _send(cls, batch):
+        """
+        Send a batch of data point requests. Identifiers that want the same set of items
+        share a request, and requests are split to honor max_combinations.
+        :param batch: Dict of (identifier, item) -> asyncio.Future
+        :return: None
+        """
+        items_by_identifier = {}
+        for identifier, item in batch:
+            items_by_identifier.setdefault(identifier, set()).add(item)
+        identifiers_by_items = {}
+        for identifier, items in items_by_identifier.items():
+            identifiers_by_items.setdefault(tuple(sorted(items)), []).append(identifier)
+
+        chunks = []
+        for items, identifiers in identifiers_by_items.items():
+            item_chunk_size = min(len(items), cls.max_combinations)
+            for i in range(0, len(items), item_chunk_size):
+                chunk_items = items[i:i + item_chunk_size]
+                id_chunk_size = cls.max_combinations // len(chunk_items)
+                for j in range(0, len(identifiers), id_chunk_size):
+                    chunks.append((identifiers[j:j + id_chunk_size], chunk_items))
+        logger.debug("Sending %d data points in %d requests", len(batch), len(chunks))
+
+        requests = [IntrinioRequest("/data_point", [("identifier", ",".join(identifiers)), ("item", ",".join(items))])
+                    for identifiers, items in chunks]
+        try:
+            results = await IntrinioEngine.fetch_all(requests)
+        except Exception as ex:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(ex)
+            return
+
+        try:
+            for (identifiers, items), res in zip(chunks, results):
+                cls._resolve(batch, identifiers, items, res)
+        except Exception as ex:
+            # A malformed response must not leave callers waiting forever
+            logger.error("Unable to parse data point response: %s", str(ex))
+            for future in batch.values():
+                if not future.done():
+                    future.set_result({"status_code": 666, "error_message": str(ex)})
+
+    @staticmethod
+    def _resolve(batch, identifiers, items, res):
+        """
+        Give each data point of one /data_point request its result
+        :param batch: Dict of (identifier, item) -> asyncio.Future
+        :param identifiers: The request's identifiers
+        :param items: The request's items
+        :param res: The request's result dict
+        :return: None
+        """
+        if "data" in res:
+            values = {(v["identifier"].upper(), v["item"]): v["value"] for v in res["data"]}
+        elif "value" in res:
+            values = {(res["identifier"].upper(), res["item"]): res["value"]}
+        else:
+            # The whole request failed. Every data point in it gets the error.
+            values = None
+        for identifier in identifiers:
+            for item in items:
+                future = batch.get((identifier, item))
+                if future is None or future.done():
+                    continue
+                if values is None:
+                    future.set_result(res)
+                else:
+                    future.set_result({"identifier": identifier, "item": item,
+                                       "value": values.get((identifier, item), "na")})
+
 
 class IntrinioDataPoint(IntrinioBase):
     def __init__(self):
@@ -360,16 +769,19 @@ class IntrinioDataPoint(IntrinioBase):
     @staticmethod
     def get_data_point(identifier, item):
         """
-
+        Retrieve a single data point. Unless batching is disabled, the request is
+        combined with other data point requests made at about the same time.
         :param identifier:
         :param item:
         :return:
         """
-
-        template_url = "{0}/data_point?identifier={1}&item={2}"
-        url_string = template_url.format(QConfiguration.base_url, identifier.upper(), item)
-        res = IntrinioDataPoint.exec_request(url_string)
-        logger.debug("%s %s %s", res["identifier"], res["item"], res["value"])
+        if QConfiguration.batch_window > 0:
+            res = DataPointBatcher.submit(identifier.upper(), item).result()
+        else:
+            request = IntrinioRequest("/data_point", [("identifier", identifier.upper()), ("item", item)])
+            res = IntrinioDataPoint.submit(request)
+        if "value" in res:
+            logger.debug("%s %s %s", res["identifier"], res["item"], res["value"])
         return res
 
 
@@ -390,29 +802,41 @@ class IntrinioHistoricalPrices(IntrinioBase):
         """
         page_number = IntrinioHistoricalPrices.get_page_number(sequence)
 
-        template_url = "{0}/prices?identifier={1}&page_size={2}&page_number={3}"
-        url_string = template_url.format(QConfiguration.base_url, identifier.upper(),
-                                         IntrinioHistoricalPrices.page_size, page_number)
-
-        # Add additional query parameters
-        if start_date:
-            url_string += "&start_date=" + start_date
-        if end_date:
-            url_string += "&end_date=" + end_date
-        if frequency:
-            url_string += "&frequency=" + frequency
+        request = IntrinioRequest("/prices", [("identifier", identifier.upper()),
+                                              ("page_size", IntrinioHistoricalPrices.page_size),
+                                              ("page_number", page_number),
+                                              ("start_date", start_date),
+                                              ("end_date", end_date),
+                                              ("frequency", frequency)])
 
-        print (url_string)
         # Note for future reference. It looks like this URL is designed for
         # you to run the query for the first page. It returns the number of total_pages available
         # as one of the JSON values. You could use that value to know how many pages are
         # left to be retrieved.
         # Also, it should be noted that the dates go backwards. Sequence 0 will always
         # be the newest date, while sequence numbers 1 to n will go backwards in time.
-        res = IntrinioHistoricalPrices.exec_request(url_string)
-        logger.debug("Result count: %s", res["result_count"])
+        res = IntrinioHistoricalPrices.submit(request)
+        logger.debug("Result count: %s", res.get("result_count"))
         return res
 
+    @staticmethod
+    def price_range_request(identifier, start_date, end_date, frequency, page_number):
+        """
+        Build the request for a page of prices within a date range
+        :param identifier:
+        :param start_date: ISO date or None
+        :param end_date: ISO date or None
+        :param frequency:
+        :param page_number:
+        :return: IntrinioRequest
+        """
+        return IntrinioRequest("/prices", [("identifier", identifier.upper()),
+                                           ("page_size", IntrinioHistoricalPrices.page_size),
+                                           ("page_number", page_number),
+                                           ("start_date", start_date),
+                                           ("end_date", end_date),
+                                           ("frequency", frequency)])
+
 
 class IntrinioHistoricalData(IntrinioBase):
     def __init__(self):
@@ -432,31 +856,47 @@ class IntrinioHistoricalData(IntrinioBase):
         """
         page_number = IntrinioHistoricalData.get_page_number(sequence)
 
-        template_url = "{0}/historical_data?identifier={1}&item={2}&page_size={3}&page_number={4}"
-        url_string = template_url.format(QConfiguration.base_url, identifier.upper(), item,
-                                         IntrinioHistoricalData.page_size, page_number)
-
-        # Add additional query parameters
-        if start_date:
-            url_string += "&start_date=" + start_date
-        if end_date:
-            url_string += "&end_date=" + end_date
-        if frequency:
-            url_string += "&frequency=" + frequency
-        if period_type:
-            url_string += "&type=" + period_type
-
-        # print (url_string)
+        request = IntrinioRequest("/historical_data", [("identifier", identifier.upper()),
+                                                       ("item", item),
+                                                       ("page_size", IntrinioHistoricalData.page_size),
+                                                       ("page_number", page_number),
+                                                       ("start_date", start_date),
+                                                       ("end_date", end_date),
+                                                       ("frequency", frequency),
+                                                       ("type", period_type)])
+
         # Note for future reference. It looks like this URL is designed for
         # you to run the query for the first page. It returns the number of total_pages available
         # as one of the JSON values. You could use that value to know how many pages are
         # left to be retrieved.
         # Also, it should be noted that the dates go backwards. Sequence 0 will always
         # be the newest date, while sequence numbers 1 to n will go backwards in time.
-        res = IntrinioHistoricalData.exec_request(url_string)
-        logger.debug("Result count: %s", res["result_count"])
+        res = IntrinioHistoricalData.submit(request)
+        logger.debug("Result count: %s", res.get("result_count"))
         return res
 
+    @staticmethod
+    def historical_data_range_request(identifier, item, start_date, end_date, frequency, period_type, page_number):
+        """
+        Build the request for a page of historical data within a date range
+        :param identifier:
+        :param item:
+        :param start_date: ISO date or None
+        :param end_date: ISO date or None
+        :param frequency:
+        :param period_type:
+        :param page_number:
+        :return: IntrinioRequest
+        """
+        return IntrinioRequest("/historical_data", [("identifier", identifier.upper()),
+                                                    ("item", item),
+                                                    ("page_size", IntrinioHistoricalData.page_size),
+                                                    ("page_number", page_number),
+                                                    ("start_date", start_date),
+                                                    ("end_date", end_date),
+                                                    ("frequency", frequency),
+                                                    ("type", period_type)])
+
 
 class IntrinioNews(IntrinioBase):
     def __init__(self):
@@ -476,19 +916,18 @@ class IntrinioNews(IntrinioBase):
         """
         page_number = IntrinioNews.get_page_number(sequence)
 
-        template_url = "{0}/news?identifier={1}&page_size={2}&page_number={3}"
-        url_string = template_url.format(QConfiguration.base_url, identifier.upper(),
-                                         IntrinioNews.page_size, page_number)
+        request = IntrinioRequest("/news", [("identifier", identifier.upper()),
+                                            ("page_size", IntrinioNews.page_size),
+                                            ("page_number", page_number)])
 
-        print (url_string)
         # Note for future reference. It looks like this URL is designed for
         # you to run the query for the first page. It returns the number of total_pages available
         # as one of the JSON values. You could use that value to know how many pages are
         # left to be retrieved.
         # Also, it should be noted that the dates go backwards. Sequence 0 will always
         # be the newest date, while sequence numbers 1 to n will go backwards in time.
-        res = IntrinioNews.exec_request(url_string)
-        logger.debug("Result count: %s", res["result_count"])
+        res = IntrinioNews.submit(request)
+        logger.debug("Result count: %s", res.get("result_count"))
         return res
 
 
@@ -508,23 +947,20 @@ class IntrinioFundamentals(IntrinioBase):
         """
         page_number = IntrinioFundamentals.get_page_number(sequence)
 
-        template_url = "{0}/fundamentals/standardized?identifier={1}&statement={2}&page_size={3}&page_number={4}"
-        url_string = template_url.format(QConfiguration.base_url, identifier.upper(), statement,
-                                         IntrinioFundamentals.page_size, page_number)
-
-        # Add additional query parameters
-        if period_type:
-            url_string += "&type=" + period_type
+        request = IntrinioRequest("/fundamentals/standardized", [("identifier", identifier.upper()),
+                                                                 ("statement", statement),
+                                                                 ("page_size", IntrinioFundamentals.page_size),
+                                                                 ("page_number", page_number),
+                                                                 ("type", period_type)])
 
-        # print (url_string)
         # Note for future reference. It looks like this URL is designed for
         # you to run the query for the first page. It returns the number of total_pages available
         # as one of the JSON values. You could use that value to know how many pages are
         # left to be retrieved.
         # Also, it should be noted that the dates go backwards. Sequence 0 will always
         # be the newest date, while sequence numbers 1 to n will go backwards in time.
-        res = IntrinioFundamentals.exec_request(url_string)
-        logger.debug("Result count: %s", res["result_count"])
+        res = IntrinioFundamentals.submit(request)
+        logger.debug("Result count: %s", res.get("result_count"))
         return res
 
 
@@ -546,21 +982,43 @@ class IntrinioTags(IntrinioBase):
         """
         page_number = IntrinioTags.get_page_number(sequence)
 
-        template_url = "{0}/tags/standardized?identifier={1}&statement={2}&page_size={3}&page_number={4}"
-        url_string = template_url.format(QConfiguration.base_url, identifier.upper(), statement,
-                                         IntrinioTags.page_size, page_number)
+        request = IntrinioTags.tags_page_request(identifier, statement, page_number)
 
-        print (url_string)
         # Note for future reference. It looks like this URL is designed for
         # you to run the query for the first page. It returns the number of total_pages available
         # as one of the JSON values. You could use that value to know how many pages are
         # left to be retrieved.
         # Also, it should be noted that the dates go backwards. Sequence 0 will always
         # be the newest date, while sequence numbers 1 to n will go backwards in time.
-        res = IntrinioTags.exec_request(url_string)
+        res = IntrinioTags.submit(request)
         # print (res)
         return res
 
+    @staticmethod
+    def get_all_tags_pages(identifier, statement):
+        """
+        Retrieve all of the pages of standardized tags for a statement
+        :param identifier:
+        :param statement:
+        :return: List of page results
+        """
+        return IntrinioTags.submit_all_pages(
+            lambda page_number: IntrinioTags.tags_page_request(identifier, statement, page_number))
+
+    @staticmethod
+    def tags_page_request(identifier, statement, page_number):
+        """
+        Build the request for a page of standardized tags
+        :param identifier:
+        :param statement:
+        :param page_number: 1-total_pages
+        :return: IntrinioRequest
+        """
+        return IntrinioRequest("/tags/standardized", [("identifier", identifier.upper()),
+                                                      ("statement", statement),
+                                                      ("page_size", IntrinioTags.page_size),
+                                                      ("page_number", page_number)])
+
 
 class IntrinioFinancials(IntrinioBase):
     def __init__(self):
@@ -577,22 +1035,51 @@ class IntrinioFinancials(IntrinioBase):
         :param page_number: 1-total_pages
         :return:
         """
-        template_url = "{0}/financials/standardized?ticker={1}&statement={2}&fiscal_year={3}&fiscal_period={4}&page_size={5}&page_number={6}"
-        url_string = template_url.format(QConfiguration.base_url, identifier.upper(), statement,
-                                         fiscal_year, fiscal_period,
-                                         IntrinioFinancials.page_size, page_number)
+        request = IntrinioFinancials.financials_page_request(identifier, statement, fiscal_year, fiscal_period,
+                                                             page_number)
 
-        # print (url_string)
         # Note for future reference. It looks like this URL is designed for
         # you to run the query for the first page. It returns the number of total_pages available
         # as one of the JSON values. You could use that value to know how many pages are
         # left to be retrieved.
         # Also, it should be noted that the dates go backwards. Sequence 0 will always
         # be the newest date, while sequence numbers 1 to n will go backwards in time.
-        res = IntrinioFinancials.exec_request(url_string)
+        res = IntrinioFinancials.submit(request)
         # print (res)
         return res
 
+    @staticmethod
+    def get_all_financials_pages(identifier, statement, fiscal_year, fiscal_period):
+        """
+        Retrieve all of the pages of standardized financials for a statement
+        :param identifier:
+        :param statement:
+        :param fiscal_year:
+        :param fiscal_period:
+        :return: List of page results
+        """
+        return IntrinioFinancials.submit_all_pages(
+            lambda page_number: IntrinioFinancials.financials_page_request(identifier, statement, fiscal_year,
+                                                                           fiscal_period, page_number))
+
+    @staticmethod
+    def financials_page_request(identifier, statement, fiscal_year, fiscal_period, page_number):
+        """
+        Build the request for a page of standardized financials
+        :param identifier:
+        :param statement:
+        :param fiscal_year:
+        :param fiscal_period:
+        :param page_number: 1-total_pages
+        :return: IntrinioRequest
+        """
+        return IntrinioRequest("/financials/standardized", [("ticker", identifier.upper()),
+                                                            ("statement", statement),
+                                                            ("fiscal_year", fiscal_year),
+                                                            ("fiscal_period", fiscal_period),
+                                                            ("page_size", IntrinioFinancials.page_size),
+                                                            ("page_number", page_number)])
+
 
 class IntrinioReportedFundamentals(IntrinioBase):
     def __init__(self):
@@ -612,12 +1099,13 @@ class IntrinioReportedFundamentals(IntrinioBase):
         """
         page_number = IntrinioReportedFundamentals.get_page_number(sequence)
 
-        template_url = "{0}/fundamentals/reported?ticker={1}&statement={2}&page_size={3}&page_number={4}&type={5}"
-        url_string = template_url.format(QConfiguration.base_url, identifier.upper(), statement,
-                                         IntrinioReportedFundamentals.page_size, page_number, period_type)
+        request = IntrinioRequest("/fundamentals/reported", [("ticker", identifier.upper()),
+                                                             ("statement", statement),
+                                                             ("page_size", IntrinioReportedFundamentals.page_size),
+                                                             ("page_number", page_number),
+                                                             ("type", period_type)])
 
-        # print (url_string)
-        res = IntrinioReportedFundamentals.exec_request(url_string)
+        res = IntrinioReportedFundamentals.submit(request)
         # print (res)
         return res
 
@@ -640,15 +1128,45 @@ class IntrinioReportedTags(IntrinioBase):
         """
         page_number = IntrinioReportedTags.get_page_number(sequence)
 
-        template_url = "{0}/tags/reported?identifier={1}&statement={2}&page_size={3}&page_number={4}&fiscal_year={5}&fiscal_period={6}"
-        url_string = template_url.format(QConfiguration.base_url, identifier.upper(), statement,
-                                         IntrinioReportedTags.page_size, page_number, fiscal_year, fiscal_period)
+        request = IntrinioReportedTags.tags_page_request(identifier, statement, fiscal_year, fiscal_period,
+                                                         page_number)
 
-        # print (url_string)
-        res = IntrinioReportedTags.exec_request(url_string)
+        res = IntrinioReportedTags.submit(request)
         # print (res)
         return res
 
+    @staticmethod
+    def get_all_tags_pages(identifier, statement, fiscal_year, fiscal_period):
+        """
+        Retrieve all of the pages of as reported tags for a statement
+        :param identifier:
+        :param statement:
+        :param fiscal_year:
+        :param fiscal_period:
+        :return: List of page results
+        """
+        return IntrinioReportedTags.submit_all_pages(
+            lambda page_number: IntrinioReportedTags.tags_page_request(identifier, statement, fiscal_year,
+                                                                       fiscal_period, page_number))
+
+    @staticmethod
+    def tags_page_request(identifier, statement, fiscal_year, fiscal_period, page_number):
+        """
+        Build the request for a page of as reported tags
+        :param identifier:
+        :param statement:
+        :param fiscal_year:
+        :param fiscal_period:
+        :param page_number: 1-total_pages
+        :return: IntrinioRequest
+        """
+        return IntrinioRequest("/tags/reported", [("identifier", identifier.upper()),
+                                                  ("statement", statement),
+                                                  ("page_size", IntrinioReportedTags.page_size),
+                                                  ("page_number", page_number),
+                                                  ("fiscal_year", fiscal_year),
+                                                  ("fiscal_period", fiscal_period)])
+
 
 class IntrinioReportedFinancials(IntrinioBase):
     def __init__(self):
@@ -665,19 +1183,47 @@ class IntrinioReportedFinancials(IntrinioBase):
         :param page_number: 1-total_pages
         :return:
         """
-        template_url = "{0}/financials/reported?ticker={1}&statement={2}&fiscal_year={3}&fiscal_period={4}&page_size={5}&page_number={6}"
-        url_string = template_url.format(QConfiguration.base_url, identifier.upper(), statement,
-                                         fiscal_year, fiscal_period,
-                                         IntrinioReportedFinancials.page_size, page_number)
+        request = IntrinioReportedFinancials.financials_page_request(identifier, statement, fiscal_year, fiscal_period,
+                                                                     page_number)
 
-        # print (url_string)
         # Note for future reference. It looks like this URL is designed for
         # you to run the query for the first page. It returns the number of total_pages available
         # as one of the JSON values. You could use that value to know how many pages are
         # left to be retrieved.
         # Also, it should be noted that the dates go backwards. Sequence 0 will always
         # be the newest date, while sequence numbers 1 to n will go backwards in time.
-        res = IntrinioReportedFinancials.exec_request(url_string)
+        res = IntrinioReportedFinancials.submit(request)
         # print (res)
         return res
 
+    @staticmethod
+    def get_all_financials_pages(identifier, statement, fiscal_year, fiscal_period):
+        """
+        Retrieve all of the pages of as reported financials for a statement
+        :param identifier:
+        :param statement:
+        :param fiscal_year:
+        :param fiscal_period:
+        :return: List of page results
+        """
+        return IntrinioReportedFinancials.submit_all_pages(
+            lambda page_number: IntrinioReportedFinancials.financials_page_request(identifier, statement, fiscal_year,
+                                                                                   fiscal_period, page_number))
+
+    @staticmethod
+    def financials_page_request(identifier, statement, fiscal_year, fiscal_period, page_number):
+        """
+        Build the request for a page of as reported financials
+        :param identifier:
+        :param statement:
+        :param fiscal_year:
+        :param fiscal_period:
+        :param page_number: 1-total_pages
+        :return: IntrinioRequest
+        """
+        return IntrinioRequest("/financials/reported", [("ticker", identifier.upper()),
+                                                        ("statement", statement),
+                                                        ("fiscal_year", fiscal_year),
+                                                        ("fiscal_period", fiscal_period),
+                                                        ("page_size", IntrinioReportedFinancials.page_size),
+                                                        ("page_number", page_number)])
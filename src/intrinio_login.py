@@ -0,0 +1,151 @@
+#
+# intrinio_login - The Intrinio login dialog
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from intrinio_app_logger import AppLogger
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+#
+# Intrinio login dialog
+# Adapted from https://forum.openoffice.org/en/forum/viewtopic.php?f=45&t=56397#p248794
+#
+
+
+try:
+    import uno
+    logger.debug("Attempt to import uno succeeded")
+    # logger.debug("sys.path = %s", sys.path)
+except Exception as ex:
+    logger.error("Attempt to import uno failed %s", str(ex))
+try:
+    # https://www.openoffice.org/api/docs/common/ref/com/sun/star/awt/PosSize.html
+    from com.sun.star.awt.PosSize import POSSIZE # flags the x- and y-coordinate, width and height
+    logger.debug("Attempt to import com.sun.star.awt.PosSize succeeded")
+except Exception as ex:
+    logger.error("Attempt to import com.sun.star.awt.PosSize failed %s", str(ex))
+
+
+def _add_awt_model(dlg_model, srv, ctl_name, prop_list):
+    """
+    Helper function for building dialog
+    Insert UnoControl<srv>Model into given DialogControlModel
+    :param dlg_model: dialog model where control is to be added
+    :param srv: control model type to be added
+    :param ctl_name: name to be assigned to the control model
+    :param prop_list: properties to be assigned to new control model
+    :return: None
+    """
+    ctl_model = dlg_model.createInstance("com.sun.star.awt.UnoControl" + srv + "Model")
+    while prop_list:
+        prp = prop_list.popitem()
+        uno.invoke(ctl_model,"setPropertyValue",(prp[0],prp[1]))
+        #works with awt.UnoControlDialogElement only:
+        ctl_model.Name = ctl_name
+    dlg_model.insertByName(ctl_name, ctl_model)
+
+
+def intrinio_login():
+    """
+    Ask user for Intrinio login credentials
+    :return: If successful, returns username and password as a tuple (something truthy)
+    If canceled, returns False.
+    """
+    # Reference: https://www.openoffice.org/api/docs/common/ref/com/sun/star/awt/module-ix.html
+    global logger
+
+    ctx = uno.getComponentContext()
+    smgr = ctx.ServiceManager
+    dlg_model = smgr.createInstance("com.sun.star.awt.UnoControlDialogModel")
+    dlg_model.Title = 'Enter Intrinio Access Keys'
+
+    _add_awt_model(dlg_model, 'FixedText', 'lblName', {
+        'Label': 'User Name',
+    }
+                   )
+    _add_awt_model(dlg_model, 'Edit', 'txtName', {})
+
+    _add_awt_model(dlg_model, 'FixedText', 'lblPWD', {
+        'Label': 'Password',
+    }
+                   )
+    _add_awt_model(dlg_model, 'Edit', 'txtPWD', {
+        'EchoChar': 42,
+    }
+                   )
+
+    _add_awt_model(dlg_model, 'CheckBox', 'cbDoNotAsk', {
+        'Label': 'Do not ask again',
+    }
+                   )
+
+    _add_awt_model(dlg_model, 'Button', 'btnOK', {
+        'Label': 'Save',
+        'DefaultButton': True,
+        'PushButtonType': 1,
+    }
+                   )
+    _add_awt_model(dlg_model, 'Button', 'btnCancel', {
+        'Label': 'Cancel',
+        'PushButtonType': 2,
+    }
+                   )
+
+    lmargin = 10  # left margin
+    rmargin = 10  # right margin
+    tmargin = 10  # top margin
+    bmargin = 10  # bottom margin
+    cheight = 25  # control height
+    pad = 5  # top/bottom padding where needed
+    theight = cheight + pad  # total height of a control
+
+    # Poor man's grid
+    # layout "control-name", [x, y, w, h]
+    layout = {
+        "lblName": [lmargin, tmargin, 100, cheight],
+        "txtName": [lmargin + 100, tmargin, 250, cheight],
+        "lblPWD": [lmargin, tmargin + (theight * 1), 100, cheight],
+        "txtPWD": [lmargin + 100, tmargin + (theight * 1), 250, cheight],
+        "cbDoNotAsk": [lmargin + 100, tmargin + (theight * 2), 200, cheight],
+        "btnOK": [lmargin + 100, tmargin + (theight * 3), 100, cheight],
+        "btnCancel": [lmargin + 200, tmargin + (theight * 3), 100, cheight]
+    }
+
+    dialog = smgr.createInstance("com.sun.star.awt.UnoControlDialog")
+    dialog.setModel(dlg_model)
+    name_ctl = dialog.getControl('txtName')
+    pass_ctl = dialog.getControl('txtPWD')
+    do_not_ask_ctl = dialog.getControl("cbDoNotAsk")
+
+    # Apply layout to controls. Must be done within the dialog.
+    for name, d in layout.items():
+        ctl = dialog.getControl(name)
+        ctl.setPosSize(d[0], d[1], d[2], d[3], POSSIZE)
+
+    dialog.setPosSize(300, 300, lmargin + rmargin + 100 + 250, tmargin + bmargin + (theight * 4), POSSIZE)
+    dialog.setVisible(True)
+
+    # Run the dialog. Returns the value of the PushButtonType.
+    # 1 = save
+    # 2 = cancel
+    button_id = dialog.execute()
+    logger.debug("intrinio login dialog returned: %s", button_id)
+    if button_id == 1:
+        return (True, name_ctl.getText(), pass_ctl.getText())
+    else:
+        return (False, do_not_ask_ctl.getState())
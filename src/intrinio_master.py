@@ -0,0 +1,234 @@
+#
+# intrinio_master - Local master lists of securities and companies
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import math
+import threading
+import time
+from intrinio_app_logger import AppLogger
+from intrinio_lib import QConfiguration, IntrinioBase
+from intrinio_engine import IntrinioEngine, IntrinioRequest
+from intrinio_disk_cache import DiskCache
+from intrinio_cache import DAY
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+
+class MasterList:
+    """
+    An immutable snapshot of a master list with its indexes. Rows are kept in
+    Intrinio's order. Tickers, FIGIs and exchanges are hash indexed.
+    """
+    def __init__(self, rows, built):
+        """
+        :param rows: List of row dicts as returned by the list endpoint
+        :param built: Time (epoch seconds) the list was downloaded
+        """
+        self.rows = rows
+        self.built = built
+        self.by_ticker = {}
+        self.by_figi = {}
+        self.by_exchange = {}
+        for i, row in enumerate(rows):
+            ticker = row.get("ticker")
+            if ticker:
+                self.by_ticker.setdefault(ticker.upper(), i)
+            figi = row.get("figi")
+            if figi:
+                self.by_figi.setdefault(figi.upper(), i)
+            exchange = row.get("exch_symbol")
+            if exchange:
+                self.by_exchange.setdefault(exchange.upper(), []).append(i)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def find(self, identifier):
+        """
+        :param identifier: Ticker or FIGI
+        :return: The row or None
+        """
+        identifier = identifier.upper()
+        i = self.by_ticker.get(identifier)
+        if i is None:
+            i = self.by_figi.get(identifier)
+        return self.rows[i] if i is not None else None
+
+    def select(self, exchange_symbol=None):
+        """
+        :param exchange_symbol: Limit the result to one exchange (e.g. ^XNYS)
+        :return: List of the indexes of the rows in list order
+        """
+        if exchange_symbol:
+            return self.by_exchange.get(exchange_symbol.upper(), [])
+        return range(len(self.rows))
+
+
+class MasterIndex:
+    """
+    Base class for a master list that is downloaded once by paging through a list
+    endpoint, kept in the disk cache and refreshed daily by a background thread.
+    Until the first list is available, callers fall back to the API.
+    """
+    endpoint = None
+    # Disk cache entry
+    namespace = None
+    version = 1
+    # Refresh interval and retry delay after a failed download
+    refresh_interval = DAY
+    retry_interval = 3600
+    # The largest page the list endpoint serves
+    page_size = 1000
+    master = None
+    lock = threading.Lock()
+    refresher = None
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def get_master(cls):
+        """
+        Return the master list if the master index is enabled and a list is available.
+        The first call starts the background thread that loads and refreshes the list.
+        :return: MasterList or None
+        """
+        if not QConfiguration.master_index:
+            return None
+        if cls.refresher is None:
+            with cls.lock:
+                if cls.refresher is None:
+                    cls.refresher = threading.Thread(target=cls._refresh_loop,
+                                                     name="intrinio-master-" + cls.namespace, daemon=True)
+                    cls.refresher.start()
+        return cls.master
+
+    @classmethod
+    def is_known(cls, identifier):
+        """
+        :param identifier: Ticker or FIGI
+        :return: True if the identifier is in the master list. False means
+        the master list is unavailable or does not hold the identifier.
+        """
+        master = cls.get_master()
+        return master is not None and master.find(identifier) is not None
+
+    @classmethod
+    def get_query_page(cls, query, exchange_symbol, filter_date, page_number):
+        """
+        Answer a list query from the master list in the form of an Intrinio page result.
+        Only a plain listing, optionally of one exchange, is answered locally. Text
+        queries and date filters are sent to Intrinio because only Intrinio's search
+        gives Intrinio's rows and result counts.
+        :param query: Query string
+        :param exchange_symbol: Exchange filter or None
+        :param filter_date: The list's date filter or None
+        :param page_number: 1-n
+        :return: Page result or None if the query must be sent to Intrinio
+        """
+        if query or filter_date:
+            return None
+        master = cls.get_master()
+        if master is None:
+            return None
+
+        indexes = master.select(exchange_symbol)
+        page_size = IntrinioBase.page_size
+        start = (page_number - 1) * page_size
+        return {"data": [master.rows[i] for i in indexes[start:start + page_size]],
+                "result_count": len(indexes),
+                "page_size": page_size,
+                "current_page": page_number,
+                "total_pages": max(1, math.ceil(len(indexes) / page_size))}
+
+    @classmethod
+    def _refresh_loop(cls):
+        """
+        Background thread. Loads the list from the disk cache, then downloads
+        a new list whenever the current one is a day old.
+        :return: None
+        """
+        found, saved = DiskCache.get(cls.namespace, cls.version, ("list",))
+        if found:
+            cls.master = MasterList(saved["rows"], saved["built"])
+            logger.debug("Loaded %d %s from the disk cache", len(cls.master), cls.namespace)
+        while True:
+            if cls.master is None or time.time() - cls.master.built >= cls.refresh_interval:
+                if not cls.download():
+                    time.sleep(cls.retry_interval)
+                    continue
+            time.sleep(max(cls.master.built + cls.refresh_interval - time.time(), 1.0))
+
+    @classmethod
+    def download(cls):
+        """
+        Page through the complete list and replace the master list. The pages are
+        requested one at a time in background mode, whenever Calc is not waiting
+        for Intrinio.
+        :return: True if the list was downloaded
+        """
+        logger.info("Downloading the %s master list", cls.namespace)
+        rows = []
+        page_number = 1
+        total_pages = 1
+        IntrinioEngine.background(True)
+        try:
+            while page_number <= total_pages:
+                IntrinioEngine.wait_for_foreground()
+                res = IntrinioBase.submit(cls.page_request(page_number))
+                if "data" not in res:
+                    logger.error("Unable to download the %s master list: %s", cls.namespace,
+                                 IntrinioBase.status_code_message(res.get("status_code")))
+                    return False
+                rows.extend(res["data"])
+                total_pages = int(res.get("total_pages", 1))
+                page_number += 1
+        finally:
+            IntrinioEngine.background(False)
+
+        built = time.time()
+        cls.master = MasterList(rows, built)
+        DiskCache.put(cls.namespace, cls.version, ("list",), {"built": built, "rows": rows}, 2 * DAY)
+        logger.info("Downloaded %d %s", len(rows), cls.namespace)
+        return True
+
+    @classmethod
+    def page_request(cls, page_number):
+        return IntrinioRequest(cls.endpoint, [("page_size", cls.page_size), ("page_number", page_number)])
+
+
+class SecuritiesMaster(MasterIndex):
+    """
+    All securities from /securities
+    """
+    endpoint = "/securities"
+    namespace = "master_securities"
+    master = None
+    lock = threading.Lock()
+    refresher = None
+
+
+class CompaniesMaster(MasterIndex):
+    """
+    All companies from /companies
+    """
+    endpoint = "/companies"
+    namespace = "master_companies"
+    master = None
+    lock = threading.Lock()
+    refresher = None
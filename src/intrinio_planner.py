@@ -0,0 +1,230 @@
+#
+# intrinio_planner - Plans the Intrinio requests of a recalculation burst
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from intrinio_app_logger import AppLogger
+from intrinio_engine import IntrinioEngine, CacheMiss
+from intrinio_lib import DataPointBatcher
+from intrinio_access import validate_identifiers
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+
+class PendingCall:
+    """
+    A cell call that could not be answered from the caches
+    """
+    def __init__(self, result, func, miss):
+        """
+        :param result: The object that receives the value: result.deliver(value)
+        :param func: Function that computes the value
+        :param miss: The CacheMiss raised by the call
+        """
+        self.result = result
+        self.func = func
+        self.miss = miss
+        self.needs = PendingCall.needs_of(miss)
+        # Everything fetched for the call in earlier rounds. A call that spans rounds
+        # (e.g. a statement assembled from several pages) reads all of it again.
+        self.fetched = set()
+        self.rounds = 0
+
+    @staticmethod
+    def needs_of(miss):
+        """
+        :param miss: CacheMiss
+        :return: A set of hashable keys for everything the miss needs
+        """
+        needs = {request.key for request in miss.requests}
+        needs.update(DataPointBatcher.prefetch_key(identifier, item) for identifier, item in miss.data_points)
+        needs.update(("/verify", identifier) for identifier in miss.identifiers)
+        return needs
+
+
+class RecalcPlanner:
+    """
+    Collects the cell calls that miss the caches during one recalculation burst
+    and fetches what they need in rounds. Each round:
+    1. verifies all of the unknown identifiers with one bulk validation,
+    2. sends all of the data points to the data point batcher at once,
+    3. fetches each distinct request once, most waiting cells first.
+    Results are put in IntrinioEngine.prefetched and every waiting call is run
+    again in cache only mode, which moves the results into the regular caches.
+    At the end of a round only the results that the waiting calls will read again are kept.
+    A call that needs more (e.g. the remaining pages of a query) waits for the
+    next round. Calls whose needs are unknown are run on a worker thread.
+    """
+    # A burst ends when no call has arrived for this long (seconds)...
+    burst_window = 0.1
+    # ...or when it has lasted this long
+    max_burst = 1.0
+    # A call that is still missing after this many rounds is run on a worker thread
+    max_rounds = 8
+    max_workers = 16
+    executor = None
+    pending = []
+    first_arrival = 0.0
+    last_arrival = 0.0
+    condition = threading.Condition()
+    thread = None
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def add(cls, result, func, miss):
+        """
+        Queue a call for the current burst
+        :param result: The object that receives the value: result.deliver(value)
+        :param func: Function that computes the value
+        :param miss: The CacheMiss raised by the call in cache only mode
+        :return: None
+        """
+        if not miss.is_described():
+            cls._run_on_worker(PendingCall(result, func, miss))
+            return
+        with cls.condition:
+            now = time.time()
+            if not cls.pending:
+                cls.first_arrival = now
+            cls.last_arrival = now
+            cls.pending.append(PendingCall(result, func, miss))
+            if cls.thread is None:
+                cls.thread = threading.Thread(target=cls._plan_loop, name="intrinio-planner", daemon=True)
+                cls.thread.start()
+            cls.condition.notify()
+
+    @classmethod
+    def _plan_loop(cls):
+        while True:
+            with cls.condition:
+                while not cls.pending:
+                    cls.condition.wait()
+                while True:
+                    end = min(cls.last_arrival + cls.burst_window, cls.first_arrival + cls.max_burst)
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        break
+                    cls.condition.wait(remaining)
+                calls = cls.pending
+                cls.pending = []
+            try:
+                cls._run_round(calls)
+            except Exception as ex:
+                logger.error("Recalc planner round failed: %s", str(ex))
+                IntrinioEngine.prefetched = {}
+                for call in calls:
+                    cls._run_on_worker(call)
+
+    @classmethod
+    def _run_round(cls, calls):
+        """
+        Fetch what a set of calls needs, then run each call again
+        :param calls: List of PendingCall
+        :return: None
+        """
+        identifiers = {}
+        data_points = {}
+        requests = {}
+        waiting = {}
+        for call in calls:
+            for identifier in call.miss.identifiers:
+                identifiers[identifier] = True
+            for data_point in call.miss.data_points:
+                data_points[data_point] = True
+            for request in call.miss.requests:
+                requests[request.key] = request
+                waiting[request.key] = waiting.get(request.key, 0) + 1
+        logger.debug("Recalc plan: %d calls, %d identifiers, %d data points, %d requests",
+                     len(calls), len(identifiers), len(data_points), len(requests))
+
+        if identifiers:
+            validate_identifiers(list(identifiers))
+        prefetched = dict(IntrinioEngine.prefetched)
+        futures = [(DataPointBatcher.prefetch_key(identifier, item), DataPointBatcher.submit(identifier, item))
+                   for identifier, item in data_points]
+        # The engine sends requests in the order they are submitted
+        ordered = sorted(requests.values(), key=lambda request: -waiting[request.key])
+        if ordered:
+            for request, res in zip(ordered, IntrinioEngine.run_all(ordered)):
+                prefetched[request.key] = res
+        for key, future in futures:
+            prefetched[key] = future.result()
+
+        IntrinioEngine.prefetched = prefetched
+        keep = set()
+        try:
+            for call in calls:
+                if cls._rerun(call):
+                    keep.update(call.fetched)
+        finally:
+            # Everything else is in the regular caches now. Leftovers (e.g. failures)
+            # must not answer later cache only calls.
+            IntrinioEngine.prefetched = {key: res for key, res in prefetched.items() if key in keep}
+
+    @classmethod
+    def _rerun(cls, call):
+        """
+        Run a call again in cache only mode
+        :param call: PendingCall
+        :return: True if the call waits for the next round
+        """
+        IntrinioEngine.cache_only(True)
+        try:
+            value = call.func()
+        except CacheMiss as miss:
+            needs = PendingCall.needs_of(miss)
+            call.rounds += 1
+            if not miss.is_described() or needs <= call.needs | call.fetched or call.rounds >= cls.max_rounds:
+                # The round did not make progress on this call
+                cls._run_on_worker(call)
+                return False
+            call.fetched.update(call.needs)
+            call.miss = miss
+            call.needs = needs
+            with cls.condition:
+                if not cls.pending:
+                    cls.first_arrival = time.time()
+                cls.pending.append(call)
+            return True
+        except Exception as ex:
+            logger.error("Planned call failed: %s", str(ex))
+            value = "Error"
+        finally:
+            IntrinioEngine.cache_only(False)
+        call.result.deliver(value)
+        return False
+
+    @classmethod
+    def _run_on_worker(cls, call):
+        with cls.condition:
+            if cls.executor is None:
+                cls.executor = ThreadPoolExecutor(max_workers=cls.max_workers, thread_name_prefix="intrinio-async")
+        cls.executor.submit(cls._run, call)
+
+    @staticmethod
+    def _run(call):
+        try:
+            value = call.func()
+        except Exception as ex:
+            logger.error("Background call failed: %s", str(ex))
+            value = "Error"
+        call.result.deliver(value)
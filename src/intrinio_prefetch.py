@@ -0,0 +1,207 @@
+#
+# intrinio_prefetch - Fill the disk cache from the command line
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+# Run this module from the src folder with the available python 3 interpreter
+#   python3 -m intrinio_prefetch --datasets prices,financials AAPL MSFT
+#
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from intrinio_app_logger import AppLogger
+from intrinio_lib import QConfiguration
+from intrinio_client import IntrinioClient
+from intrinio_disk_cache import DiskCache
+from intrinio_access import validate_identifiers, get_historical_prices_range, get_fundamentals_data, \
+    get_financials_statement, get_reported_financials_statement
+from intrinio_company_sec_filings import get_company_sec_filings_count
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+DATASETS = ["prices", "fundamentals", "financials", "reported", "filings"]
+STATEMENTS = ["income_statement", "balance_sheet", "cash_flow_statement"]
+
+
+def prefetch_prices(ticker, args):
+    """
+    Daily prices from start_date through today
+    :return: None or an error message
+    """
+    rows = get_historical_prices_range(ticker, ["date"], args.start_date, None, "daily", 0)
+    return rows if isinstance(rows, str) else None
+
+
+def prefetch_fundamentals(ticker, args):
+    """
+    The first page of standardized fundamentals for each statement and period type
+    :return: None or an error message
+    """
+    for statement in args.statements:
+        for period_type in args.period_types:
+            v = get_fundamentals_data(ticker, statement, period_type, 0, "fiscal_year")
+            if isinstance(v, str) and v:
+                return v
+    return None
+
+
+def prefetch_financials(ticker, args):
+    """
+    The most recent standardized statements
+    :return: None or an error message
+    """
+    return _prefetch_statements(get_financials_statement, ticker, args)
+
+
+def prefetch_reported(ticker, args):
+    """
+    The most recent as reported statements
+    :return: None or an error message
+    """
+    return _prefetch_statements(get_reported_financials_statement, ticker, args)
+
+
+def _prefetch_statements(get_statement, ticker, args):
+    for statement in args.statements:
+        for period_type in args.period_types:
+            for sequence in range(args.periods):
+                # A sequence number in place of the fiscal year selects the n-th most recent period
+                rows = get_statement(ticker, statement, sequence, period_type)
+                if rows == "":
+                    # There are no more periods
+                    break
+                if isinstance(rows, str):
+                    return rows
+    return None
+
+
+def prefetch_filings(ticker, args):
+    """
+    The first page of SEC filings
+    :return: None or an error message
+    """
+    v = get_company_sec_filings_count(ticker, "", "", "")
+    return v if isinstance(v, str) else None
+
+
+PREFETCHERS = {
+    "prices": prefetch_prices,
+    "fundamentals": prefetch_fundamentals,
+    "financials": prefetch_financials,
+    "reported": prefetch_reported,
+    "filings": prefetch_filings,
+}
+
+
+def _prefetch(ticker, dataset, args):
+    try:
+        return PREFETCHERS[dataset](ticker, args)
+    except Exception as ex:
+        logger.error("Prefetch of %s %s failed: %s", ticker, dataset, str(ex))
+        return str(ex)
+
+
+def _read_tickers(args):
+    tickers = list(args.tickers)
+    if args.file:
+        with open(args.file, "r") as f:
+            for line in f:
+                # One or more tickers per line, # starts a comment
+                tickers.extend(line.split("#")[0].replace(",", " ").split())
+    # Remove duplicates, keeping the order
+    return list(dict.fromkeys(ticker.upper() for ticker in tickers))
+
+
+def _comma_list(value):
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="intrinio_prefetch",
+                                     description="Retrieve Intrinio data into the disk cache used by the "
+                                                 "Intrinio LOCalc extension.")
+    parser.add_argument("tickers", nargs="*", help="Ticker symbols")
+    parser.add_argument("-f", "--file", help="File of ticker symbols")
+    parser.add_argument("-d", "--datasets", type=_comma_list, default=DATASETS,
+                        help="Comma separated datasets: " + ",".join(DATASETS) + " (default all)")
+    parser.add_argument("-s", "--statements", type=_comma_list, default=STATEMENTS,
+                        help="Comma separated statements (default " + ",".join(STATEMENTS) + ")")
+    parser.add_argument("-t", "--period-types", type=_comma_list, default=["FY"],
+                        help="Comma separated period types, e.g. FY,QTR (default FY)")
+    parser.add_argument("-p", "--periods", type=int, default=4,
+                        help="Number of most recent fiscal periods of financials (default 4)")
+    parser.add_argument("--start-date", help="First date of daily prices, YYYY-MM-DD (default all)")
+    parser.add_argument("-w", "--workers", type=int, default=8,
+                        help="Tickers retrieved at the same time (default 8). Requests are paced by "
+                             "the requestspersecond setting.")
+    args = parser.parse_args(argv)
+    unknown = [dataset for dataset in args.datasets if dataset not in PREFETCHERS]
+    if unknown:
+        parser.error("unknown dataset: " + ",".join(unknown))
+    return args
+
+
+def main(argv=None):
+    """
+    Prefetch the requested datasets for a list of tickers
+    :param argv: Command line arguments
+    :return: Process exit code
+    """
+    args = parse_args(argv)
+    IntrinioClient.start(log_to_file=True)
+
+    # Outside of LibreOffice the certificates are in the certifi folder
+    if not os.path.exists(QConfiguration.cacerts):
+        QConfiguration.cacerts = os.path.join(QConfiguration.cwd, "..", "certifi", "cacert.pem")
+        QConfiguration.ssl_context = QConfiguration.create_ssl_context()
+    if not QConfiguration.is_configured():
+        print("Intrinio credentials are not configured in", QConfiguration.full_file_path)
+        return 2
+    if not DiskCache.enabled:
+        print("The disk cache is disabled (see the diskcache setting)")
+        return 2
+
+    tickers = _read_tickers(args)
+    if not tickers:
+        print("No tickers")
+        return 2
+    valid = [ticker for ticker, ok in zip(tickers, validate_identifiers(tickers)) if ok]
+    for ticker in tickers:
+        if ticker not in valid:
+            print("Invalid ticker", ticker)
+
+    jobs = [(ticker, dataset) for ticker in valid for dataset in args.datasets]
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+        futures = [(ticker, dataset, executor.submit(_prefetch, ticker, dataset, args)) for ticker, dataset in jobs]
+        for ticker, dataset, future in futures:
+            error = future.result()
+            if error:
+                failures += 1
+                print(ticker, dataset, "failed:", error)
+            else:
+                print(ticker, dataset, "ok")
+
+    # Wait for the write-behind queue to reach the database
+    DiskCache.flush()
+    print("Prefetched {0} of {1} datasets for {2} tickers".format(len(jobs) - failures, len(jobs), len(valid)))
+    return 1 if failures or len(valid) < len(tickers) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
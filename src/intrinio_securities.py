@@ -16,7 +16,11 @@
 #
 
 from intrinio_app_logger import AppLogger
-from intrinio_lib import QConfiguration, IntrinioBase
+from intrinio_lib import IntrinioBase
+from intrinio_engine import IntrinioRequest
+from intrinio_cache import QueryCache, DAY
+from intrinio_cache_engine import CacheEngine
+from intrinio_master import SecuritiesMaster
 
 # Logger init
 app_logger = AppLogger("intrinio-extension")
@@ -32,89 +36,39 @@ class IntrinioSecurities(IntrinioBase):
     def get_securities_page(query, exchange_symbol, last_crsp_adj_date, sequence):
         page_number = IntrinioSecurities.get_page_number(sequence)
 
-        template_url = "{0}/securities?page_size={1}&page_number={2}"
-        url_string = template_url.format(QConfiguration.base_url, IntrinioSecurities.page_size, page_number)
-        if query:
-            url_string += "&query=" + query
-        if exchange_symbol:
-            url_string += "&exch_symbol=" + exchange_symbol
-        if last_crsp_adj_date:
-            url_string += "&last_crsp_adj_date=" + last_crsp_adj_date
-
-        # print (url_string)
-        res = IntrinioSecurities.exec_request(url_string)
+        request = IntrinioRequest("/securities", [("page_size", IntrinioSecurities.page_size),
+                                                  ("page_number", page_number),
+                                                  ("query", query),
+                                                  ("exch_symbol", exchange_symbol),
+                                                  ("last_crsp_adj_date", last_crsp_adj_date)])
+
+        res = IntrinioSecurities.submit(request)
         # print (res)
         return res
 
     @staticmethod
     def get_security_by_identifier(identifier):
-        template_url = "{0}/securities?identifier={1}"
-        url_string = template_url.format(QConfiguration.base_url, identifier)
+        request = IntrinioRequest("/securities", [("identifier", identifier)])
 
-        # print (url_string)
-        res = IntrinioSecurities.exec_request(url_string)
+        res = IntrinioSecurities.submit(request)
         # print (res)
         return res
 
 
-class SecuritiesQueryCache:
-    query_values = {}
-
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def _query_key(query, exchange_symbol, last_crsp_adj_date, page_number):
-        if not query:
-            query = "n1"
-        if not exchange_symbol:
-            exchange_symbol = "n2"
-        if not last_crsp_adj_date:
-            last_crsp_adj_date = "n3"
-        return query + "_" + exchange_symbol + "_" + last_crsp_adj_date + "_" + str(page_number)
-
-    @classmethod
-    def is_query_value_cached(cls, query, exchange_symbol, last_crsp_adj_date, page_number):
-        key = cls._query_key(query, exchange_symbol, last_crsp_adj_date, page_number)
-        return key in cls.query_values
-
-    @classmethod
-    def get_query_value(cls, query, exchange_symbol, last_crsp_adj_date, page_number):
-        key = cls._query_key(query, exchange_symbol, last_crsp_adj_date, page_number)
-        # This returns the entire API call result (which can be a large dict)
-        return cls.query_values[key]
-
-    @classmethod
-    def add_query_value(cls, query_value, query, exchange_symbol, last_crsp_adj_date, page_number):
-        key = cls._query_key(query, exchange_symbol, last_crsp_adj_date, page_number)
-        cls.query_values[key] = query_value
-
-
-class SecuritiesCache:
-    query_values = {}
-
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def _query_key(identifier):
-        return identifier
-
-    @classmethod
-    def is_query_value_cached(cls, identifier):
-        key = cls._query_key(identifier)
-        return key in cls.query_values
+class SecuritiesQueryCache(QueryCache):
+    """
+    Used to track security list queries
+    """
+    # The key is (query, exchange_symbol, last_crsp_adj_date, page_number)
+    namespace = CacheEngine.namespace("securities_queries", persist=True, disk_ttl=DAY)
 
-    @classmethod
-    def get_query_value(cls, identifier):
-        key = cls._query_key(identifier)
-        # This returns the entire API call result (which can be a large dict)
-        return cls.query_values[key]
 
-    @classmethod
-    def add_query_value(cls, query_value, identifier):
-        key = cls._query_key(identifier)
-        cls.query_values[key] = query_value
+class SecuritiesCache(QueryCache):
+    """
+    Used to track security details
+    """
+    # The key is (identifier,)
+    namespace = CacheEngine.namespace("securities", persist=True, disk_ttl=DAY)
 
 
 def get_securities_by_query(query, exchange_symbol, last_crsp_adj_date, sequence, item):
@@ -155,7 +109,7 @@ def get_securities_by_query(query, exchange_symbol, last_crsp_adj_date, sequence
     res = __get_securities(query, exchange_symbol, last_crsp_adj_date, sequence)
 
     if "data" in res:
-        if len(res["data"]) > sequence:
+        if len(res["data"]) > page_index:
             if item in res["data"][page_index]:
                 v = res["data"][page_index][item]
             else:
@@ -170,6 +124,10 @@ def get_securities_by_query(query, exchange_symbol, last_crsp_adj_date, sequence
 def __get_securities(query, exchange_symbol, last_crsp_adj_date, sequence):
     page_number = IntrinioBase.get_page_number(sequence)
 
+    local_page = SecuritiesMaster.get_query_page(query, exchange_symbol, last_crsp_adj_date, page_number)
+    if local_page is not None:
+        return local_page
+
     if SecuritiesQueryCache.is_query_value_cached(query, exchange_symbol, last_crsp_adj_date, page_number):
         logger.debug("Cache hit for query securities %s %s %s %d", query, exchange_symbol, last_crsp_adj_date, sequence)
         query_value = SecuritiesQueryCache.get_query_value(query, exchange_symbol, last_crsp_adj_date, page_number)
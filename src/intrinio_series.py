@@ -0,0 +1,570 @@
+#
+# intrinio_series - Date anchored time series store for historical prices and data
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+import math
+import bisect
+import datetime
+import threading
+import time
+from array import array
+from intrinio_app_logger import AppLogger
+from intrinio_lib import IntrinioBase
+from intrinio_engine import IntrinioEngine
+from intrinio_cache_engine import estimate_size
+from intrinio_columnar import ColumnarPage, ordinal_to_date
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+# Coverage that starts here reaches back to the first available row
+HISTORY_START = 1
+
+
+class TimeSeries:
+    """
+    All of the rows fetched for one series (e.g. the daily prices of a ticker),
+    merged into one series sorted by date. Dates are day ordinals (int32) and numeric
+    fields are arrays of doubles, as in ColumnarPage.
+    The coverage is a sorted list of [start, end] day ordinal ranges for which every
+    available row has been fetched. Rows are only trusted inside the coverage.
+    Coverage from tail_start to today is provisional: the newest rows may still be
+    posted or revised, so it is dropped and fetched again (as a small delta request)
+    once it is older than the caller's tail life.
+    """
+    # Columns that signal a corporate action. Adjusted values of all earlier rows change.
+    adjustment_columns = {"split_ratio": 1.0, "ex_dividend": 0.0}
+
+    def __init__(self, dates=None, columns=None, coverage=None, tail_start=None, tail_checked=0.0):
+        self.dates = dates if dates is not None else array("i")
+        self.columns = columns if columns is not None else {}
+        self.coverage = coverage if coverage is not None else []
+        self.tail_start = tail_start
+        # time.time() of the fetch that set tail_start
+        self.tail_checked = tail_checked
+        # Changes whenever rows are added or removed
+        self.version = 0
+        # Resampled bars: (frequency, start, end) -> (version, bucket starts, bars)
+        self.resampled = {}
+        # Held while the series is being filled so that only one caller fetches a gap
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __sizeof__(self):
+        # Includes the strings of non-numeric columns and the memoized resampled bars
+        return object.__sizeof__(self) + sys.getsizeof(self.dates) + estimate_size(self.columns) + \
+            estimate_size(self.coverage) + estimate_size(self.resampled)
+
+    def has_item(self, item):
+        return item == "date" or item in self.columns
+
+    def value(self, index, item):
+        """
+        Return the value of a field in a row
+        :param index: Row index (ascending date order)
+        :param item: Field name
+        :return: float for numeric fields (None if missing), ISO date string for date
+        """
+        if item == "date":
+            return ordinal_to_date(self.dates[index])
+        v = self.columns[item][index]
+        if isinstance(v, float) and math.isnan(v):
+            return None
+        return v
+
+    def index_range(self, start, end):
+        """
+        :param start: First day ordinal
+        :param end: Last day ordinal
+        :return: (lo, hi) such that rows lo to hi-1 are dated within [start, end]
+        """
+        return bisect.bisect_left(self.dates, start), bisect.bisect_right(self.dates, end)
+
+    def covered_interval(self, ordinal):
+        """
+        :param ordinal: A day ordinal
+        :return: The coverage range [start, end] containing the ordinal, or None
+        """
+        for interval in self.coverage:
+            if interval[0] <= ordinal <= interval[1]:
+                return interval
+        return None
+
+    def coverage_before(self, ordinal):
+        """
+        :param ordinal: A day ordinal
+        :return: The latest coverage range that ends before the ordinal, or None
+        """
+        before = None
+        for interval in self.coverage:
+            if interval[1] < ordinal:
+                before = interval
+        return before
+
+    def add_coverage(self, start, end):
+        """
+        Record [start, end] as covered, merging touching ranges
+        :return: None
+        """
+        intervals = sorted(self.coverage + [[start, end]])
+        merged = []
+        for interval in intervals:
+            if merged and interval[0] <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], interval[1])
+            else:
+                merged.append(list(interval))
+        self.coverage = merged
+
+    def expire_tail(self, tail_life):
+        """
+        Drop the provisional coverage if it is older than tail_life
+        :param tail_life: Seconds, or None if the provisional coverage never expires
+        :return: None
+        """
+        if self.tail_start is None or tail_life is None or time.time() - self.tail_checked <= tail_life:
+            return
+        self.truncate_coverage_after(self.tail_start)
+        self.tail_start = None
+
+    def truncate_coverage_after(self, ordinal):
+        """
+        Remove all coverage from the ordinal on
+        :param ordinal: A day ordinal
+        :return: None
+        """
+        coverage = []
+        for interval in self.coverage:
+            if interval[0] >= ordinal:
+                continue
+            coverage.append([interval[0], min(interval[1], ordinal - 1)])
+        self.coverage = coverage
+
+    def truncate_before(self, ordinal):
+        """
+        Remove all rows and coverage before the ordinal
+        :param ordinal: A day ordinal
+        :return: None
+        """
+        lo = bisect.bisect_left(self.dates, ordinal)
+        self.version += 1
+        self.dates = self.dates[lo:]
+        self.columns = {name: column[lo:] for name, column in self.columns.items()}
+        self.coverage = [[max(interval[0], ordinal), interval[1]] for interval in self.coverage
+                         if interval[1] >= ordinal]
+
+    def delta_gap(self):
+        """
+        The date range after the newest coverage, up to today
+        :return: (start, end) day ordinals, or None if the series has no coverage or is current
+        """
+        if not self.coverage:
+            return None
+        start = self.coverage[-1][1] + 1
+        end = today_ordinal()
+        if start > end:
+            return None
+        return start, end
+
+    def merge(self, page):
+        """
+        Merge the rows of a page into the series. A row in the page replaces
+        a row of the same date in the series.
+        :param page: ColumnarPage with dates
+        :return: None
+        """
+        if page.dates is None or len(page) == 0:
+            return
+        rows = {}
+        for i, d in enumerate(self.dates):
+            rows[d] = (self, i)
+        for i, d in enumerate(page.dates):
+            rows[d] = (page, i)
+        order = sorted(rows)
+
+        names = list(self.columns)
+        names.extend(name for name in page.columns if name not in self.columns)
+        columns = {}
+        for name in names:
+            numeric = isinstance(self.columns.get(name, array("d")), array) and \
+                isinstance(page.columns.get(name, array("d")), array)
+            missing = math.nan if numeric else None
+            values = []
+            for d in order:
+                source, i = rows[d]
+                column = source.columns.get(name)
+                values.append(column[i] if column is not None else missing)
+            columns[name] = array("d", values) if numeric else values
+        self.dates = array("i", order)
+        self.columns = columns
+        self.version += 1
+
+    def fill(self, start, end, sequence, page_request, tail_life=None):
+        """
+        Fetch rows until the series can answer the given sequence number for the
+        date range [start, end]. Only uncovered date gaps are requested.
+        :param start: First day ordinal or None for the first available row
+        :param end: Last day ordinal
+        :param sequence: 0-n counting back from the newest row in the range
+        :param page_request: Function (start_date, end_date, page_number) -> IntrinioRequest
+        where the dates are ISO strings or None
+        :param tail_life: Seconds that provisional coverage is trusted. None means forever.
+        :return: None if the series is ready, otherwise the failed API result dict
+        """
+        if start is not None and start > end:
+            return None
+        with self.lock:
+            self.expire_tail(tail_life)
+            while True:
+                interval = self.covered_interval(end)
+                if interval is not None:
+                    lo, hi = self.index_range(start or HISTORY_START, end)
+                    newer = hi - max(lo, self.index_range(interval[0], end)[0])
+                    if interval[0] == HISTORY_START or (start is not None and interval[0] <= start) or \
+                            newer > sequence:
+                        return None
+                    gap_end = interval[0] - 1
+                else:
+                    newer = 0
+                    gap_end = end
+                before = self.coverage_before(gap_end)
+                gap_start = start
+                if before is not None:
+                    gap_start = max(start or HISTORY_START, before[1] + 1)
+
+                res = self._fetch_gap(start, gap_start, gap_end, sequence + 1 - newer, page_request)
+                if res is not None:
+                    return res
+
+    def _fetch_gap(self, start, gap_start, gap_end, needed, page_request):
+        """
+        Fetch the rows of a gap in the coverage. When the requested range has a start
+        date every row of the gap is needed, so all of its pages are fetched concurrently.
+        Otherwise the pages holding the newest needed rows of the gap are fetched
+        concurrently.
+        :param needed: The number of the gap's newest rows the request needs
+        :return: None if the coverage was extended, otherwise the failed API result dict
+        """
+        start_date = ordinal_to_date(gap_start) if gap_start is not None else None
+        end_date = ordinal_to_date(gap_end)
+        logger.debug("Filling series gap %s to %s", start_date, end_date)
+        if start is not None:
+            pages = IntrinioBase.submit_all_pages(lambda page_number: page_request(start_date, end_date, page_number))
+        else:
+            page_count = max(1, math.ceil(needed / IntrinioBase.page_size))
+            pages = IntrinioEngine.run_all([page_request(start_date, end_date, page_number)
+                                            for page_number in range(1, page_count + 1)])
+            # The gap may have fewer pages than were requested
+            total_pages = int(pages[0].get("total_pages", 1))
+            pages = pages[:max(1, total_pages)]
+        return self.apply_gap(gap_start, gap_end, pages)
+
+    def apply_gap(self, gap_start, gap_end, pages):
+        """
+        Merge the fetched pages of a gap and extend the coverage
+        :param gap_start: First day ordinal of the gap or None
+        :param gap_end: Last day ordinal of the gap
+        :param pages: The API results in page order
+        :return: None if the coverage was extended, otherwise the failed API result dict
+        """
+        for res in pages:
+            if "data" not in res:
+                return res
+        pages = [ColumnarPage.from_result(res) for res in pages]
+
+        if gap_start is not None and len(self.dates) > 0 and self.dates[0] < gap_start and \
+                any(self._has_adjustment(page) for page in pages):
+            # A split or dividend in the new rows changes the adjusted values of every
+            # earlier row. The earlier rows are dropped and fetched again when needed.
+            logger.info("Corporate action after %s, dropping earlier rows", ordinal_to_date(gap_start - 1))
+            self.truncate_before(gap_start)
+
+        for page in pages:
+            self.merge(page)
+
+        last = pages[-1]
+        if int(last.info.get("current_page", 1)) >= int(last.info.get("total_pages", 1)):
+            # Every row in the gap has been fetched
+            self.add_coverage(gap_start if gap_start is not None else HISTORY_START, gap_end)
+        else:
+            # Only the newest rows of the gap have been fetched
+            self.add_coverage(min(last.dates), gap_end)
+
+        today = today_ordinal()
+        if gap_end >= today:
+            # Rows after the newest row (and a row for today) may still be posted or revised
+            newest = self.dates[-1] if len(self.dates) > 0 else today
+            self.tail_start = min(newest + 1, today)
+            self.tail_checked = time.time()
+        return None
+
+    @classmethod
+    def _has_adjustment(cls, page):
+        for name, normal in cls.adjustment_columns.items():
+            if name in page.columns:
+                for v in page.columns[name]:
+                    if v is not None and v == v and v != normal:
+                        return True
+        return False
+
+    def to_dict(self):
+        """
+        A JSON serializable form of the series (see from_dict()). The disk cache
+        calls this on its writer thread, so it waits for a fill in progress.
+        :return: dict
+        """
+        with self.lock:
+            return {"dates": list(self.dates),
+                    "columns": {name: [None if isinstance(v, float) and math.isnan(v) else v for v in column]
+                                for name, column in self.columns.items()},
+                    "numeric": [name for name, column in self.columns.items() if isinstance(column, array)],
+                    "coverage": [list(interval) for interval in self.coverage],
+                    "tail_start": self.tail_start,
+                    "tail_checked": self.tail_checked}
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Rebuild a series from to_dict()
+        :param d: dict
+        :return: TimeSeries
+        """
+        columns = {}
+        for name, values in d["columns"].items():
+            if name in d["numeric"]:
+                columns[name] = array("d", [math.nan if v is None else v for v in values])
+            else:
+                columns[name] = values
+        return cls(array("i", d["dates"]), columns, [list(interval) for interval in d["coverage"]],
+                   d.get("tail_start"), d.get("tail_checked", 0.0))
+
+
+def bucket_start(ordinal, frequency):
+    """
+    The first day of the resampling period that contains a day
+    :param ordinal: A day ordinal
+    :param frequency: weekly | monthly | quarterly | yearly
+    :return: Day ordinal
+    """
+    d = datetime.date.fromordinal(ordinal)
+    if frequency == "weekly":
+        return ordinal - d.weekday()
+    if frequency == "monthly":
+        return datetime.date(d.year, d.month, 1).toordinal()
+    if frequency == "quarterly":
+        return datetime.date(d.year, ((d.month - 1) // 3) * 3 + 1, 1).toordinal()
+    if frequency == "yearly":
+        return datetime.date(d.year, 1, 1).toordinal()
+    raise ValueError("Unknown frequency " + str(frequency))
+
+
+# How each price field is aggregated into a bar. Any other field takes its last value.
+RESAMPLE_RULES = {
+    "open": "first", "adj_open": "first",
+    "high": "max", "adj_high": "max",
+    "low": "min", "adj_low": "min",
+    "volume": "sum", "adj_volume": "sum", "ex_dividend": "sum",
+    "split_ratio": "product",
+}
+
+
+def _aggregate(rule, values):
+    values = [v for v in values if v is not None and v == v]
+    if not values:
+        return math.nan
+    if rule == "first":
+        return values[0]
+    if rule == "max":
+        return max(values)
+    if rule == "min":
+        return min(values)
+    if rule == "sum":
+        return math.fsum(values)
+    if rule == "product":
+        product = 1.0
+        for v in values:
+            product *= v
+        return product
+    return values[-1]
+
+
+def resample(series, frequency, start, end):
+    """
+    Derive OHLCV bars from the daily rows of a series within [start, end]. Each bar is
+    dated on the last trading day of its period: first open, max high, min low,
+    last close and summed volume. Results are memoized until the series changes.
+    :param series: TimeSeries of daily prices
+    :param frequency: weekly | monthly | quarterly | yearly
+    :param start: First day ordinal
+    :param end: Last day ordinal
+    :return: (bucket starts, TimeSeries of bars) in ascending date order
+    """
+    memo = series.resampled.get((frequency, start, end))
+    if memo is not None and memo[0] == series.version:
+        return memo[1], memo[2]
+
+    lo, hi = series.index_range(start, end)
+    starts = []
+    bounds = []
+    for i in range(lo, hi):
+        b = bucket_start(series.dates[i], frequency)
+        if not starts or starts[-1] != b:
+            starts.append(b)
+            bounds.append([i, i + 1])
+        else:
+            bounds[-1][1] = i + 1
+
+    dates = array("i", [series.dates[last - 1] for first, last in bounds])
+    columns = {}
+    for name, column in series.columns.items():
+        rule = RESAMPLE_RULES.get(name, "last")
+        if isinstance(column, array):
+            columns[name] = array("d", [_aggregate(rule, column[first:last]) for first, last in bounds])
+        else:
+            columns[name] = [column[last - 1] for first, last in bounds]
+    bars = TimeSeries(dates, columns)
+
+    if len(series.resampled) > 32:
+        series.resampled.clear()
+    series.resampled[(frequency, start, end)] = (series.version, starts, bars)
+    return starts, bars
+
+
+def _resampled_bars(series, frequency, start, end, count, tail_life):
+    """
+    Resample the daily rows for [start, end] if the daily coverage includes every
+    day of the newest count bars
+    :return: TimeSeries of bars or None if the request must go to Intrinio
+    """
+    with series.lock:
+        series.expire_tail(tail_life)
+        interval = series.covered_interval(end)
+        if interval is None:
+            return None
+        # Daily rows are complete from here on
+        complete = HISTORY_START if interval[0] == HISTORY_START else interval[0]
+        if start is not None and start >= interval[0]:
+            complete = HISTORY_START
+        range_start = max(start or HISTORY_START, interval[0])
+        starts, bars = resample(series, frequency, range_start, end)
+
+    index = len(bars) - count if count is not None else 0
+    if index < 0 or not starts:
+        # Fewer bars than requested. That is only the answer if there are no more days.
+        if complete == HISTORY_START:
+            return bars
+        return None
+    if starts[index] < complete:
+        # The bar's period begins before the daily coverage
+        return None
+    return bars
+
+
+def get_resampled_value(series, frequency, start, end, sequence, item, tail_life=None):
+    """
+    Answer a non-daily (sequence, start, end) request from a daily series, if the
+    daily coverage allows it
+    :param series: TimeSeries of daily prices
+    :param frequency: weekly | monthly | quarterly | yearly
+    :param start: First day ordinal or None
+    :param end: Last day ordinal
+    :param sequence: 0-n counting back from the newest bar in the range
+    :param item: Field name
+    :param tail_life: Seconds that provisional coverage is trusted. None means forever.
+    :return: A tuple (answered, value)
+    """
+    bars = _resampled_bars(series, frequency, start, end, sequence + 1, tail_life)
+    if bars is None:
+        return False, None
+    return True, get_series_value(bars, None, end, sequence, item)
+
+
+def get_resampled_rows(series, frequency, start, end, count, items, tail_life=None):
+    """
+    Answer a non-daily block request from a daily series, if the daily coverage allows it
+    :param series: TimeSeries of daily prices
+    :param frequency: weekly | monthly | quarterly | yearly
+    :param start: First day ordinal or None
+    :param end: Last day ordinal
+    :param count: Maximum number of bars or None for all of them
+    :param items: List of field names
+    :param tail_life: Seconds that provisional coverage is trusted. None means forever.
+    :return: A tuple (answered, rows)
+    """
+    bars = _resampled_bars(series, frequency, start, end, count, tail_life)
+    if bars is None:
+        return False, None
+    return True, get_series_rows(bars, None, end, count, items)
+
+
+def get_series_value(series, start, end, sequence, item):
+    """
+    Answer a (sequence, start, end) request from a filled series
+    :param series: TimeSeries
+    :param start: First day ordinal or None
+    :param end: Last day ordinal
+    :param sequence: 0-n counting back from the newest row in the range
+    :param item: Field name
+    :return: The value, "Invalid item" or "" if the row does not exist
+    """
+    lo, hi = series.index_range(start or HISTORY_START, end)
+    index = hi - 1 - sequence
+    if index < lo:
+        return ""
+    if not series.has_item(item):
+        return "Invalid item"
+    return _cell_value(series.value(index, item))
+
+
+def get_series_rows(series, start, end, count, items):
+    """
+    Answer a block request from a filled series. Row 0 is the newest row in the range,
+    i.e. row n holds what sequence number n would return for each item.
+    :param series: TimeSeries
+    :param start: First day ordinal or None
+    :param end: Last day ordinal
+    :param count: Maximum number of rows or None for all of them
+    :param items: List of field names
+    :return: List of rows, each a list with one value per item
+    """
+    lo, hi = series.index_range(start or HISTORY_START, end)
+    if count is not None:
+        lo = max(lo, hi - count)
+    valid = [series.has_item(item) for item in items]
+    rows = []
+    for index in range(hi - 1, lo - 1, -1):
+        row = []
+        for item, is_valid in zip(items, valid):
+            if not is_valid:
+                row.append("Invalid item")
+                continue
+            v = _cell_value(series.value(index, item))
+            row.append("" if v is None else v)
+        rows.append(row)
+    return rows
+
+
+def _cell_value(v):
+    if isinstance(v, str) and v.isnumeric():
+        v = float(v)
+    return v
+
+
+def today_ordinal():
+    return datetime.date.today().toordinal()
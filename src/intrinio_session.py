@@ -0,0 +1,177 @@
+#
+# intrinio_session - Persistent HTTPS connection pool for Intrinio requests
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import http.client
+import urllib.parse
+import threading
+import time
+import ssl
+from intrinio_app_logger import AppLogger
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+
+class IntrinioSession:
+    """
+    A long lived HTTPS session to the Intrinio API host. The session keeps
+    a bounded pool of keep-alive connections so that steady state requests
+    reuse an already established TCP/TLS connection.
+    """
+    # Errors that indicate a kept-alive socket was closed by the server
+    stale_errors = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionError, ssl.SSLEOFError)
+    redirect_codes = (301, 302, 303, 307, 308)
+    # Like urllib, give up after this many redirects
+    max_redirects = 10
+
+    def __init__(self, base_url, ssl_context, pool_size=4, timeout=60.0, max_idle=60.0):
+        """
+        :param base_url: The base URL for all requests (e.g. https://api.intrinio.com)
+        :param ssl_context: The SSL context used for every connection
+        :param pool_size: Maximum number of concurrent connections
+        :param timeout: Socket timeout in seconds
+        :param max_idle: Idle connections older than this (seconds) are discarded
+        """
+        parts = urllib.parse.urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port
+        self.ssl_context = ssl_context
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        # Idle connections as (connection, last used time) pairs, most recently used last
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+
+    def get(self, url_string, headers=None):
+        """
+        Submit a GET request over a pooled connection. A request that fails
+        on a reused connection because the server dropped it is retried once
+        on a new connection. Redirects are followed.
+        :param url_string: Full URL of the request
+        :param headers: Dict of request headers
+        :return: A tuple (status, reason, body) where body is bytes
+        """
+        for redirects in range(self.max_redirects + 1):
+            parts = urllib.parse.urlsplit(url_string)
+            if (parts.hostname, parts.port) == (self.host, self.port):
+                status, reason, body, location = self._get_pooled(url_string, headers)
+            else:
+                status, reason, body, location = self._get_once(url_string, headers)
+            if status not in self.redirect_codes or not location:
+                return status, reason, body
+            location = urllib.parse.urljoin(url_string, location)
+            logger.debug("Redirected to %s", location)
+            if urllib.parse.urlsplit(location).hostname != parts.hostname and headers:
+                # Credentials are not sent to another host
+                headers = {k: v for k, v in headers.items() if k.lower() != "authorization"}
+            url_string = location
+        return status, "Too many redirects", body
+
+    def _get_once(self, url_string, headers):
+        """
+        GET from a host other than the session's over a connection that is not pooled
+        :return: A tuple (status, reason, body, location)
+        """
+        parts = urllib.parse.urlsplit(url_string)
+        if parts.scheme == "https":
+            conn = http.client.HTTPSConnection(parts.hostname, parts.port, timeout=self.timeout,
+                                               context=self.ssl_context)
+        else:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=self.timeout)
+        try:
+            conn.request("GET", self._path(parts), headers=headers or {})
+            response = conn.getresponse()
+            body = response.read()
+        finally:
+            conn.close()
+        return response.status, response.reason, body, response.getheader("Location")
+
+    @staticmethod
+    def _path(parts):
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        return path
+
+    def _get_pooled(self, url_string, headers):
+        """
+        GET over a pooled connection
+        :return: A tuple (status, reason, body, location)
+        """
+        parts = urllib.parse.urlsplit(url_string)
+        path = self._path(parts)
+
+        with self._slots:
+            conn, reused = self._checkout()
+            while True:
+                try:
+                    conn.request("GET", path, headers=headers or {})
+                    response = conn.getresponse()
+                    body = response.read()
+                    break
+                except self.stale_errors as ex:
+                    conn.close()
+                    if not reused:
+                        raise
+                    logger.debug("Stale connection to %s (%s), reconnecting", self.host, str(ex))
+                    conn, reused = self._create_connection(), False
+                except Exception:
+                    conn.close()
+                    raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(conn)
+
+        return response.status, response.reason, body, response.getheader("Location")
+
+    def close(self):
+        """
+        Close all idle connections
+        :return: None
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for conn, last_used in idle:
+            conn.close()
+
+    def _create_connection(self):
+        logger.debug("Opening HTTPS connection to %s", self.host)
+        return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self.ssl_context)
+
+    def _checkout(self):
+        """
+        Return an idle connection if one is available, otherwise a new one.
+        :return: A tuple (connection, reused)
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if now - last_used <= self.max_idle:
+                    return conn, True
+                conn.close()
+        return self._create_connection(), False
+
+    def _checkin(self, conn):
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
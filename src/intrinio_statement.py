@@ -0,0 +1,133 @@
+#
+# intrinio_statement - Financial statements held as tag/value objects
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+from intrinio_cache_engine import estimate_size
+
+
+class FinancialStatement:
+    """
+    The tag values of one standardized statement for one fiscal period.
+    Tag names are interned, so the many statements of a workbook share them.
+    """
+    # The value of a tag that the statement does not define
+    undefined = "na"
+
+    def __init__(self, values=None):
+        """
+        :param values: Dict of tag -> value
+        """
+        self.values = values if values is not None else {}
+
+    @classmethod
+    def from_pages(cls, pages):
+        """
+        Build a statement from all of the pages of a /financials/standardized query
+        :param pages: List of page results
+        :return: FinancialStatement
+        """
+        statement = cls()
+        for res in pages:
+            for tv in res.get("data", []):
+                statement.values[sys.intern(tv["tag"])] = tv["value"]
+        return statement
+
+    def value(self, tag):
+        """
+        :param tag: Standardized tag
+        :return: The tag's value or "na" if it is not defined
+        """
+        return self.values.get(tag, self.undefined)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + estimate_size(self.values)
+
+    def to_dict(self):
+        """
+        A JSON serializable form of the statement (see from_dict())
+        :return: dict
+        """
+        return {"values": self.values}
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Rebuild a statement from to_dict()
+        :param d: dict
+        :return: FinancialStatement
+        """
+        return cls({sys.intern(tag): v for tag, v in d["values"].items()})
+
+
+class ReportedFinancialStatement(FinancialStatement):
+    """
+    The XBRL tag values of one as reported statement for one fiscal period.
+    Values without a domain tag are kept by XBRL tag. Values with a domain
+    tag are kept in an index by (xbrl_tag, domain_tag).
+    """
+    def __init__(self, values=None, index=None):
+        """
+        :param values: Dict of xbrl_tag -> value
+        :param index: Dict of (xbrl_tag, domain_tag) -> value
+        """
+        super().__init__(values)
+        self.index = index if index is not None else {}
+
+    @classmethod
+    def from_pages(cls, pages):
+        """
+        Build a statement from all of the pages of a /financials/reported query
+        :param pages: List of page results
+        :return: ReportedFinancialStatement
+        """
+        statement = cls()
+        for res in pages:
+            for tv in res.get("data", []):
+                xbrl_tag = sys.intern(tv["xbrl_tag"])
+                if tv.get("domain_tag"):
+                    statement.index[(xbrl_tag, sys.intern(tv["domain_tag"]))] = tv["value"]
+                else:
+                    statement.values[xbrl_tag] = tv["value"]
+        return statement
+
+    def value(self, tag, domain_tag=None):
+        """
+        :param tag: XBRL tag
+        :param domain_tag: XBRL domain tag or None
+        :return: The tag's value or "na" if it is not defined
+        """
+        if domain_tag:
+            return self.index.get((tag, domain_tag), self.undefined)
+        return self.values.get(tag, self.undefined)
+
+    def __len__(self):
+        return len(self.values) + len(self.index)
+
+    def __sizeof__(self):
+        return super().__sizeof__() + estimate_size(self.index)
+
+    def to_dict(self):
+        return {"values": self.values,
+                "index": [[xbrl_tag, domain_tag, v] for (xbrl_tag, domain_tag), v in self.index.items()]}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls({sys.intern(tag): v for tag, v in d["values"].items()},
+                   {(sys.intern(xbrl_tag), sys.intern(domain_tag)): v for xbrl_tag, domain_tag, v in d["index"]})
@@ -17,6 +17,7 @@
 
 from http import HTTPStatus
 from intrinio_lib import IntrinioBase, QConfiguration
+from intrinio_client import IntrinioClient
 from intrinio_app_logger import AppLogger
 import os
 
@@ -31,11 +32,14 @@ def print_stats():
     Print Intrinio usage statistics.
     :return:
     """
+    IntrinioClient.start()
+
     # Inject certificate file location
     if os.path.exists("../certifi/cacert.pem"):
         QConfiguration.cacerts = "../certifi/cacert.pem"
     else:
         QConfiguration.cacerts = "certifi/cacert.pem"
+    QConfiguration.ssl_context = QConfiguration.create_ssl_context()
 
     r = IntrinioBase.get_usage("com_fin_data")
     if r["status_code"] == HTTPStatus.OK:
@@ -0,0 +1,186 @@
+#
+# intrinio_volatile - Asynchronous cell results for LO Calc
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+# References
+# https://api.libreoffice.org/docs/idl/ref/interfacecom_1_1sun_1_1star_1_1sheet_1_1XVolatileResult.html
+#
+
+import threading
+import functools
+import unohelper
+from com.sun.star.sheet import XVolatileResult, ResultEvent
+from intrinio_app_logger import AppLogger
+from intrinio_lib import QConfiguration
+from intrinio_engine import IntrinioEngine, CacheMiss
+from intrinio_cache_engine import CacheEngine
+from intrinio_planner import RecalcPlanner
+from intrinio_warmup import WarmUpManifest
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+
+class IntrinioResult(unohelper.Base, XVolatileResult):
+    """
+    A cell result whose value is delivered later. Calc registers a listener
+    for each cell that shows the result and updates the cells whenever
+    the value changes.
+    """
+    def __init__(self, key, value):
+        """
+        :param key: The AsyncResults key of the call
+        :param value: The value shown until the real value arrives
+        """
+        self.key = key
+        self.value = value
+        self.pending = False
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def addResultListener(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+            value = self.value
+        listener.modified(ResultEvent(self, value))
+
+    def removeResultListener(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+        AsyncResults.release(self)
+
+    def set_value(self, value):
+        """
+        Change the value and notify every listener
+        :param value: The new value
+        :return: None
+        """
+        with self.lock:
+            changed = value != self.value
+            self.value = value
+            listeners = list(self.listeners)
+        if changed:
+            for listener in listeners:
+                try:
+                    listener.modified(ResultEvent(self, value))
+                except Exception as ex:
+                    logger.error("Result listener failed: %s", str(ex))
+
+    def deliver(self, value):
+        """
+        Set the value computed for a pending call
+        :param value: The new value
+        :return: None
+        """
+        self.pending = False
+        self.set_value(value)
+        AsyncResults.release(self)
+
+    def is_unused(self):
+        """
+        :return: True if no cell shows the result and no value is on its way
+        """
+        with self.lock:
+            return not self.pending and not self.listeners
+
+
+class AsyncResults:
+    """
+    Answers Calc function calls without waiting for Intrinio. A call is first
+    made in cache only mode. If it completes, everything it needed was cached
+    and its value is returned. Otherwise an IntrinioResult showing the
+    last known value (or the placeholder) is returned at once, and the call
+    is handed to the recalc planner, which delivers its value to the result.
+    """
+    placeholder = "Loading..."
+    # (function name, args) -> IntrinioResult. A result is forgotten when no cell shows it.
+    results = CacheEngine.namespace("async_results", max_entries=10000, evictable=False)
+    lock = threading.Lock()
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def call(cls, name, func, args):
+        """
+        :param name: Calc function name
+        :param func: Function that computes the value
+        :param args: The Calc function arguments (hashable)
+        :return: The value or an IntrinioResult
+        """
+        key = (name, args)
+        try:
+            hash(key)
+        except TypeError:
+            return func()
+        IntrinioEngine.cache_only(True)
+        try:
+            value = func()
+        except CacheMiss as miss:
+            return cls._fetch(key, func, miss)
+        finally:
+            IntrinioEngine.cache_only(False)
+
+        # A cell that already shows a volatile result keeps it
+        found, result = cls.results.lookup(key)
+        if not found:
+            return value
+        result.set_value(value)
+        return result
+
+    @classmethod
+    def _fetch(cls, key, func, miss):
+        with cls.lock:
+            found, result = cls.results.lookup(key)
+            if not found:
+                result = IntrinioResult(key, cls.placeholder)
+                cls.results.put(key, result)
+            if result.pending:
+                return result
+            result.pending = True
+        logger.debug("Planning %s", key[0])
+        RecalcPlanner.add(result, func, miss)
+        return result
+
+    @classmethod
+    def release(cls, result):
+        """
+        Forget a result that no cell shows any more
+        :param result: IntrinioResult
+        :return: None
+        """
+        with cls.lock:
+            found, current = cls.results.lookup(result.key)
+            if found and current is result and result.is_unused():
+                cls.results.remove(result.key)
+
+
+def async_result(method):
+    """
+    Decorates an IntrinioImpl method that returns a single value. Calls are
+    recorded in the warm up manifest. When asyncresults is configured the
+    method is answered by AsyncResults.
+    :param method: The method
+    :return: The decorated method
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        WarmUpManifest.record(method.__name__, args)
+        if not QConfiguration.async_results:
+            return method(self, *args)
+        return AsyncResults.call(method.__name__, lambda: method(self, *args), args)
+    return wrapper
@@ -0,0 +1,212 @@
+#
+# intrinio_warmup - Warms the caches with the calls a workbook made last time
+# Copyright (C) 2017  Dave Hocker (email: qalydon17@gmail.com)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the LICENSE.md file for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program (the LICENSE.md file).  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import atexit
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from intrinio_app_logger import AppLogger
+from intrinio_lib import QConfiguration
+from intrinio_engine import IntrinioEngine
+from intrinio_disk_cache import DiskCache
+from intrinio_cache import DAY
+
+# Logger init
+the_app_logger = AppLogger("intrinio-extension")
+logger = the_app_logger.getAppLogger()
+
+
+class WarmUpManifest:
+    """
+    Records the (function, args) calls made for each workbook and saves them in the
+    disk cache every few minutes and at shutdown. The first time a workbook is seen
+    (when the extension loads or when one of its cells first calls it), the calls
+    saved for it last time are replayed on background threads, most recently used
+    first, while Calc is not waiting for Intrinio.
+    Add-in calls do not identify their document, so a call is attributed to the
+    document that is current when it is made.
+    """
+    namespace = "warmup_manifest"
+    version = 1
+    # Disk cache life of a manifest
+    manifest_ttl = 30 * DAY
+    max_entries = 5000
+    save_interval = 300
+    # Seconds the current document's URL is reused before it is looked up again
+    url_life = 1.0
+    # Replay threads. Data points replayed at the same time are batched.
+    replay_workers = 4
+    # Function that returns the URL of the current document
+    document_url = None
+    current = ("", 0.0)
+    impl = None
+    # Workbook URL -> {(function name, args) -> time last used}
+    manifests = {}
+    # Workbooks whose saved manifest has been loaded
+    loaded = set()
+    last_save = 0.0
+    started = False
+    lock = threading.Lock()
+
+    def __init__(self):
+        pass
+
+    @classmethod
+    def record(cls, name, args):
+        """
+        Record a Calc function call in the current workbook's manifest
+        :param name: IntrinioImpl method name
+        :param args: The call's arguments
+        :return: None
+        """
+        if not QConfiguration.warm_up:
+            return
+        workbook = cls.current_workbook()
+        now = time.time()
+        with cls.lock:
+            cls.manifests.setdefault(workbook, {})[(name, args)] = now
+            first = cls.started and workbook not in cls.loaded
+            if first:
+                cls.loaded.add(workbook)
+            due = now - cls.last_save >= cls.save_interval
+        if first:
+            cls._load(workbook)
+        if due:
+            cls.save()
+
+    @classmethod
+    def current_workbook(cls):
+        """
+        :return: The URL of the current document. Empty if it is unknown.
+        """
+        if cls.document_url is None:
+            return ""
+        now = time.time()
+        url, checked = cls.current
+        if now - checked < cls.url_life:
+            return url
+        url = cls.document_url()
+        cls.current = (url, now)
+        return url
+
+    @classmethod
+    def save(cls):
+        """
+        Save the most recently used calls of each workbook. Calls that have
+        not been used for manifest_ttl are dropped.
+        :return: None
+        """
+        with cls.lock:
+            cls.last_save = time.time()
+            oldest = cls.last_save - cls.manifest_ttl
+            saves = []
+            for workbook, entries in cls.manifests.items():
+                recent = sorted([entry for entry in entries.items() if entry[1] >= oldest],
+                                key=lambda entry: -entry[1])[:cls.max_entries]
+                if recent:
+                    saves.append((workbook, recent))
+        for workbook, recent in saves:
+            DiskCache.put(cls.namespace, cls.version, (workbook,),
+                          [[name, args, used] for (name, args), used in recent], cls.manifest_ttl)
+            logger.debug("Saved %d warm up entries for %s", len(recent), workbook or "workbook")
+
+    @classmethod
+    def start(cls, impl, document_url):
+        """
+        Start recording and replay the manifest of the current workbook in the
+        background. Only the first call does anything.
+        :param impl: The IntrinioImpl instance whose methods are replayed
+        :param document_url: Function that returns the URL of the current document
+        :return: None
+        """
+        with cls.lock:
+            if cls.started or not QConfiguration.warm_up:
+                return
+            cls.started = True
+            cls.impl = impl
+            cls.document_url = document_url
+            cls.current = ("", 0.0)
+            cls.last_save = time.time()
+        atexit.register(cls.save)
+
+        workbook = cls.current_workbook()
+        with cls.lock:
+            first = workbook not in cls.loaded
+            cls.loaded.add(workbook)
+        if first:
+            cls._load(workbook)
+
+    @classmethod
+    def _load(cls, workbook):
+        """
+        Load the saved manifest of a workbook and replay it in the background
+        :param workbook: Workbook URL
+        :return: None
+        """
+        found, saved = DiskCache.get(cls.namespace, cls.version, (workbook,))
+        if not found:
+            return
+        calls = [(name, _to_tuples(args)) for name, args, used in saved]
+        with cls.lock:
+            entries = cls.manifests.setdefault(workbook, {})
+            for (name, args), (_, _, used) in zip(calls, saved):
+                entries.setdefault((name, args), used)
+        logger.info("Warming up %d calls for %s", len(calls), workbook or "workbook")
+        threading.Thread(target=cls._replay, args=(cls.impl, calls), name="intrinio-warmup", daemon=True).start()
+
+    @classmethod
+    def _replay(cls, impl, calls):
+        with ThreadPoolExecutor(max_workers=cls.replay_workers, thread_name_prefix="intrinio-warmup") as executor:
+            for name, args in calls:
+                method = getattr(type(impl), name, None)
+                if method is not None:
+                    executor.submit(cls._replay_call, impl, getattr(method, "__wrapped__", method), args)
+        logger.info("Warm up finished")
+
+    @staticmethod
+    def _replay_call(impl, method, args):
+        IntrinioEngine.background(True)
+        try:
+            IntrinioEngine.wait_for_foreground()
+            method(impl, *args)
+        except Exception as ex:
+            logger.error("Warm up call %s failed: %s", method.__name__, str(ex))
+        finally:
+            IntrinioEngine.background(False)
+
+
+def recorded(method):
+    """
+    Decorates an IntrinioImpl method so that its calls are recorded in the warm up manifest
+    :param method: The method
+    :return: The decorated method
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        WarmUpManifest.record(method.__name__, args)
+        return method(self, *args)
+    return wrapper
+
+
+def _to_tuples(value):
+    """
+    Convert the JSON lists of a saved call's arguments back to the tuples Calc passes
+    """
+    if isinstance(value, list):
+        return tuple(_to_tuples(v) for v in value)
+    return value